@@ -6,7 +6,7 @@ from tools import p_shared as shared  # shared model info helpers
 from tools import p1_ifc_import as p1  # per-page helper
 from pathlib import Path
 from tools.pathhelper import ensure_data_dir, public_url
-import ifcopenshell as ifc
+from tools import cachehelper
 import time
 
 # ─────────────────────────────────────────────
@@ -32,6 +32,11 @@ def callback_upload():
         session["file_name"] = session["uploaded_file"].name
         session["is_file_uploaded"] = True
 
+        # Hash del contenuto: chiave della cache di estrazione (pagine 4 e 6)
+        upload_hash = cachehelper.content_hash(uploaded_data)
+        same_model = session.get("ifc_hash") == upload_hash and session.get("ifc_file") is not None
+        session["ifc_hash"] = upload_hash
+
         # Save everything under static/temp_file
         try:
             data_dir = ensure_data_dir()
@@ -39,21 +44,75 @@ def callback_upload():
             ext = Path(original_name).suffix or ".ifc"
             stored_path = data_dir / ("uploaded" + ext)
             with open(stored_path, "wb") as f:
-                f.write(uploaded_data)
+                # Senza BOM UTF-8: ifcopenshell non ne legge il header
+                f.write(p1.strip_utf8_bom(uploaded_data))
             session["temp_ifc_path"] = str(stored_path)
             session["viewer_src_rel"] = public_url(stored_path)
         except Exception as e:
             st.error(f"⚠️ Failed to persist IFC: {e}")
             return
 
-        # Load IFC file object into session
+        # Stesso file già aperto in questa sessione: nessun nuovo parsing
+        if same_model:
+            return
+
+        # Solo il HEADER STEP (millisecondi): metadati e schema subito disponibili
+        header = p1.read_ifc_header(uploaded_data)
+        session["ifc_header"] = header
+        if header.get("schema"):
+            session["ifc_schema"] = header["schema"]
+
+        # Parsing completo in background; main() lo attende dopo aver mostrato i metadati
+        session.pop("ifc_file", None)
         try:
-            ifc_file = ifc.open(session["temp_ifc_path"])
-            session["ifc_file"] = ifc_file
-            session["ifc_schema"] = ifc_file.schema
+            # Il parsing ancora in corso di un upload precedente della sessione viene scartato
+            session["ifc_loading"] = p1.open_ifc_async(session["temp_ifc_path"], previous=session.get("ifc_loading"))
         except Exception as e:
             st.error(f"⚠️ Failed to load IFC file: {e}")
-            # This basic syntax check already validates IFC structure
+
+# ─────────────────────────────────────────────
+# 🧾 Dettagli del file caricato
+# ─────────────────────────────────────────────
+
+REMOVE_KEYS = [
+    "array_buffer", "uploaded_file", "file_name", "ifc_schema", "ifc_header", "ifc_loading",
+    "is_file_uploaded", "temp_ifc_path", "ifc_file", "ifc_hash"
+]
+
+
+def draw_header_details(header):
+    # Metadati dal HEADER STEP (FILE_NAME / FILE_DESCRIPTION), disponibili prima del parsing completo
+    if not header:
+        return
+    rows = {
+        "Originating system": header.get("originating_system"),
+        "Preprocessor": header.get("preprocessor_version"),
+        "Timestamp": header.get("time_stamp"),
+        "Author": ", ".join(header.get("author") or []),
+        "Organization": ", ".join(header.get("organization") or []),
+        "View definition": header.get("view_definition"),
+    }
+    for label, value in rows.items():
+        if value:
+            st.write(f"{label}: {value}")
+
+
+def draw_upload_details():
+    with st.expander("Uploaded IFC details", expanded=True):
+        st.success("✅ File uploaded successfully.")
+        st.write(f"File name: {session.get('file_name', 'Unknown')}")
+        if session.get("ifc_schema"):
+            st.info(f"📐 IFC schema detected: {str(session.get('ifc_schema', 'Unknown'))}")
+        draw_header_details(session.get("ifc_header"))
+        if session.get("ifc_loading") is not None:
+            with st.spinner("🔃 Parsing IFC model..."):
+                error = p1.finish_ifc_open(session)
+            if error:
+                st.error(f"⚠️ Failed to load IFC file: {error}")
+        if st.button("🗑️ Remove IFC File"):
+            for key in REMOVE_KEYS:
+                session.pop(key, None)
+            st.warning("🗑️ IFC file removed from session.")
 
 # ─────────────────────────────────────────────
 # 🚀 Funzione principale Streamlit
@@ -71,33 +130,11 @@ def main():
 
     # On-page expander for status and actions (no sidebar)
     if session.get("is_file_uploaded") and session.get("temp_ifc_path"):
-        with st.expander("Uploaded IFC details", expanded=True):
-            st.success("✅ File uploaded successfully.")
-            st.write(f"File name: {session.get('file_name', 'Unknown')}")
-            if session.get("ifc_file"):
-                st.info(f"📐 IFC schema detected: {str(session.get('ifc_schema', 'Unknown'))}")
-            if st.button("🗑️ Remove IFC File"):
-                for key in [
-                    "array_buffer", "uploaded_file", "file_name", "ifc_schema",
-                    "is_file_uploaded", "temp_ifc_path", "ifc_file"
-                ]:
-                    session.pop(key, None)
-                st.warning("🗑️ IFC file removed from session.")
+        draw_upload_details()
     elif session.get("is_file_uploaded"):
         with st.spinner("🔃 Processing uploaded file..."):
             time.sleep(1)
-        with st.expander("Uploaded IFC details", expanded=True):
-            st.success("✅ File uploaded successfully.")
-            st.write(f"File name: {session.get('file_name', 'Unknown')}")
-            if session.get("ifc_file"):
-                st.info(f"📐 IFC schema detected: {str(session.get('ifc_schema', 'Unknown'))}")
-            if st.button("🗑️ Remove IFC File"):
-                for key in [
-                    "array_buffer", "uploaded_file", "file_name", "ifc_schema",
-                    "is_file_uploaded", "temp_ifc_path", "ifc_file"
-                ]:
-                    session.pop(key, None)
-                st.warning("🗑️ IFC file removed from session.")
+        draw_upload_details()
     else:
         st.info("⚠️ No IFC file uploaded yet.")
 
@@ -5,6 +5,7 @@ import streamlit as st
 from tools import p_shared as shared  # shared model info helpers
 from tools import p2_ids as p2  # per-page helper
 import json
+import shutil
 from tools.pathhelper import save_text, save_bytes
 import plotly.express as px
 from datetime import datetime
@@ -38,7 +39,7 @@ def _parse_validate_stdout_to_df(stdout: str) -> pd.DataFrame:
     def walk(obj):
         if isinstance(obj, dict):
             row = {}
-            for k in ("guid", "GlobalId", "globalId", "id"):
+            for k in ("guid", "GlobalId", "globalId", "global_id", "id"):
                 if k in obj and isinstance(obj[k], str):
                     row["ElementID"] = obj[k]
                     break
@@ -84,6 +85,16 @@ def _parse_validate_stdout_to_df(stdout: str) -> pd.DataFrame:
         return pd.DataFrame(data)
     return pd.DataFrame([data])
 
+
+def _official_result_df(stdout: str, slot: str) -> pd.DataFrame:
+    # Stesso output del validatore → stesso DataFrame fra i rerun: riepilogo e indice violazioni restano in cache
+    cached = session.get(slot)
+    if cached is not None and cached[0] == stdout:
+        return cached[1]
+    df = _parse_validate_stdout_to_df(stdout)
+    session[slot] = (stdout, df)
+    return df
+
 # ─────────────────────────────────────────────
 # ⚙️ Pagina IDS
 # ─────────────────────────────────────────────
@@ -242,7 +253,7 @@ with tab1:
 # Tab 2: IDS Validation Results — use IDS-Audit + official validate CLI
 # ─────────────────────────────────────────────
 with tab2:
-    st.markdown("This tab runs IDS validation on the loaded IFC model using the official validator. The generated IDS XML is first audited with IDS-Audit.")
+    st.markdown("This tab runs IDS validation on the loaded IFC model using the official validator or the built-in engine, which re-evaluates only the rules edited since the last run. The generated IDS XML is first audited with IDS-Audit.")
     if ifc_model and session.ids_rules:
         # Generate IDS XML from current rules
         ids_xml_str = p2.ids_rules_to_xml(session.ids_rules)
@@ -257,52 +268,86 @@ with tab2:
             with st.expander("Audit report"):
                 st.code(audit_report or "", language="json")
 
-        # Run official validation only if audit passed
-        if ok_audit:
-            res = p2.validate_ifc_with_ids_xml_official(ifc_model, ids_xml_bytes)
+        # Motore: validatore ufficiale (ifctester / CLI) oppure motore interno incrementale,
+        # che dopo una modifica alle regole rivaluta solo quelle aggiunte o cambiate
+        official_available = p2.IFCTESTER_AVAILABLE or shutil.which("validate") is not None
+        engines = ["Official (ifctester / validate CLI)", "Built-in (incremental)"]
+        engine = st.radio("Validation engine", engines, index=0 if official_available else 1,
+                          horizontal=True, key="ids_validation_engine")
+
+        df = None
+        # Run validation only if audit passed
+        if ok_audit and engine == engines[0]:
+            res = p2.validate_ifc_with_ids_xml_official(ifc_model, ids_xml_bytes, source_path=session.get("temp_ifc_path"))
             if res.get("ok") and res.get("stdout"):
-                df = _parse_validate_stdout_to_df(res["stdout"]) 
-                session.ids_last_validation_df = df
-                if not df.empty and ("Compliant" in df.columns):
-                    st.subheader("✅ IDS Validation Table (official)")
-                    st.dataframe(df, use_container_width=True)
-
-                    # Summary
-                    st.markdown("### Summary")
-                    if "IFCClass" in df.columns:
-                        for class_name, group in df.groupby("IFCClass"):
-                            total = len(group)
-                            passed = int(group.get("Compliant", pd.Series([False]*total)).sum()) if "Compliant" in group.columns else 0
-                            st.markdown(f"**{class_name}** — 🗹 {passed}/{total} passed the requirement.")
-
-                    if "Compliant" in df.columns:
-                        compliance_rate = df["Compliant"].mean() * 100
-                        st.metric("Compliance Rate", f"{compliance_rate:.1f}%")
-
-                        chart = df.groupby("IFCClass")["Compliant"].mean().reset_index() if "IFCClass" in df.columns else pd.DataFrame()
-                        if not chart.empty:
-                            chart["Compliant"] = chart["Compliant"] * 100
-                            fig = px.bar(
-                                chart, x="IFCClass", y="Compliant", color="Compliant",
-                                color_continuous_scale="RdYlGn", title="Compliance per IFC Class (%)"
-                            )
-                            st.plotly_chart(fig, use_container_width=True)
-
-                    # Save CSV
-                    if st.button("Save results CSV to temp_file", key="btn_save_ids_results_csv"):
-                        try:
-                            csv_bytes = df.to_csv(index=False).encode('utf-8')
-                            path, url = save_bytes("ids_validation_results.csv", csv_bytes)
-                            st.success(f"Saved in static/temp_file — {path.name}")
-                            st.markdown(f"[Click to download]({url})")
-                        except Exception as e:
-                            st.error(f"Unable to save: {e}")
+                df = _official_result_df(res["stdout"], "ids_official_result")
+                engine_label = "official"
             else:
-                st.error("Official validator failed. Ensure the 'validate' CLI is installed and on PATH.")
+                st.error("Official validator failed. Ensure ifctester or the 'validate' CLI is installed, or use the built-in engine.")
                 if res.get("error"):
                     st.code(res.get("error"), language="bash")
                 if res.get("stdout"):
                     st.code(res.get("stdout"), language="json")
+        elif ok_audit:
+            df, session.ids_validation_state = p2.revalidate_ids_rules(
+                ifc_model, session.ids_rules, session.get("ids_validation_state"), session.get("ifc_hash"))
+            stats = session.ids_validation_state["stats"]
+            st.caption(f"Built-in engine: {stats['evaluated']} rule(s) evaluated, "
+                       f"{stats['reused']} reused from the previous run, {stats['removed']} removed.")
+            engine_label = "built-in"
+
+        if df is not None:
+            session.ids_last_validation_df = df
+            if not df.empty and ("Compliant" in df.columns):
+                st.subheader(f"✅ IDS Validation Table ({engine_label})")
+                st.dataframe(df, use_container_width=True)
+
+                # Summary (una sola aggregazione per run, condivisa con la pagina BCF)
+                summary = p2.compliance_summary(df)
+                st.markdown("### Summary")
+                overall = p2.compliance_level(summary, "all").iloc[0]
+                st.metric("Compliance Rate", f"{overall['ComplianceRate']:.1f}%")
+                by_class = p2.compliance_level(summary, "class")
+                if "IFCClass" in df.columns:
+                    st.dataframe(by_class, use_container_width=True, hide_index=True)
+                    with st.expander("Per property set / property"):
+                        st.dataframe(p2.compliance_level(summary, "property"), use_container_width=True, hide_index=True)
+
+                    fig = px.bar(
+                        by_class, x="IFCClass", y="ComplianceRate", color="ComplianceRate",
+                        color_continuous_scale="RdYlGn", title="Compliance per IFC Class (%)"
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+                st.download_button("💾 Download summary CSV", summary.to_csv(index=False),
+                                   "ids_compliance_summary.csv", "text/csv", key="btn_dl_ids_summary")
+
+                # Drill-down sulle violazioni: indice costruito una volta per run
+                violations = p2.violation_index(df, ifc_model)
+                with st.expander(f"🔎 Failures drill-down ({len(violations['rows'])} failing checks)"):
+                    drill_by = st.radio("Drill down by", ["element", "requirement", "storey"], horizontal=True,
+                                        key="ids_drill_by")
+                    drill_keys = list(violations[f"by_{drill_by}"])
+                    if drill_keys:
+                        drill_key = st.selectbox("Select", drill_keys, key="ids_drill_key",
+                                                 format_func=lambda k: " / ".join(k) if isinstance(k, tuple) else str(k))
+                        st.dataframe(p2.failing_rows(df, violations, drill_by, drill_key),
+                                     use_container_width=True, hide_index=True)
+                    min_failures = st.number_input("Elements failing more than N requirements", min_value=0, value=1,
+                                                   step=1, key="ids_drill_min_failures")
+                    worst = p2.elements_failing_more_than(violations, int(min_failures))
+                    st.caption(f"{len(worst)} element(s)")
+                    st.dataframe(worst.rename("FailedRequirements").rename_axis("ElementID").reset_index(),
+                                 use_container_width=True, hide_index=True)
+
+                # Save CSV
+                if st.button("Save results CSV to temp_file", key="btn_save_ids_results_csv"):
+                    try:
+                        csv_bytes = df.to_csv(index=False).encode('utf-8')
+                        path, url = save_bytes("ids_validation_results.csv", csv_bytes)
+                        st.success(f"Saved in static/temp_file — {path.name}")
+                        st.markdown(f"[Click to download]({url})")
+                    except Exception as e:
+                        st.error(f"Unable to save: {e}")
     else:
         st.info("👈 Define at least one IDS rule and load an IFC file in Home.")
 
@@ -351,7 +396,7 @@ with tab3:
         # Build one specification per IDS rule
         for idx, rule in enumerate(session.ids_rules):
             spec = ET.SubElement(specs, f"{{{ns['ids']}}}specification", {
-                'ifcVersion': 'IFC4X3',
+                'ifcVersion': 'IFC4X3_ADD2',
                 'name': f"Requirement for {rule.get('ifc_class', '')}",
                 'identifier': f"S{idx+1}"
             })
@@ -446,76 +491,18 @@ with tab_xml:
     test_ids = None
     if uploaded_ids is not None:
         try:
-            # Try as XML first
+            # Try as XML first: lettura in streaming, una regola per specification
             content = uploaded_ids.read()
-            parsed_xml = None
             try:
-                import xml.etree.ElementTree as ET
-                parsed_xml = ET.fromstring(content)
+                test_ids = p2.parse_ids_xml(content)
+                is_xml = True
             except Exception:
-                parsed_xml = None
+                test_ids = None
+                is_xml = False
 
-            if parsed_xml is not None:
+            if is_xml:
                 # We have IDS XML: keep bytes and show quick summary
                 ids_xml_bytes = content
-                ns = {
-                    'ids': 'http://standards.buildingsmart.org/IDS',
-                    'xs': 'http://www.w3.org/2001/XMLSchema'
-                }
-                test_ids = []
-                specs = parsed_xml.findall('.//{http://standards.buildingsmart.org/IDS}specification') or parsed_xml.findall('.//specification')
-
-                for spec in specs:
-                    ifc_class = ''
-                    appl = spec.find('.//{http://standards.buildingsmart.org/IDS}applicability') or spec.find('.//applicability')
-                    if appl is not None:
-                        sv = appl.find('.//{http://standards.buildingsmart.org/IDS}simpleValue') or appl.find('.//simpleValue')
-                        if sv is not None and sv.text:
-                            ifc_class = sv.text.strip()
-                    if not ifc_class:
-                        ifc_class = spec.get('name', '').replace('Requirement for ', '')
-
-                    props = []
-                    for prop_el in spec.findall('.//{http://standards.buildingsmart.org/IDS}property') or spec.findall('.//property'):
-                        pname = ''
-                        pset = ''
-                        mandatory = False
-                        allowed_vals = None
-
-                        card = prop_el.get('cardinality')
-                        if card and card.lower().startswith('required'):
-                            mandatory = True
-
-                        pset_el = prop_el.find('.//{http://standards.buildingsmart.org/IDS}propertySet/{http://standards.buildingsmart.org/IDS}simpleValue') or prop_el.find('.//propertySet/simpleValue')
-                        if pset_el is not None and pset_el.text:
-                            pset = pset_el.text.strip()
-
-                        base_el = prop_el.find('.//{http://standards.buildingsmart.org/IDS}baseName/{http://standards.buildingsmart.org/IDS}simpleValue') or prop_el.find('.//baseName/simpleValue')
-                        if base_el is not None and base_el.text:
-                            pname = base_el.text.strip()
-
-                        allowed = []
-                        val_block = prop_el.find('.//{http://standards.buildingsmart.org/IDS}value') or prop_el.find('.//value')
-                        if val_block is not None:
-                            restr = val_block.find('.//{http://www.w3.org/2001/XMLSchema}restriction') or val_block.find('.//restriction')
-                            if restr is not None:
-                                enums = restr.findall('.//{http://www.w3.org/2001/XMLSchema}enumeration') or restr.findall('.//enumeration')
-                                for e in enums:
-                                    v = e.get('value') or (e.text if e.text else None)
-                                    if v:
-                                        allowed.append(v)
-                        if allowed:
-                            allowed_vals = allowed
-
-                        props.append({
-                            'property_set': pset,
-                            'property_name': pname,
-                            'mandatory': mandatory,
-                            'allowed_values': allowed_vals
-                        })
-
-                    test_ids.append({'ifc_class': ifc_class, 'properties': props})
-
                 if test_ids:
                     n_specs = len(test_ids)
                     n_props = sum(len(r.get('properties', [])) for r in test_ids)
@@ -590,9 +577,9 @@ with tab_xml:
 
     # Run validation and show outputs via official CLI
     if ifc_model and ids_xml_bytes:
-        res_test = p2.validate_ifc_with_ids_xml_official(ifc_model, ids_xml_bytes)
+        res_test = p2.validate_ifc_with_ids_xml_official(ifc_model, ids_xml_bytes, source_path=session.get("temp_ifc_path"))
         if res_test.get("ok") and res_test.get("stdout"):
-            df_test = _parse_validate_stdout_to_df(res_test["stdout"]) 
+            df_test = _official_result_df(res_test["stdout"], "ids_official_test_result")
             session.ids_last_validation_df = df_test
 
             try:
@@ -606,26 +593,22 @@ with tab_xml:
             st.subheader("✅ IDS test results (official)")
             st.dataframe(df_view, use_container_width=True)
 
-            total = len(df_view)
-            if total > 0 and "Compliant" in df_view.columns:
-                fails = int((~df_view["Compliant"]).sum())
-                passes = total - fails
+            summary_test = p2.compliance_summary(df_test)
+            if not summary_test.empty:
+                overall_test = p2.compliance_level(summary_test, "all").iloc[0]
                 st.markdown(
-                    f"- Total checks: **{total}**\n"
-                    f"- Compliant: **{passes}**\n"
-                    f"- Non-compliant: **{fails}**"
+                    f"- Total checks: **{overall_test['Total']}**\n"
+                    f"- Compliant: **{overall_test['Passed']}**\n"
+                    f"- Non-compliant: **{overall_test['Failed']}**"
                 )
-                compliance_rate_test = df_view["Compliant"].mean() * 100
-                st.metric("Compliance rate", f"{compliance_rate_test:.1f}%")
+                st.metric("Compliance rate", f"{overall_test['ComplianceRate']:.1f}%")
 
                 if "IFCClass" in df_view.columns:
-                    chart_test = df_view.groupby("IFCClass")["Compliant"].mean().reset_index()
-                    chart_test["Compliant"] = chart_test["Compliant"] * 100
                     fig_test = px.bar(
-                        chart_test,
+                        p2.compliance_level(summary_test, "class"),
                         x="IFCClass",
-                        y="Compliant",
-                        color="Compliant",
+                        y="ComplianceRate",
+                        color="ComplianceRate",
                         color_continuous_scale="RdYlGn",
                         title="Compliance by IFC class (%)"
                     )
@@ -641,7 +624,7 @@ with tab_xml:
                 except Exception as e:
                     st.error(f"Unable to save: {e}")
         else:
-            st.error("Official validator failed. Ensure the 'validate' CLI is installed and on PATH.")
+            st.error("Official validator failed. Ensure ifctester or the 'validate' CLI is installed.")
             if res_test.get("error"):
                 st.code(res_test.get("error"), language="bash")
             if res_test.get("stdout"):
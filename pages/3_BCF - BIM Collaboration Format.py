@@ -3,6 +3,7 @@
 # ─────────────────────────────────────────────
 import streamlit as st
 from tools import p3_bcf as p3  # per-page helper
+from tools import p2_ids as p2  # IDS results summary
 from tools import p_shared as shared  # shared model info helpers
 
 # ─────────────────────────────────────────────
@@ -61,6 +62,23 @@ if "ids_last_validation_df" not in session or session.ids_last_validation_df is
     st.info("No validation results available. Run IDS validation or test in the IDS page first.")
 else:
     df_export = session.ids_last_validation_df
+    # Filtro delle issue dall'indice delle violazioni (memoizzato per run, senza rifiltrare i risultati)
+    violations = p2.violation_index(df_export, session.get("ifc_file"))
+    issue_filter = st.selectbox("Issues to include",
+                                ["All rows", "Failures only", "Failures by element", "Failures by requirement",
+                                 "Failures by storey", "Elements failing more than N requirements"])
+    if issue_filter == "Failures only":
+        df_export = p2.failing_rows(df_export, violations)
+    elif issue_filter.startswith("Failures by "):
+        by = issue_filter.rsplit(" ", 1)[-1]
+        keys = list(violations[f"by_{by}"])
+        key = st.selectbox(f"Select {by}", keys, format_func=lambda k: " / ".join(k) if isinstance(k, tuple) else str(k)) if keys else None
+        df_export = p2.failing_rows(df_export, violations, by, key) if key is not None else df_export.iloc[0:0]
+    elif issue_filter.startswith("Elements failing"):
+        n = st.number_input("N", min_value=0, value=1, step=1)
+        worst = p2.elements_failing_more_than(violations, int(n))
+        positions = [p for e in worst.index for p in violations["by_element"][e]]
+        df_export = df_export.iloc[sorted(positions)]
     df_display = df_export.reset_index(drop=True)
     df_display["_row_id"] = df_display.index.astype(str)
     options = df_display["_row_id"].tolist()
@@ -97,17 +115,9 @@ else:
 
     # Render preview only when requested
     if session.report_preview:
-        # Build summary per IFCClass
-        try:
-            summary = selected_df.groupby("IFCClass").agg(
-                Total=("ElementID", "count"),
-                Passed=("Compliant", lambda s: int(s.sum())),
-                Failed=("Compliant", lambda s: int((~s.astype(bool)).sum()))
-            ).reset_index()
-        except Exception:
-            # fallback empty summary
-            import pandas as pd
-            summary = pd.DataFrame(columns=["IFCClass", "Total", "Passed", "Failed"]) 
+        # Riepilogo per IFCClass: con tutte le righe selezionate si riusa quello memoizzato della pagina IDS
+        summary_source = df_export if len(selected_df) == len(df_export) else selected_df
+        summary = p2.compliance_level(p2.compliance_summary(summary_source), "class")
 
         st.markdown(f"**{report_title}** — Author: {report_author} — Project: {report_project} — Date: {report_date}")
         if include_summary:
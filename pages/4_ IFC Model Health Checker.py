@@ -5,8 +5,9 @@ import streamlit as st
 from tools import p4_health_checker as p4  # per-page helper
 from tools import p_shared as shared  # shared model info helpers
 from tools.ifc_432_dictionary import IFC_STRUCTURAL_DICTIONARY_4x3
+from tools import cachehelper, changetracker
+from tools.pathhelper import save_bytes
 import plotly.express as px
-import ifcopenshell as ifc
 
 # ─────────────────────────────────────────────
 # 🧠 Session alias
@@ -29,6 +30,18 @@ def initialize_session_state():
     session["Graphs"] = {}
     session['summary_stats'] = None
 
+# =============================================================================
+# 🔢 Conteggi per classe (strutturali dal dizionario IFC4x3 + tutte le entità)
+# =============================================================================
+def compute_entity_counts(model):
+    # Un solo censimento del modello (memoizzato): classi del dizionario IFC_STRUCTURAL_DICTIONARY_4x3
+    # contate con i sottotipi come by_type, conteggi esatti per tutte le entità
+    census = shared.get_entity_census(model)
+    structural_counts = {cls: shared.census_count(census, cls) for cls in IFC_STRUCTURAL_DICTIONARY_4x3.keys()}
+    all_entity_counts = dict(census["counts"])
+
+    return {"structural_counts": structural_counts, "all_entity_counts": all_entity_counts}
+
 # =============================================================================
 # 📊 Caricamento dati e calcolo di TUTTE le statistiche
 # =============================================================================
@@ -40,24 +53,15 @@ def load_data():
         if "IFC4X3" not in schema_id:
             st.warning(f"Model schema detected: {schema_id}. This analyzer is designed for IFC4X3 and will use the IFC4x3 dictionary.")
 
-        # Use keys from IFC_STRUCTURAL_DICTIONARY_4x3 as target classes
-        target_classes = list(IFC_STRUCTURAL_DICTIONARY_4x3.keys())
-
-        structural_counts = {}
-        for cls in target_classes:
-            try:
-                structural_counts[cls] = len(session.ifc_file.by_type(cls))
-            except Exception:
-                structural_counts[cls] = 0
+        # Statistiche per classe in cache per hash del file (un solo calcolo per file), finché il modello non è modificato
+        cache_key = session.get("ifc_hash") if not changetracker.is_dirty(session.ifc_file) else None
+        counts = cachehelper.get_or_build_json(cache_key, "entity_counts", lambda: compute_entity_counts(session.ifc_file))
+        structural_counts = dict(counts.get("structural_counts", {}))
+        all_entity_counts = dict(counts.get("all_entity_counts", {}))
         structural_counts = {k: v for k, v in structural_counts.items() if v > 0}
         structural_sorted = sorted(structural_counts.items(), key=lambda item: item[1], reverse=True)
 
         # --- PART 2: Dati per il Grafico di Destra (Tutte le Entità) ---
-        all_entity_counts = {}
-        for entity in session.ifc_file:
-            class_name = entity.is_a()
-            all_entity_counts[class_name] = all_entity_counts.get(class_name, 0) + 1
-
         all_entity_sorted = sorted(all_entity_counts.items(), key=lambda item: item[1], reverse=True)
 
         # ❗ CORREZIONE: Salva TUTTE le statistiche necessarie per evitare il KeyError
@@ -92,6 +96,13 @@ def load_data():
 
         session["Graphs"] = {"objects_graph": fig1, "high_frquency_graph": fig2}
         session["isHealthDataLoaded"] = True
+        session["healthDataKey"] = health_data_key()
+
+
+def health_data_key():
+    # Modello e revisione (changetracker) da cui sono stati calcolati i grafici
+    model = session.get("ifc_file")
+    return (id(model), changetracker.get_revision(model)) if model is not None else None
 
 # =============================================================================
 # 📈 Visualizzazione del riepilogo unificato
@@ -138,54 +149,38 @@ def draw_content():
     else:
         st.warning("No structural elements were found to generate an analysis.")
 
+    # Conteggi con i sottotipi dall'albero dello schema: somma dei conteggi foglia, nessuna query sul modello
+    if "ifc_file" in session:
+        census = shared.get_entity_census(session.ifc_file)
+        schema_classes = sorted(shared.schema_subtype_tree(census["schema"]))
+        if schema_classes:
+            with st.expander("🌳 Class hierarchy counts (including subtypes)"):
+                default = "IfcProduct" if "IfcProduct" in schema_classes else schema_classes[0]
+                parent = st.selectbox("IFC class", schema_classes, index=schema_classes.index(default), key="health_rollup_class")
+                st.metric(f"{parent} (including subtypes)", shared.census_count(census, parent))
+                leaves = shared.census_leaf_counts(census, parent)
+                if leaves:
+                    st.dataframe([{"Class": k, "Count": v} for k, v in leaves.items()], use_container_width=True, hide_index=True)
+
 # =============================================================================
 # 🧠 Debug: Inizializzazione struttura per proprietà BIM
 # =============================================================================
 def initialise_debug_props(force=False):
     default_props = {
         "step_id": 0, "number_of_polygons": 0, "percentile_of_polygons": 0,
-        "active_step_id": 0, "step_id_breadcrumb": [], "attributes": [],
-        "inverse_attributes": [], "inverse_references": [], "express_file": None,
+        "active_step_id": 0, "step_id_breadcrumb": [], "views": {}, "error": None, "express_file": None,
     }
-    if "BIMDebugProperties" not in session or force:
+    # Stesso stato del pannello di debug della pagina 8 (viste visitate in "views")
+    if "BIMDebugProperties" not in session or force or "views" not in session["BIMDebugProperties"]:
         session["BIMDebugProperties"] = default_props.copy()
 
 # =============================================================================
 # 🔍 Estrazione dati oggetto da ID 
 # =============================================================================
 def get_object_data(fromId=None):
-    def add_attribute(prop_list, key, value):
-        if isinstance(value, tuple):
-            if len(value) < 10:
-                for i, item in enumerate(value):
-                    add_attribute(prop_list, f"{key}[{i}]", item)
-                return
-            else:
-                key = f"{key}({len(value)})"
-        prop = {
-            "name": key,
-            "string_value": str(value),
-            "int_value": int(value.id()) if isinstance(value, ifc.entity_instance) else None,
-        }
-        prop_list.append(prop)
-
-    initialise_debug_props(force=True)
-    step_id = fromId or int(session.get("object_id", 0))
-    debug_props = session["BIMDebugProperties"]
-    debug_props["active_step_id"] = step_id
-    debug_props["step_id_breadcrumb"].append({"name": str(step_id)})
-    element = session.ifc_file.by_id(step_id)
-    debug_props["attributes"] = []
-    debug_props["inverse_attributes"] = []
-    debug_props["inverse_references"] = []
-    for key, value in element.get_info().items():
-        add_attribute(debug_props["attributes"], key, value)
-    for key in dir(element):
-        if (not key[0].isalpha() or key[0] != key[0].upper() or key in element.get_info() or not getattr(element, key)):
-            continue
-        add_attribute(debug_props["inverse_attributes"], key, getattr(element, key))
-    for inverse in session.ifc_file.get_inverse(element):
-        debug_props["inverse_references"].append({"string_value": str(inverse), "int_value": inverse.id()})
+    # Solo classe e conteggi; attributi e riferimenti inversi sono letti a pagine da shared.inspector_page
+    initialise_debug_props()
+    return shared.inspector_visit(session["BIMDebugProperties"], session.ifc_file, fromId or session.get("object_id", 0))
 
 # =============================================================================
 # 🚀 Esecuzione dell'app Streamlit
@@ -204,7 +199,7 @@ def execute():
     if "isHealthDataLoaded" not in session:
         initialize_session_state()
 
-    tab1, tab2 = st.tabs(["📈 Charts", "✅ IFC Validation"])
+    tab1, tab2, tab3 = st.tabs(["📈 Charts", "✅ IFC Validation", "🧬 Data Richness"])
     # ============================================
     # TAB 1: Charts
     # ============================================
@@ -223,7 +218,9 @@ def execute():
                 load_data()
 
         # Logica per caricamento e visualizzazione
-        if "ifc_file" in session and not session.get("isHealthDataLoaded"):
+        # Ricarica anche se il modello è cambiato o è stato modificato dopo il calcolo dei grafici
+        if "ifc_file" in session and (not session.get("isHealthDataLoaded")
+                                      or session.get("healthDataKey") != health_data_key()):
             session["color1"] = color1
             session["color2"] = color2
             load_data()
@@ -249,62 +246,138 @@ def execute():
         """)
         
         if "ifc_file" in session:
-            if st.button("🔍 Run Validation Checks", type="primary"):
-                with st.spinner("Running validation checks..."):
-                    results = p4.run_health_checks(session["ifc_file"])
+            col_run, col_invalidate = st.columns([1, 1])
+            run_checks = col_run.button("🔍 Run Validation Checks", type="primary")
+            # Risultati in cache per (hash del file, versione validatori, rule types): rimuoverli forza una nuova esecuzione
+            if col_invalidate.button("🗑️ Invalidate cached results"):
+                removed = p4.invalidate_health_checks(session.get("ifc_hash"))
+                st.info(f"Removed {removed} cached validation result(s) for this model.")
+            if run_checks:
+                with st.status("Running validation checks...", expanded=True) as status:
+                    # Risultati parziali: una riga per controllo appena termina
+                    def show_partial(check, result):
+                        icon = "✅" if result.get("ok") else "❌"
+                        status.write(f"{icon} {p4.check_label(check)} — {result.get('seconds', 0):.1f}s")
+
+                    results = p4.run_health_checks(session["ifc_file"], source_path=session.get("temp_ifc_path"),
+                                                   on_result=show_partial, content_hash=session.get("ifc_hash"))
+                    seconds = results.get("overall", {}).get("seconds")
+                    status.update(label=f"Validation checks completed in {seconds:.1f}s" if seconds is not None
+                                  else "Validation checks completed", state="complete", expanded=False)
+
+                if "error" in results:
+                    st.error(f"❌ {results['error']}")
+                elif results:
+                    overall = results.get("overall", {})
+                    if results.get("cached"):
+                        st.info(f"♻️ Results loaded from cache (validated {results.get('validated_at', 'earlier')}). "
+                                "Use 'Invalidate cached results' to run the checks again.")
+                    
+                    # Overall status
+                    if overall.get("ok"):
+                        st.success(f"✅ {overall.get('message', 'All validations passed')}")
+                    else:
+                        st.error(f"❌ {overall.get('message', 'Validation found issues')}")
                     
-                    if "error" in results:
-                        st.error(f"❌ {results['error']}")
-                    elif results:
-                        overall = results.get("overall", {})
-                        
-                        # Overall status
-                        if overall.get("ok"):
-                            st.success(f"✅ {overall.get('message', 'All validations passed')}")
-                        else:
-                            st.error(f"❌ {overall.get('message', 'Validation found issues')}")
-                        
-                        # Detailed results
-                        st.markdown("#### Detailed Results")
-                        
-                        # Syntax validation
-                        syntax = results.get("syntax", {})
-                        if syntax.get("ok"):
-                            st.success(f"✅ Syntax Check: Passed")
-                        else:
-                            st.error(f"❌ Syntax Check: Failed")
-                            with st.expander("Syntax Errors"):
-                                for err in syntax.get("errors", []):
-                                    st.code(err)
-                        
-                        # Schema validation
-                        schema = results.get("schema", {})
-                        if schema.get("ok"):
-                            st.success(f"✅ Schema Check: Passed")
-                        else:
-                            st.error(f"❌ Schema Check: Failed")
-                            with st.expander("Schema Errors"):
-                                for err in schema.get("errors", []):
-                                    st.code(err)
-                        
-                        # Gherkin rules
-                        gherkin = results.get("gherkin", {})
-                        if gherkin.get("ok"):
-                            st.success(f"✅ Gherkin Rules Check: Passed")
-                        else:
-                            st.error(f"❌ Gherkin Rules Check: Failed")
-                            with st.expander("Gherkin Rule Errors"):
-                                for err in gherkin.get("errors", []):
-                                    st.code(err)
-                        
-                        # Download results
-                        json_bytes = p4.build_health_report(results)
-                        st.download_button(
-                            "💾 Download Validation Report (JSON)",
-                            json_bytes,
-                            "ifc_validation_report.json",
-                            "application/json"
-                        )
+                    # Detailed results
+                    st.markdown("#### Detailed Results")
+                    
+                    # Syntax validation
+                    syntax = results.get("syntax", {})
+                    if syntax.get("ok"):
+                        st.success(f"✅ Syntax Check: Passed")
+                    else:
+                        st.error(f"❌ Syntax Check: Failed")
+                        with st.expander("Syntax Errors"):
+                            for err in syntax.get("errors", []):
+                                st.code(err)
+                    
+                    # Schema validation
+                    schema = results.get("schema", {})
+                    if schema.get("ok"):
+                        st.success(f"✅ Schema Check: Passed")
+                    else:
+                        st.error(f"❌ Schema Check: Failed")
+                        with st.expander("Schema Errors"):
+                            for err in schema.get("errors", []):
+                                st.code(err)
+                    
+                    # Gherkin rules
+                    gherkin = results.get("gherkin", {})
+                    if gherkin.get("ok"):
+                        st.success(f"✅ Gherkin Rules Check: Passed")
+                    else:
+                        st.error(f"❌ Gherkin Rules Check: Failed")
+                        with st.expander("Gherkin Rule Errors"):
+                            for err in gherkin.get("errors", []):
+                                st.code(err)
+                    
+                    # Tempo di ciascun controllo (eseguiti in parallelo)
+                    timings = results.get("timings") or {}
+                    if timings:
+                        with st.expander("⏱️ Check timings"):
+                            st.dataframe(
+                                [{"Check": p4.check_label(k), "Seconds": v} for k, v in timings.items()],
+                                hide_index=True
+                            )
+
+                    # Download results
+                    json_bytes = p4.build_health_report(results)
+                    st.download_button(
+                        "💾 Download Validation Report (JSON)",
+                        json_bytes,
+                        "ifc_validation_report.json",
+                        "application/json"
+                    )
+        else:
+            st.info("📂 To begin, load an IFC file from the Home page.")
+
+    # ============================================
+    # TAB 3: Data Richness (per classe e per piano)
+    # ============================================
+    with tab3:
+        st.markdown("""
+        Data richness of the structural classes in the IFC4x3 dictionary, per class and per storey:
+        - **Pset coverage**: elements with at least one standard property set for their class
+        - **Filled ratio**: properties with a value over all properties found
+        - **Qto coverage**: elements with at least one quantity set
+        - **Orphans**: products not placed in the spatial structure
+        """)
+        if "ifc_file" in session:
+            # Un passaggio sull'indice relazioni; in cache per hash del file finché il modello non è modificato,
+            # e in sessione per (modello, revisione): un modello modificato non viene ricalcolato ad ogni rerun
+            model = session["ifc_file"]
+            richness_key = (id(model), changetracker.get_revision(model), session.get("ifc_hash"))
+            if session.get("RichnessMetricsKey") != richness_key:
+                session["RichnessMetrics"] = p4.get_richness_metrics(model, session.get("ifc_hash"))
+                session["RichnessMetricsKey"] = richness_key
+            metrics = session["RichnessMetrics"]
+            if metrics.empty:
+                st.warning("No elements of the dictionary classes were found.")
+            else:
+                overall = metrics[metrics["GroupBy"] == "Model"].iloc[0]
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("Pset coverage", f"{overall['PsetCoverage']:.1%}")
+                c2.metric("Filled properties", f"{overall['FilledRatio']:.1%}")
+                c3.metric("Qto coverage", f"{overall['QtoCoverage']:.1%}")
+                c4.metric("Orphan elements", int(overall["Orphans"]))
+
+                group_by = st.radio("Group by", ["Class", "Storey"], horizontal=True, key="richness_group_by")
+                table = metrics[metrics["GroupBy"] == group_by].drop(columns=["GroupBy"]).rename(columns={"Group": group_by})
+                st.dataframe(table, use_container_width=True, hide_index=True)
+                fig = px.bar(table, x=group_by, y=["PsetCoverage", "FilledRatio", "QtoCoverage"], barmode="group",
+                             title=f"Data richness per {group_by.lower()}", labels={"value": "Ratio", "variable": "Metric"})
+                st.plotly_chart(fig, use_container_width=True)
+
+                csv_bytes = metrics.to_csv(index=False).encode("utf-8")
+                st.download_button("💾 Download metrics (CSV)", csv_bytes, "ifc_data_richness.csv", "text/csv")
+                if st.button("Save metrics CSV to temp_file", key="btn_save_richness_csv"):
+                    try:
+                        path, url = save_bytes("ifc_data_richness.csv", csv_bytes)
+                        st.success(f"Saved in static/temp_file — {path.name}")
+                        st.markdown(f"[Click to download]({url})")
+                    except Exception as e:
+                        st.error(f"Unable to save: {e}")
         else:
             st.info("📂 To begin, load an IFC file from the Home page.")
 
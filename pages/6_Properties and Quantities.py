@@ -7,7 +7,9 @@ from tools import p6_prop_qtt as p6
 import pandas as pd
 import plotly.express as px
 from tools import pandashelper
-from tools.pathhelper import save_text
+from tools import cachehelper
+from tools import changetracker
+from tools.pathhelper import save_text, ensure_data_dir, public_url, ensure_session_id
 
 # ─────────────────────────────────────────────
 # 🧠 Session alias
@@ -27,6 +29,7 @@ session = st.session_state
 
 def initialize_session_state():
     session.setdefault("FullDataFrame", None)
+    session.setdefault("QuantitiesFrame", None)
     session.setdefault("Classes", [])
     session.setdefault("IsDataFrameLoaded", False)
 
@@ -40,16 +43,45 @@ def load_data():
         return pandashelper.create_empty_dataframe()
 
     session["Classes"] = []
+    model = session.get("ifc_file")
+    # Chiave cache: hash del file caricato (None = nessuna cache, estrazione diretta).
+    # Un modello già modificato nell'app (4D/5D) non corrisponde più al file: niente cache.
+    cache_key = session.get("ifc_hash") if not changetracker.is_dirty(model) else None
 
     # Unified long-form dataframe for Tab 1 (entities + Psets + Qtos + attributes)
     try:
-        full_df = p6.get_ifc_full_dataframe(session.get("ifc_file"))
+        full_df = cachehelper.get_or_build_frame(cache_key, "full", lambda: p6.get_ifc_full_dataframe(model))
     except Exception:
         full_df = pd.DataFrame()
     session["FullDataFrame"] = full_df
+    session["FullDataFrameMemory"] = None
 
+    # Quantities (Tab 3)
+    try:
+        qto_df = cachehelper.get_or_build_frame(cache_key, "qto", lambda: p6.get_ifc_quantities(model))
+    except Exception:
+        qto_df = pd.DataFrame()
+    session["QuantitiesFrame"] = qto_df
+
+    session["DataFrameHash"] = session.get("ifc_hash")
+    session["DataFrameRevision"] = changetracker.get_revision(model)
     session["IsDataFrameLoaded"] = True
 
+def patch_data():
+    """Aggiorna solo le righe delle entità create/modificate/rimosse dall'app dopo l'ultimo caricamento."""
+    model = session.get("ifc_file")
+    revision = changetracker.get_revision(model)
+    if session.get("DataFrameRevision", 0) == revision:
+        return
+    changes = changetracker.changes_since(model, session.get("DataFrameRevision", 0))
+    if changes is None:
+        load_data()
+        return
+    session["FullDataFrame"] = p6.patch_full_dataframe(model, session.get("FullDataFrame"), changes)
+    session["QuantitiesFrame"] = p6.patch_quantities(model, session.get("QuantitiesFrame"), changes)
+    session["FullDataFrameMemory"] = None
+    session["DataFrameRevision"] = revision
+
 # ----------------------------------------------------
 # Funzioni di download del DataFrame
 # ----------------------------------------------------
@@ -70,6 +102,38 @@ def download_excel():
     pandashelper.download_excel(session.get('file_name'), session.get('QuantitiesFrame'))
 
 
+def columnar_export():
+    """Parquet/Feather export of FullDataFrame or QuantitiesFrame, written to disk in batches."""
+    frames = {"Full dataframe": ("FullDataFrame", "full_dataframe"), "Quantities": ("QuantitiesFrame", "quantities")}
+    col1, col2 = st.columns(2)
+    with col1:
+        frame_label = st.selectbox("Dataframe", list(frames), key="columnar_frame")
+    with col2:
+        fmt = st.selectbox("Format", list(p6.COLUMNAR_FORMATS), key="columnar_format")
+    session_key, base_name = frames[frame_label]
+    df = session.get(session_key)
+    if df is None or df.empty:
+        st.info("No data available for this dataframe.")
+        return
+
+    suffix, mime = p6.COLUMNAR_FORMATS[fmt]
+    # Il file resta su disco: la stessa esportazione non viene riscritta ad ogni rerun
+    export_id = (session.get("DataFrameHash"), session.get("DataFrameRevision"), session_key, fmt)
+    # Un file per sessione: sessioni diverse (anche sullo stesso modello) non si sovrascrivono l'export
+    path = ensure_data_dir() / f"{base_name}_{ensure_session_id(session)}{suffix}"
+    if st.button(f"Prepare {fmt.capitalize()}", key="btn_columnar_export"):
+        try:
+            with st.spinner(f"Writing {fmt}..."):
+                p6.write_columnar(df, path, fmt=fmt)
+            session["ColumnarExport"] = export_id
+        except Exception as e:
+            st.error(f"Unable to export: {e}")
+    if session.get("ColumnarExport") == export_id and path.exists():
+        with open(path, "rb") as fh:
+            st.download_button(f"Download {fmt.capitalize()}", fh, f"{base_name}{suffix}", mime, key="btn_columnar_download")
+        st.markdown(f"[Direct link]({public_url(path)})")
+
+
 # ----------------------------------------------------
 # Esecuzione principale dell’app Streamlit
 # ----------------------------------------------------
@@ -86,8 +150,13 @@ def execute():
     # Inizializzazione stato
     if "IsDataFrameLoaded" not in session:
         initialize_session_state()
+    # Nuovo file caricato: ricarica i DataFrame (eventualmente dalla cache)
+    if session.get("DataFrameHash") != session.get("ifc_hash"):
+        session["IsDataFrameLoaded"] = False
     if not session["IsDataFrameLoaded"]:
         load_data()   # 👈 qui usiamo load_data() perché vogliamo tutto
+    else:
+        patch_data()  # modifiche fatte da altre pagine (4D/5D): patch incrementale
 
     if session["IsDataFrameLoaded"]:
         tab1, tab2, tab3, tab4 = st.tabs([
@@ -109,19 +178,29 @@ def execute():
             if base_df is not None and not base_df.empty:
                 st.dataframe(base_df, use_container_width=True)
 
+                # CSV con la stessa forma di prima (colonna Value unica, non ValueNumeric/ValueText)
+                csv_df = p6.with_value_column(base_df)[p6.FULL_COLUMNS]
                 st.download_button(
                     "Download CSV",
-                    base_df.to_csv(index=False).encode("utf-8"),
+                    csv_df.to_csv(index=False).encode("utf-8"),
                     "full_dataframe.csv",
                     "text/csv"
                 )
                 if st.button("Save CSV to temp_file", key="btn_save_df_csv"):
                     try:
-                        path, url = save_text("full_dataframe.csv", base_df.to_csv(index=False))
+                        path, url = save_text("full_dataframe.csv", csv_df.to_csv(index=False))
                         st.success(f"Saved in static/temp_file — {path.name}")
                         st.markdown(f"[Click to download]({url})")
                     except Exception as e:
                         st.error(f"Unable to save: {e}")
+
+                with st.expander("Memory usage (compact dtypes)"):
+                    if session.get("FullDataFrameMemory") is None:
+                        session["FullDataFrameMemory"] = p6.full_dataframe_memory_report(base_df)
+                    st.dataframe(session["FullDataFrameMemory"], use_container_width=True)
+
+                st.markdown("**Columnar export (Parquet / Feather)**")
+                columnar_export()
             else:
                 st.warning("⚠️ No data available. Please load an IFC file first.")
 
@@ -174,7 +253,8 @@ def execute():
 
                             # Start from full class+pset selection, then apply Level/Type filters for the analysis
                             df_prop = df_pset_all[df_pset_all["AttributeName"] == property_name]
-                            df_prop_filtered = df_prop.copy()
+                            # Value ricomposto (testo o numero) solo sulle righe selezionate
+                            df_prop_filtered = p6.with_value_column(df_prop)
                             if level_filter != "All" and "Level" in df_prop_filtered:
                                 df_prop_filtered = df_prop_filtered[df_prop_filtered["Level"] == level_filter]
                             if type_filter != "All" and "Type" in df_prop_filtered:
@@ -243,8 +323,11 @@ def execute():
                 if "ifc_file" not in session or session["ifc_file"] is None:
                     st.warning("⚠️ No IFC file loaded yet.")
                 else:
-                    # Carica le quantità dal modello IFC
-                    qto_df = p6.get_ifc_quantities(session["ifc_file"])
+                    # Quantità già estratte in load_data (cache per hash del file)
+                    qto_df = session.get("QuantitiesFrame")
+                    if qto_df is None:
+                        qto_df = p6.get_ifc_quantities(session["ifc_file"])
+                        session["QuantitiesFrame"] = qto_df
 
                     if qto_df.empty:
                         st.warning("⚠️ Quantities DataFrame is empty.")
@@ -29,6 +29,7 @@ from ifcopenshell.guid import new as new_guid
 
 # Add per-page helper import (non-invasivo)
 from tools import p7_4d as p7  # per-page helper
+from tools import changetracker  # registro modifiche per le patch dei DataFrame
 
 # ─────────────────────────────────────────────
 # 🧠 Session alias
@@ -106,6 +107,7 @@ def add_work_schedule():
     load_work_schedules()
 
 
+@changetracker.tracked(removes=('schedule_id',), model=lambda: session.get('ifc_file'))
 def delete_work_schedule(schedule_id: int):
     """Elimina la WorkSchedule con l'ExpressID fornito e aggiorna la lista."""
     try:
@@ -212,6 +214,7 @@ def assign_elements_to_schedule(schedule_id, element_ids, task_name_prefix='Task
     else:
         st.warning('No tasks created')
 
+@changetracker.tracked(modifies=('schedule_id',), model=lambda: session.get('ifc_file'))
 def create_tasks_from_planner(schedule_id, df: pd.DataFrame, summary_name: str | None = "Plan Summary", link_sequential: bool = True):
     if not schedule_id:
         st.error('Please select a WorkSchedule')
@@ -331,6 +334,7 @@ def create_tasks_from_planner(schedule_id, df: pd.DataFrame, summary_name: str |
         pass
     st.success(f'Created {len(created_tasks)} tasks from table')
 
+@changetracker.tracked(modifies=('element_ids',), model=lambda: session.get('ifc_file'))
 def create_tasks(element_ids: list[int], name_prefix: str = "Task", identification_prefix: str | None = None,
                               start_date=None, start_time=None, finish_date=None, finish_time=None, duration_iso: str | None = None,
                               mode: str = "per_element"):
@@ -955,7 +959,7 @@ def execute():
         # Tasks 
         with tab_elements_tasks:
             st.subheader("Select elements and create tasks")
-            df_unscheduled = p7.build_unscheduled_df(session.ifc_file)
+            df_unscheduled = p7.get_unscheduled_df(session.ifc_file)
             if df_unscheduled is None or df_unscheduled.empty:
                 st.info("No elements found or all already scheduled.")
             else:
@@ -20,8 +20,7 @@ session = st.session_state
 # ─────────────────────────────────────────────
 # 📦 Importazioni
 # ─────────────────────────────────────────────
-import ifcopenshell as ifc
-from tools import ifc_3D
+from tools import p7_4d as p7  # create_cost_schedule (tracciata da changetracker)
 from tools import graph_maker
 from datetime import datetime
 from email.policy import default
@@ -58,7 +57,7 @@ def load_cost_schedules():
     }
  
 def add_cost_schedule():
-    ifc_3D.create_cost_schedule(session.ifc_file, session["cost_input"])
+    p7.create_cost_schedule(session.ifc_file, session["cost_input"])
     load_cost_schedules()
   
 def draw_schedules():
@@ -81,83 +80,65 @@ def draw_side_bar():
     st.sidebar.button("💾 Save File", key="save_file", on_click=save_file)
 
 def initialise_debug_props(force=False):
-    if not "BIMDebugProperties" in session:
+    # "views" manca nello stato creato da versioni precedenti del pannello: si riparte da zero
+    if not "BIMDebugProperties" in session or force or "views" not in session.BIMDebugProperties:
         session.BIMDebugProperties = {
             "step_id": 0,
             "number_of_polygons": 0,
             "percentile_of_polygons": 0,
             "active_step_id": 0,
             "step_id_breadcrumb": [],
-            "attributes": [],
-            "inverse_attributes": [],
-            "inverse_references": [],
-            "express_file": None,
-        }
-    if force:
-        session.BIMDebugProperties = {
-            "step_id": 0,
-            "number_of_polygons": 0,
-            "percentile_of_polygons": 0,
-            "active_step_id": 0,
-            "step_id_breadcrumb": [],
-            "attributes": [],
-            "inverse_attributes": [],
-            "inverse_references": [],
+            "views": {},  # viste già visitate (shared.inspector_view), riusate dal breadcrumb
+            "error": None,
             "express_file": None,
         }
 
 def get_object_data(fromId=None):
-    def add_attribute(prop, key, value):
-        if isinstance(value, tuple) and len(value) < 10:
-            for i, item in enumerate(value):
-                add_attribute(prop, key + f"[{i}]", item)
-            return
-        elif isinstance(value, tuple) and len(value) >= 10:
-            key = key + "({})".format(len(value))
-        
-        propy = {
-            "name": key,
-            "string_value": str(value),
-            "int_value": int(value.id()) if isinstance(value, ifc.entity_instance) else None,
-        }
-        prop.append(propy)
-            
-    if session.BIMDebugProperties:
-        initialise_debug_props(force=True)
-        step_id = 0
-        if fromId:
-            step_id = fromId
-        else:
-            step_id = int(session.object_id) if session.object_id else 0
-        debug_props = st.session_state.BIMDebugProperties
-        debug_props["active_step_id"] = step_id
-        crumb = {"name": str(step_id)}
-        debug_props["step_id_breadcrumb"].append(crumb)
-        element = session.ifc_file.by_id(step_id)
-        debug_props["inverse_attributes"] = []
-        debug_props["inverse_references"] = []
-        
-        for key, value in element.get_info().items():
-            add_attribute(debug_props["attributes"], key, value)
-
-        for key in dir(element):
-            if (
-                not key[0].isalpha()
-                or key[0] != key[0].upper()
-                or key in element.get_info()
-                or not getattr(element, key)
-            ):
-                continue
-            add_attribute(debug_props["inverse_attributes"], key, getattr(element, key))
-        
-        for inverse in session.ifc_file.get_inverse(element):
-            propy = {
-                "string_value": str(inverse),
-                "int_value": inverse.id(),
-            }
-            debug_props["inverse_references"].append(propy)
-            
-        print(debug_props["attributes"])
+    # Vista dell'entità con i soli conteggi: le sezioni sono lette a pagine quando mostrate
+    initialise_debug_props()
+    shared.inspector_visit(session.BIMDebugProperties, session.ifc_file, fromId or session.get("object_id") or 0)
+
+def draw_inspector_rows(rows, key_prefix):
+    for i, row in enumerate(rows):
+        col1, col2, col3 = st.columns([3, 5, 3])
+        col1.text(f'🔗 {row["name"]}' if row["int_value"] and row["name"] else (row["name"] or ""))
+        col2.text(row["string_value"])
+        if row["int_value"]:
+            col3.button("Get Object", key=f'{key_prefix}_{i}_{row["int_value"]}', on_click=get_object_data, args=(row["int_value"],))
+
+def draw_inspector():
+    props = session.BIMDebugProperties
+    if props.get("error"):
+        st.warning(props["error"])
+    view = props["views"].get(props["active_step_id"]) if props["active_step_id"] else None
+    if view is None:
+        return
+    # Breadcrumb: le viste visitate sono in cache, tornare indietro non ricalcola nulla
+    crumbs = props["step_id_breadcrumb"][-8:]
+    crumb_cols = st.columns(len(crumbs))
+    for i, (col, crumb) in enumerate(zip(crumb_cols, crumbs)):
+        col.button(f'#{crumb["name"]}', key=f'crumb_{i}_{crumb["name"]}', on_click=get_object_data, args=(int(crumb["name"]),))
+    st.markdown(f'**#{view["id"]} {view["class"]}**')
+    st.caption(view["label"])
+
+    labels = {"attributes": "Attributes", "inverse_attributes": "Inverse Attributes", "inverse_references": "Inverse References"}
+    section = st.radio("Section", shared.INSPECTOR_SECTIONS, horizontal=True, key="inspector_section",
+                       format_func=lambda s: f'{labels[s]} ({view["counts"][s]})')
+    page_no = st.number_input("Page", min_value=1, value=1, step=1, key=f'inspector_page_{view["id"]}_{section}') - 1
+    page = shared.inspector_page(session.ifc_file, view, section, page=page_no)
+    st.caption(f'Page {page["page"] + 1} of {page["pages"]} — {page["total"]} rows')
+    draw_inspector_rows(page["rows"], f'insp_{section}_{page["page"]}')
+
+    # Aggregati lunghi (es. RelatedElements): elementi caricati solo su richiesta
+    aggregates = [row["key"] for row in page["rows"] if row["count"]]
+    if aggregates:
+        key = st.selectbox("Expand aggregate", [None] + aggregates, key=f'inspector_aggregate_{view["id"]}',
+                           format_func=lambda k: "—" if k is None else k)
+        if key is not None:
+            child_no = st.number_input("Aggregate page", min_value=1, value=1, step=1, key=f'inspector_child_{view["id"]}_{key}') - 1
+            child = shared.inspector_page(session.ifc_file, view, section, page=child_no, key=key)
+            st.caption(f'{key}: page {child["page"] + 1} of {child["pages"]} — {child["total"]} items')
+            draw_inspector_rows(child["rows"], f'insp_child_{key}_{child["page"]}')
 
 def edit_object_data(object_id, attribute):
     entity = session.ifc_file.by_id(object_id)
@@ -183,38 +164,8 @@ def execute():
                 st.text_input("Object ID", key="object_id")
                 st.button("Inspect from Object Id", key="get_object_button", on_click=get_object_data, args=(session.object_id,))
             if "BIMDebugProperties" in session and session.BIMDebugProperties:
-                props = session.BIMDebugProperties
-                ## DIRECT ATTRIBUTES
-                if props["attributes"]:
-                    st.subheader("Attributes")
-                    for prop in props["attributes"]:
-                        col2, col3 = st.columns([3,3])
-                        if prop["int_value"]:
-                            col2.text(f'🔗 {prop["name"]}')
-                            col2.info(prop["string_value"])
-                            col3.text("🔗")
-                            col3.button("Get Object", key=f'get_object_pop_button_{prop["int_value"]}', on_click=get_object_data, args=(prop["int_value"],))
-                        else:
-                            col2.text_input(label=prop["name"], key=prop["name"], value=prop["string_value"])
-                
-                ## INVERSE ATTRIBUTES           
-                if props["inverse_attributes"]:
-                    st.subheader("Inverse Attributes")
-                    for inverse in props["inverse_attributes"]:
-                        col1, col2, col3 = st.columns([3,5,8])
-                        col1.text(inverse["name"])
-                        col2.text(inverse["string_value"])
-                        if inverse["int_value"]:
-                            col3.button("Get Object", key=f'get_object_pop_button_{inverse["int_value"]}', on_click=get_object_data, args=(inverse["int_value"],))
-
-                ## INVERSE REFERENCES    
-                if props["inverse_references"]:
-                    st.subheader("Inverse References")
-                    for inverse in props["inverse_references"]:
-                        col1, col3 = st.columns([3,3])
-                        col1.text(inverse["string_value"])
-                        if inverse["int_value"]:
-                            col3.button("Get Object", key=f'get_object_pop_button_inverse_{inverse["int_value"]}', on_click=get_object_data, args=(inverse["int_value"],))
+                with row1_col2:
+                    draw_inspector()
         with tab2:
             draw_schedules()
             
@@ -0,0 +1,5 @@
+# I test importano i moduli come nell'app (from tools import ...): radice del repo nel path
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
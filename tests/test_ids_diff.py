@@ -0,0 +1,39 @@
+"""Confronto delle impronte delle regole IDS (validazione incrementale)."""
+
+import copy
+
+from tools import p2_ids as p2
+from tools.benchmarks import synthetic_ids_specs
+
+
+def test_identical_rules_are_all_reused():
+    fps = p2.ids_rule_fingerprints(synthetic_ids_specs(5))
+    diff = p2.diff_ids_rules(fps, list(fps))
+    assert diff == {"reused": {i: i for i in range(5)}, "evaluate": [], "removed": []}
+
+
+def test_edited_rule_is_evaluated():
+    rules = synthetic_ids_specs(5)
+    edited = copy.deepcopy(rules)
+    edited[2]["properties"][0]["mandatory"] = not edited[2]["properties"][0]["mandatory"]
+    diff = p2.diff_ids_rules(p2.ids_rule_fingerprints(rules), p2.ids_rule_fingerprints(edited))
+    assert diff["evaluate"] == [2]
+    assert diff["reused"] == {0: 0, 1: 1, 3: 3, 4: 4}
+    assert diff["removed"] == [2]
+
+
+def test_added_removed_and_reordered_rules():
+    previous = ["a", "b", "c"]
+    current = ["c", "a", "d"]
+    diff = p2.diff_ids_rules(previous, current)
+    assert diff == {"reused": {0: 2, 1: 0}, "evaluate": [2], "removed": [1]}
+
+
+def test_repeated_rules_are_matched_in_order():
+    diff = p2.diff_ids_rules(["x", "y", "x"], ["x", "x", "x"])
+    assert diff == {"reused": {0: 0, 1: 2}, "evaluate": [2], "removed": [1]}
+
+
+def test_empty_previous():
+    assert p2.diff_ids_rules(None, ["a", "b"]) == {"reused": {}, "evaluate": [0, 1], "removed": []}
+    assert p2.diff_ids_rules(["a"], []) == {"reused": {}, "evaluate": [], "removed": [0]}
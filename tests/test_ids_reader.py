@@ -0,0 +1,58 @@
+"""Lettura IDS in streaming (iterparse): stesse regole di ids_rules_to_xml e della lettura findall."""
+
+import io
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from tools import p2_ids as p2
+from tools.benchmarks import _parse_ids_xml_findall, synthetic_ids_specs
+
+
+def test_round_trip_synthetic_specs():
+    rules = synthetic_ids_specs(200)
+    content = p2.ids_rules_to_xml(rules).encode("utf-8")
+    assert p2.parse_ids_xml(content) == rules
+
+
+def test_streaming_reader_matches_findall_reader():
+    content = p2.ids_rules_to_xml(synthetic_ids_specs(200)).encode("utf-8")
+    assert p2.parse_ids_xml(content) == _parse_ids_xml_findall(content)
+
+
+def test_round_trip_predefined_type_and_values():
+    rules = [
+        {
+            "ifc_class": "IfcWall",
+            "predefined_type": "SOLIDWALL",
+            "properties": [
+                {"property_set": "Pset_WallCommon", "property_name": "FireRating", "mandatory": True,
+                 "allowed_values": ["REI60", "REI120"]},
+                {"property_set": "Pset_WallCommon", "property_name": "IsExternal", "mandatory": False,
+                 "allowed_values": None},
+            ],
+        },
+        {"ifc_class": "IfcSlab", "properties": []},
+    ]
+    content = p2.ids_rules_to_xml(rules).encode("utf-8")
+    assert p2.parse_ids_xml(content) == rules
+
+
+@pytest.mark.parametrize("kind", ["bytes", "path", "file"])
+def test_sources(tmp_path, kind):
+    rules = synthetic_ids_specs(10)
+    content = p2.ids_rules_to_xml(rules).encode("utf-8")
+    if kind == "bytes":
+        source = content
+    elif kind == "path":
+        source = tmp_path / "rules.ids"
+        source.write_bytes(content)
+        source = str(source)
+    else:
+        source = io.BytesIO(content)
+    assert p2.parse_ids_xml(source) == rules
+
+
+def test_not_xml_raises():
+    with pytest.raises(ET.ParseError):
+        p2.parse_ids_xml(b"not an ids file")
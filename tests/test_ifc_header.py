@@ -0,0 +1,76 @@
+"""Lettura del solo HEADER STEP (read_ifc_header / detect_schema), BOM UTF-8 e stringhe codificate."""
+
+import codecs
+
+import ifcopenshell
+
+from tools import p1_ifc_import as p1
+
+HEADER = (
+    "ISO-10303-21;\n"
+    "HEADER;\n"
+    "/* commento nel header */\n"
+    "FILE_DESCRIPTION(('ViewDefinition [ReferenceView_V1.2]'),'2;1');\n"
+    "FILE_NAME('{name}','2024-05-01T10:00:00',('Mario Rossi'),('Studio'),'IfcOpenShell','Tool','');\n"
+    "FILE_SCHEMA(('IFC4X3_ADD2'));\n"
+    "ENDSEC;\n"
+)
+
+
+def _step(name="model.ifc", data="DATA;\n#1=NOT_PARSED;\nENDSEC;\nEND-ISO-10303-21;\n"):
+    return (HEADER.format(name=name) + data).encode("latin-1")
+
+
+def test_header_fields():
+    header = p1.read_ifc_header(_step())
+    assert header["schema"] == "IFC4X3_ADD2"
+    assert header["schemas"] == ["IFC4X3_ADD2"]
+    assert header["view_definition"] == "ReferenceView_V1.2"
+    assert header["implementation_level"] == "2;1"
+    assert header["name"] == "model.ifc"
+    assert header["time_stamp"] == "2024-05-01T10:00:00"
+    assert header["author"] == ["Mario Rossi"]
+    assert header["organization"] == ["Studio"]
+    assert header["originating_system"] == "Tool"
+
+
+def test_header_with_utf8_bom(tmp_path):
+    plain = p1.read_ifc_header(_step())
+    assert p1.read_ifc_header(codecs.BOM_UTF8 + _step()) == plain
+    path = tmp_path / "bom.ifc"
+    path.write_bytes(codecs.BOM_UTF8 + _step())
+    assert p1.read_ifc_header(path) == plain
+    assert p1.detect_schema(path) == "IFC4X3_ADD2"
+
+
+def test_encoded_strings():
+    name = r"Piano \X2\00E8\X0\ terra \X\E8 \X4\0001F600\X0\ O''Brien \S\e C:\\dir"
+    header = p1.read_ifc_header(_step(name=name))
+    assert header["name"] == "Piano \u00e8 terra \u00e8 \U0001F600 O'Brien \u00e5 C:\\dir"
+
+
+def test_not_step():
+    assert p1.read_ifc_header(b"PK\x03\x04 zipped") == {}
+    assert p1.read_ifc_header(b"<?xml version='1.0'?><ifcXML/>") == {}
+    assert p1.read_ifc_header(b"ISO-10303-21;\nDATA;\n") == {}
+
+
+def test_detect_schema_reads_only_the_header(tmp_path):
+    # Sezione DATA non valida: lo schema arriva comunque dal header, senza aprire il modello
+    path = tmp_path / "broken.ifc"
+    path.write_bytes(_step(data="DATA;\n#1=IFCWALL(garbage\n"))
+    assert p1.detect_schema(path) == "IFC4X3_ADD2"
+
+
+def test_strip_utf8_bom_makes_the_file_openable(tmp_path):
+    model = ifcopenshell.file(schema="IFC4")
+    model.createIfcWall(ifcopenshell.guid.new(), Name="W")
+    plain = model.to_string().encode("utf-8")
+    assert p1.strip_utf8_bom(codecs.BOM_UTF8 + plain) == plain
+    assert p1.strip_utf8_bom(plain) == plain
+    path = tmp_path / "bom.ifc"
+    path.write_bytes(p1.strip_utf8_bom(codecs.BOM_UTF8 + plain))
+    opened = ifcopenshell.open(str(path))
+    assert opened.schema == "IFC4"
+    assert [w.Name for w in opened.by_type("IfcWall")] == ["W"]
+    assert p1.read_ifc_header(codecs.BOM_UTF8 + plain)["schema"] == "IFC4"
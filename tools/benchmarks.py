@@ -0,0 +1,400 @@
+"""
+Micro-benchmark per gli helper di estrazione (nessuna dipendenza da Streamlit)
+
+Uso: python -m tools.benchmarks dataframe [--sizes 10000 50000 100000 500000]
+     python -m tools.benchmarks attributes path/to/model.ifc
+     python -m tools.benchmarks ids path/to/model.ifc [--repeat 10]
+     python -m tools.benchmarks ids-reader [--specs 5000]
+     python -m tools.benchmarks ids-incremental path/to/model.ifc [--repeat 10]
+     python -m tools.benchmarks header path/to/model.ifc
+     python -m tools.benchmarks extraction path/to/model.ifc [--workers 2 4]
+Funzioni:
+- synthetic_objects_data(n): genera objects_data fittizi nel formato di get_objects_data_by_class
+- bench_create_pandas_dataframe(sizes): misura create_pandas_dataframe e verifica la scalabilità lineare
+- bench_attribute_enumeration(model): confronta dir()/getattr con gli attributi letti dallo schema
+- bench_ids_validation(model, rules): validatore IDS per elemento vs motore vettoriale di p2_ids
+- bench_ids_reader(n_specs): round-trip ids_rules_to_xml -> iter_ids_rules e confronto con la lettura findall
+- bench_ids_incremental(model): modifica di una regola, validazione completa vs revalidate_ids_rules
+- bench_header_sniffing(ifc_path): schema dal solo HEADER STEP vs ifcopenshell.open
+- bench_extraction_pool(ifc_path, workers): get_ifc_pandas seriale vs pool di processi spawn (avvio incluso)
+"""
+
+# Commenti in italiano, output in inglese
+
+from __future__ import annotations
+from typing import Any, Dict, List, Tuple
+import json
+import os
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from tools.p_shared import create_pandas_dataframe, get_attribute_value, get_relationship_index, index_get_psets
+from tools import p6_prop_qtt as p6
+from tools import p2_ids as p2
+
+
+def synthetic_objects_data(n: int, n_psets: int = 3, n_qtos: int = 2, props_per_set: int = 6) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """Genera n objects_data fittizi con Pset/Qto ripetuti, come un modello reale di una classe."""
+    objects_data = []
+    pset_attributes = set()
+    for i in range(n):
+        psets = {f"Pset_Bench{p}": {f"Prop{k}": f"V{(i + k) % 7}" for k in range(props_per_set)} for p in range(n_psets)}
+        qtos = {f"Qto_Bench{q}": {f"Qty{k}": float(i % 100) + k for k in range(props_per_set)} for q in range(n_qtos)}
+        for sets in (psets, qtos):
+            for sn, props in sets.items():
+                props['id'] = i
+                pset_attributes.update(f"{sn}.{pn}" for pn in props if pn != 'id')
+        objects_data.append({
+            'ExpressId': i + 1,
+            'GlobalId': f"G{i:021d}",
+            'Class': 'IfcWall',
+            'PredefinedType': 'STANDARD',
+            'Name': f"Wall {i}",
+            'Level': f"Level {i % 10}",
+            'Type': f"Type {i % 25}",
+            'QuantitySets': qtos,
+            'PropertySets': psets,
+        })
+    return objects_data, sorted(pset_attributes)
+
+
+def _create_pandas_dataframe_loc(objects_data, pset_attributes):
+    # Implementazione storica (df.loc per quantità): solo come riferimento per la verifica
+    base_attrs = ['ExpressId', 'GlobalId', 'Class', 'PredefinedType', 'Name', 'Level', 'Type']
+    attrs = base_attrs + sorted(pset_attributes or [])
+    records = [{k: get_attribute_value(od, k) for k in attrs} for od in objects_data]
+    df = pd.DataFrame(records, columns=attrs)
+    for od in objects_data:
+        for qname, qdict in (od.get('QuantitySets') or {}).items():
+            for k, v in qdict.items():
+                if k == 'id':
+                    continue
+                col = f"{qname}.{k}"
+                if col not in df.columns:
+                    df[col] = None
+                df.loc[df['ExpressId'] == od.get('ExpressId'), col] = v
+    return df
+
+
+def bench_create_pandas_dataframe(sizes=(10_000, 50_000, 100_000, 500_000), verify_size: int = 500) -> pd.DataFrame:
+    """Misura create_pandas_dataframe per ogni dimensione; ritorna [Objects, Seconds, MicrosPerObject]."""
+    data, attrs = synthetic_objects_data(verify_size)
+    expected = _create_pandas_dataframe_loc(data, attrs)
+    actual = create_pandas_dataframe(data, attrs)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    rows = []
+    for n in sizes:
+        data, attrs = synthetic_objects_data(n)
+        t0 = time.perf_counter()
+        create_pandas_dataframe(data, attrs)
+        elapsed = time.perf_counter() - t0
+        rows.append({'Objects': n, 'Seconds': round(elapsed, 3), 'MicrosPerObject': round(elapsed / n * 1e6, 2)})
+    return pd.DataFrame(rows)
+
+
+def _native_attributes_reflection(e):
+    # Percorso storico: dir() + getattr su ogni istanza (riferimento per il confronto)
+    out = []
+    for attr_name in dir(e):
+        if attr_name.startswith('_'):
+            continue
+        try:
+            attr_val = getattr(e, attr_name)
+            if callable(attr_val) or isinstance(attr_val, (list, dict, set, tuple)):
+                continue
+            if attr_val in (None, ''):
+                continue
+            if attr_name in ('GlobalId', 'Name', 'Description', 'ObjectType', 'PredefinedType'):
+                continue
+            out.append((attr_name, attr_val))
+        except Exception:
+            continue
+    return out
+
+
+def bench_attribute_enumeration(model) -> pd.DataFrame:
+    """Tempo per enumerare gli attributi nativi di tutte le entità: reflection vs piano da schema."""
+    entities = list(model)
+    schema_id = p6._schema_id(model)
+
+    t0 = time.perf_counter()
+    n_reflection = sum(len(_native_attributes_reflection(e)) for e in entities)
+    t_reflection = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    n_schema = sum(1 for e in entities for _ in p6.iter_native_attributes(e, p6.get_attribute_plan(schema_id, e.is_a())))
+    t_schema = time.perf_counter() - t0
+
+    return pd.DataFrame([
+        {'Path': 'dir()/getattr', 'Entities': len(entities), 'Values': n_reflection, 'Seconds': round(t_reflection, 3)},
+        {'Path': 'schema plan', 'Entities': len(entities), 'Values': n_schema, 'Seconds': round(t_schema, 3)},
+    ])
+
+
+def _validate_ifc_with_ids_loop(model, ids_rules):
+    # Validatore IDS storico (elemento per elemento, senza allowed_values): riferimento per la verifica
+    results = []
+    index = get_relationship_index(model)
+    for rule in ids_rules or []:
+        class_name = rule.get('ifc_class')
+        if not class_name:
+            continue
+        try:
+            elements = model.by_type(class_name) or []
+        except Exception:
+            elements = []
+        for obj in elements:
+            try:
+                psets = index_get_psets(index, obj)
+            except Exception:
+                psets = {}
+            for prop_rule in rule.get('properties', []):
+                pset_name = prop_rule.get('property_set', '')
+                prop_name = prop_rule.get('property_name', '')
+                val = None
+                if pset_name:
+                    pset_props = psets.get(pset_name)
+                    if pset_props is not None:
+                        val = pset_props if prop_name == 'ALL' else pset_props.get(prop_name)
+                    else:
+                        for pn, props in psets.items():
+                            if pn.lower() == pset_name.lower():
+                                val = props if prop_name == 'ALL' else props.get(prop_name)
+                                pset_name = pn
+                                break
+                else:
+                    for pn, props in psets.items():
+                        if prop_name == 'ALL' or prop_name in props:
+                            val = props if prop_name == 'ALL' else props.get(prop_name)
+                            pset_name = pn
+                            break
+                if val is None and prop_name and hasattr(obj, prop_name):
+                    try:
+                        val = getattr(obj, prop_name)
+                    except Exception:
+                        val = None
+                results.append({
+                    'ElementID': getattr(obj, 'GlobalId', None) or getattr(obj, 'GlobalID', None) or obj.id(),
+                    'ElementName': getattr(obj, 'Name', None) or '(Unnamed)',
+                    'IFCClass': class_name,
+                    'PropertySet': pset_name,
+                    'PropertyName': prop_name,
+                    'Value': val,
+                    'Compliant': (val is not None) if prop_rule.get('mandatory', False) else True,
+                })
+    return pd.DataFrame(results, columns=p2.IDS_RESULT_COLUMNS)
+
+
+def synthetic_ids_rules(model, repeat: int = 1) -> List[Dict[str, Any]]:
+    """Regole IDS semplificate sulle classi di prodotto presenti nel modello (Pset, attributo, 'ALL')."""
+    classes = sorted({e.is_a() for e in model.by_type('IfcProduct')} - {'IfcSite', 'IfcBuilding', 'IfcBuildingStorey'})
+    properties = [
+        {'property_set': 'Pset_WallCommon', 'property_name': 'FireRating', 'mandatory': True},
+        {'property_set': '', 'property_name': 'Name', 'mandatory': True},
+        {'property_set': '', 'property_name': 'IsExternal', 'mandatory': False},
+        {'property_set': 'Pset_WallCommon', 'property_name': 'ALL', 'mandatory': False},
+    ]
+    return [{'ifc_class': c, 'properties': properties} for c in classes] * repeat
+
+
+def _ids_rows(df: pd.DataFrame) -> List[tuple]:
+    # Confronto riga per riga tollerante a None/NaN e ai dict dei Pset
+    return [tuple(repr(v) for v in row) for row in df.itertuples(index=False)]
+
+
+def bench_ids_validation(model, ids_rules=None, repeat: int = 10) -> pd.DataFrame:
+    """Validatore IDS per elemento vs build_ids_tables + evaluate_ids_rules (stesso output verificato)."""
+    rules = ids_rules or synthetic_ids_rules(model, repeat)
+    get_relationship_index(model)
+
+    t0 = time.perf_counter()
+    expected = _validate_ifc_with_ids_loop(model, rules)
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    actual = p2.validate_ifc_with_ids(model, rules)
+    t_vector = time.perf_counter() - t0
+
+    if not any(p.get('allowed_values') or p.get('values') for r in rules for p in r.get('properties', [])):
+        assert _ids_rows(actual) == _ids_rows(expected), "vectorised IDS output differs from the per-element loop"
+    return pd.DataFrame([
+        {'Path': 'per-element loop', 'Rules': len(rules), 'Rows': len(expected), 'Seconds': round(t_loop, 3)},
+        {'Path': 'vectorised joins', 'Rules': len(rules), 'Rows': len(actual), 'Seconds': round(t_vector, 3)},
+    ])
+
+
+def _parse_ids_xml_findall(content: bytes) -> List[Dict[str, Any]]:
+    # Lettura storica della pagina 2 (albero completo + find/findall con e senza namespace)
+    ids_ns, xs_ns = '{http://standards.buildingsmart.org/IDS}', '{http://www.w3.org/2001/XMLSchema}'
+    root = ET.fromstring(content)
+    rules = []
+    for spec in root.findall(f'.//{ids_ns}specification') or root.findall('.//specification'):
+        ifc_class = ''
+        appl = spec.find(f'.//{ids_ns}applicability')
+        if appl is not None:
+            sv = appl.find(f'.//{ids_ns}simpleValue')
+            if sv is not None and sv.text:
+                ifc_class = sv.text.strip()
+        props = []
+        for prop_el in spec.findall(f'.//{ids_ns}requirements/{ids_ns}property'):
+            pset_el = prop_el.find(f'.//{ids_ns}propertySet/{ids_ns}simpleValue')
+            base_el = prop_el.find(f'.//{ids_ns}baseName/{ids_ns}simpleValue')
+            enums = [e.get('value') for e in prop_el.findall(f'.//{ids_ns}value/{xs_ns}restriction/{xs_ns}enumeration')]
+            props.append({
+                'property_set': (pset_el.text or '').strip() if pset_el is not None else '',
+                'property_name': (base_el.text or '').strip() if base_el is not None else '',
+                'mandatory': (prop_el.get('cardinality') or '').lower().startswith('required'),
+                'allowed_values': enums or None,
+            })
+        rules.append({'ifc_class': ifc_class or spec.get('name', '').replace('Requirement for ', ''), 'properties': props})
+    return rules
+
+
+def synthetic_ids_specs(n_specs: int, props_per_spec: int = 4) -> List[Dict[str, Any]]:
+    """Regole IDS fittizie (classi ripetute, enumerazioni su una proprietà ogni tre)."""
+    classes = ['IfcWall', 'IfcSlab', 'IfcBeam', 'IfcColumn', 'IfcDoor', 'IfcWindow']
+    return [{
+        'ifc_class': classes[i % len(classes)],
+        'properties': [{
+            'property_set': f"Pset_Bench{k}",
+            'property_name': f"Prop{i % 50}_{k}",
+            'mandatory': k % 2 == 0,
+            'allowed_values': [f"V{j}" for j in range(3)] if k % 3 == 0 else None,
+        } for k in range(props_per_spec)],
+    } for i in range(n_specs)]
+
+
+def _measure(func, *args):
+    # Tempo senza tracemalloc (che rallenta molto le allocazioni), poi picco di memoria in un secondo giro
+    t0 = time.perf_counter()
+    out = func(*args)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def bench_ids_reader(n_specs: int = 5000) -> pd.DataFrame:
+    """Round-trip regole -> ids_rules_to_xml -> iter_ids_rules (deve restituire le stesse regole)
+    e confronto di tempo/picco di memoria con la lettura ElementTree + findall."""
+    rules = synthetic_ids_specs(n_specs)
+    content = p2.ids_rules_to_xml(rules).encode('utf-8')
+
+    streamed, t_stream, m_stream = _measure(p2.parse_ids_xml, content)
+    legacy, t_legacy, m_legacy = _measure(_parse_ids_xml_findall, content)
+    assert streamed == rules, "iter_ids_rules does not round-trip ids_rules_to_xml"
+    assert streamed == legacy, "streaming reader differs from the findall reader"
+    return pd.DataFrame([
+        {'Path': 'ElementTree findall', 'Specs': n_specs, 'Seconds': round(t_legacy, 3), 'PeakMB': round(m_legacy / 1e6, 1)},
+        {'Path': 'iterparse streaming', 'Specs': n_specs, 'Seconds': round(t_stream, 3), 'PeakMB': round(m_stream / 1e6, 1)},
+    ])
+
+
+def bench_ids_incremental(model, repeat: int = 10) -> pd.DataFrame:
+    """Modifica una regola e confronta la rivalidazione completa con quella incrementale (stesso risultato)."""
+    rules = synthetic_ids_rules(model, repeat)
+    _, state = p2.revalidate_ids_rules(model, rules)
+    # Copia profonda senza riferimenti condivisi, poi una sola regola modificata
+    edited = json.loads(json.dumps(rules))
+    edited[len(edited) // 2]['properties'][0]['mandatory'] ^= True
+
+    p2.clear_ids_plan_cache()
+    t0 = time.perf_counter()
+    full = p2.validate_ifc_with_ids(model, edited)
+    t_full = time.perf_counter() - t0
+    p2.clear_ids_plan_cache()
+    t0 = time.perf_counter()
+    incremental, state = p2.revalidate_ids_rules(model, edited, state)
+    t_incr = time.perf_counter() - t0
+    assert incremental.equals(full), "incremental re-validation differs from the full run"
+    return pd.DataFrame([
+        {'Path': 'full re-validation', 'Rules': len(edited), 'Evaluated': len(edited), 'Seconds': round(t_full, 3)},
+        {'Path': 'incremental', 'Rules': len(edited), 'Evaluated': state['stats']['evaluated'], 'Seconds': round(t_incr, 3)},
+    ])
+
+
+def bench_header_sniffing(ifc_path: str) -> pd.DataFrame:
+    """Schema letto dal solo HEADER (read_ifc_header) vs apertura completa del modello (stesso schema)."""
+    import ifcopenshell
+    from tools.p1_ifc_import import read_ifc_header
+    t0 = time.perf_counter()
+    header = read_ifc_header(ifc_path)
+    t_header = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    model = ifcopenshell.open(ifc_path)
+    t_open = time.perf_counter() - t0
+    assert header.get('schema', '').startswith(model.schema), "header schema differs from the parsed model"
+    return pd.DataFrame([
+        {'Path': 'ifcopenshell.open', 'Schema': model.schema, 'Seconds': round(t_open, 4)},
+        {'Path': 'STEP header only', 'Schema': header['schema'], 'Seconds': round(t_header, 4)},
+    ])
+
+
+def bench_extraction_pool(ifc_path: str, workers=(2, 4)) -> pd.DataFrame:
+    """get_ifc_pandas seriale vs pool spawn con N processi (stesso DataFrame verificato).
+
+    Il tempo del pool comprende l'avvio dei processi, la riapertura del file in ogni worker e il
+    pickling dei DataFrame per classe: il pool conviene solo se la riga supera il percorso seriale.
+    """
+    import ifcopenshell
+    model = ifcopenshell.open(ifc_path)
+    t0 = time.perf_counter()
+    expected = p6.get_ifc_pandas(model, workers=1)
+    t_serial = time.perf_counter() - t0
+    rows = [{'Path': 'serial', 'Workers': 1, 'Rows': len(expected), 'Seconds': round(t_serial, 3), 'Speedup': 1.0}]
+    for n in workers:
+        t0 = time.perf_counter()
+        actual = p6.get_ifc_pandas(model, workers=n, ifc_path=ifc_path)
+        elapsed = time.perf_counter() - t0
+        assert actual.equals(expected), f"process pool ({n} workers) differs from the serial extraction"
+        rows.append({'Path': 'spawn pool', 'Workers': n, 'Rows': len(actual), 'Seconds': round(elapsed, 3),
+                     'Speedup': round(t_serial / elapsed, 2) if elapsed else None})
+    return pd.DataFrame(rows).assign(CPUs=os.cpu_count())
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmarks for the IFC extraction helpers.")
+    sub = parser.add_subparsers(dest="bench", required=True)
+    p_df = sub.add_parser("dataframe", help="create_pandas_dataframe scaling (columnar builder)")
+    p_df.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 100_000, 500_000])
+    p_attr = sub.add_parser("attributes", help="native attribute enumeration: dir()/getattr vs schema plan")
+    p_attr.add_argument("ifc_path")
+    p_ids = sub.add_parser("ids", help="simplified IDS validation: per-element loop vs vectorised joins")
+    p_ids.add_argument("ifc_path")
+    p_ids.add_argument("--repeat", type=int, default=10, help="times each synthetic rule is repeated")
+    p_reader = sub.add_parser("ids-reader", help="IDS XML reading: findall vs iterparse streaming (with round-trip check)")
+    p_reader.add_argument("--specs", type=int, default=5000)
+    p_incr = sub.add_parser("ids-incremental", help="IDS re-validation after editing one rule: full vs incremental")
+    p_incr.add_argument("ifc_path")
+    p_incr.add_argument("--repeat", type=int, default=10, help="times each synthetic rule is repeated")
+    p_header = sub.add_parser("header", help="schema detection: STEP header sniffing vs full ifcopenshell.open")
+    p_header.add_argument("ifc_path")
+    p_pool = sub.add_parser("extraction", help="get_ifc_pandas: serial vs spawn process pool (startup included)")
+    p_pool.add_argument("ifc_path")
+    p_pool.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    args = parser.parse_args()
+
+    if args.bench == "dataframe":
+        print(bench_create_pandas_dataframe(args.sizes).to_string(index=False))
+    elif args.bench == "attributes":
+        import ifcopenshell
+        print(bench_attribute_enumeration(ifcopenshell.open(args.ifc_path)).to_string(index=False))
+    elif args.bench == "ids":
+        import ifcopenshell
+        print(bench_ids_validation(ifcopenshell.open(args.ifc_path), repeat=args.repeat).to_string(index=False))
+    elif args.bench == "ids-reader":
+        print(bench_ids_reader(args.specs).to_string(index=False))
+    elif args.bench == "ids-incremental":
+        import ifcopenshell
+        print(bench_ids_incremental(ifcopenshell.open(args.ifc_path), repeat=args.repeat).to_string(index=False))
+    elif args.bench == "header":
+        print(bench_header_sniffing(args.ifc_path).to_string(index=False))
+    elif args.bench == "extraction":
+        print(bench_extraction_pool(args.ifc_path, args.workers).to_string(index=False))
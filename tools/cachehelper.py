@@ -0,0 +1,260 @@
+"""
+Cache persistente su disco dei risultati di estrazione IFC
+
+Uso: pagine 1 (hash all'upload), 4 (statistiche, risultati di validazione), 6 (FullDataFrame / QuantitiesFrame)
+Funzioni:
+- content_hash(data): SHA-256 dei bytes caricati
+- get_or_build_frame(hash, name, builder): legge il DataFrame da Parquet o lo costruisce e lo salva
+- get_or_build_json(hash, name, builder): idem per statistiche (JSON)
+- invalidate(hash, prefix): rimuove le voci di un modello (tutte o quelle con nome che inizia per prefix)
+- evict_cache(max_bytes, max_age_days): eviction LRU per dimensione totale e per età
+- clear_cache(): svuota la cache
+
+Le voci sono in static/temp_file/cache/<sha256>_v<EXTRACTOR_VERSION>/ ; aumentare
+EXTRACTOR_VERSION quando cambia l'output degli estrattori.
+"""
+
+# Commenti in italiano, output per l'utente in inglese
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+
+from tools.pathhelper import ensure_cache_dir
+
+EXTRACTOR_VERSION = "4"
+MAX_CACHE_BYTES = 2 * 1024 ** 3
+MAX_CACHE_AGE_DAYS = 30
+
+# Parquet richiede pyarrow; senza, si ripiega su pickle (stessa API)
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+# Metadati Parquet: colonne salvate come JSON da _arrow_safe
+JSON_COLUMNS_KEY = b"cachehelper.json_columns"
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 esadecimale dei bytes del file caricato."""
+    return hashlib.sha256(data or b"").hexdigest()
+
+
+def file_hash(path: str | Path, chunk_size: int = 8 * 1024 * 1024) -> str:
+    """SHA-256 di un file su disco, letto a blocchi."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _entry_dir(key: str, create: bool = False) -> Path:
+    d = ensure_cache_dir() / f"{key}_v{EXTRACTOR_VERSION}"
+    if create:
+        d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _touch(d: Path) -> None:
+    # L'mtime della cartella è il timestamp LRU
+    try:
+        os.utime(d, None)
+    except Exception:
+        pass
+
+
+def _json_default(value: Any) -> Any:
+    # Scalari numpy (np.int64, np.bool_, ...) come tipi Python; altri oggetti non serializzabili
+    if hasattr(value, "item") and not hasattr(value, "__len__"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _arrow_safe(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
+    """Codifica in JSON le colonne object con tipi misti (es. Value) non serializzabili in Arrow.
+    Ritorna (frame, colonne codificate); load_frame le decodifica, quindi valori e dtype object
+    tornano come nel frame originale. TypeError se un valore non è serializzabile in JSON."""
+    import pyarrow as pa
+    out, encoded = df, []
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowException, TypeError, ValueError):
+            if out is df:
+                out = df.copy()
+            out[col] = [None if v is None else json.dumps(v, default=_json_default) for v in df[col]]
+            encoded.append(col)
+    return out, encoded
+
+
+def _write_parquet(df: pd.DataFrame, path: Path) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    out, encoded = _arrow_safe(df)
+    table = pa.Table.from_pandas(out, preserve_index=False)
+    if encoded:
+        metadata = dict(table.schema.metadata or {})
+        metadata[JSON_COLUMNS_KEY] = json.dumps(encoded).encode("utf-8")
+        table = table.replace_schema_metadata(metadata)
+    pq.write_table(table, path)
+
+
+def _read_parquet(path: Path) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+    df = pd.read_parquet(path)
+    metadata = pq.read_schema(path).metadata or {}
+    for col in json.loads(metadata.get(JSON_COLUMNS_KEY, b"[]")):
+        df[col] = pd.Series([None if pd.isna(v) else json.loads(v) for v in df[col]], index=df.index, dtype=object)
+    return df
+
+
+def load_frame(key: str, name: str) -> Optional[pd.DataFrame]:
+    """Legge un DataFrame dalla cache, None se assente o illeggibile."""
+    d = _entry_dir(key)
+    try:
+        if PARQUET_AVAILABLE and (d / f"{name}.parquet").exists():
+            df = _read_parquet(d / f"{name}.parquet")
+        elif (d / f"{name}.pkl").exists():
+            df = pd.read_pickle(d / f"{name}.pkl")
+        else:
+            return None
+    except Exception:
+        return None
+    _touch(d)
+    return df
+
+
+def save_frame(key: str, name: str, df: pd.DataFrame) -> Optional[Path]:
+    """Salva un DataFrame nella cache (Parquet se disponibile) e applica l'eviction.
+    Frame con valori non serializzabili (né Arrow né JSON) non vengono salvati."""
+    if df is None:
+        return None
+    d = _entry_dir(key, create=True)
+    try:
+        if PARQUET_AVAILABLE:
+            path = d / f"{name}.parquet"
+            _write_parquet(df, path)
+        else:
+            path = d / f"{name}.pkl"
+            df.to_pickle(path)
+    except Exception:
+        return None
+    evict_cache(keep=d)
+    return path
+
+
+def load_json(key: str, name: str) -> Optional[Any]:
+    d = _entry_dir(key)
+    try:
+        data = json.loads((d / f"{name}.json").read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    _touch(d)
+    return data
+
+
+def save_json(key: str, name: str, data: Any) -> Optional[Path]:
+    d = _entry_dir(key, create=True)
+    path = d / f"{name}.json"
+    try:
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    except Exception:
+        return None
+    evict_cache(keep=d)
+    return path
+
+
+def get_or_build_frame(key: Optional[str], name: str, builder: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+    """Ritorna il DataFrame in cache per (key, name) oppure lo costruisce con builder() e lo salva."""
+    if key:
+        cached = load_frame(key, name)
+        if cached is not None:
+            return cached
+    df = builder()
+    if key and df is not None:
+        save_frame(key, name, df)
+    return df
+
+
+def get_or_build_json(key: Optional[str], name: str, builder: Callable[[], Any]) -> Any:
+    """Come get_or_build_frame ma per dati JSON (es. statistiche per classe)."""
+    if key:
+        cached = load_json(key, name)
+        if cached is not None:
+            return cached
+    data = builder()
+    if key and data is not None:
+        save_json(key, name, data)
+    return data
+
+
+def invalidate(key: Optional[str], prefix: str = "") -> int:
+    """Rimuove le voci in cache di un modello il cui nome inizia per prefix (tutte se vuoto); ritorna quante."""
+    if not key:
+        return 0
+    d = _entry_dir(key)
+    if not d.exists():
+        return 0
+    if not prefix:
+        removed = sum(1 for p in d.iterdir() if p.is_file())
+        shutil.rmtree(d, ignore_errors=True)
+        return removed
+    removed = 0
+    for p in d.glob(f"{prefix}*"):
+        try:
+            p.unlink()
+            removed += 1
+        except Exception:
+            pass
+    return removed
+
+
+def _dir_size(d: Path) -> int:
+    return sum(p.stat().st_size for p in d.rglob("*") if p.is_file())
+
+
+def list_entries() -> List[Dict[str, Any]]:
+    """Voci della cache ordinate dalla più vecchia alla più recente (LRU)."""
+    entries = []
+    for d in ensure_cache_dir().iterdir():
+        if not d.is_dir():
+            continue
+        try:
+            entries.append({"path": d, "mtime": d.stat().st_mtime, "size": _dir_size(d)})
+        except Exception:
+            continue
+    return sorted(entries, key=lambda e: e["mtime"])
+
+
+def evict_cache(max_bytes: int = MAX_CACHE_BYTES, keep: Optional[Path] = None,
+                max_age_days: Optional[float] = MAX_CACHE_AGE_DAYS) -> List[str]:
+    """Rimuove le voci non usate da più di max_age_days, poi le meno usate di recente finché
+    la dimensione totale è <= max_bytes."""
+    entries = list_entries()
+    total = sum(e["size"] for e in entries)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    removed = []
+    for e in entries:
+        if keep is not None and e["path"] == keep:
+            continue
+        # Voci ordinate per mtime: dopo la prima non scaduta, solo il limite di dimensione conta
+        expired = cutoff is not None and e["mtime"] < cutoff
+        if total <= max_bytes and not expired:
+            break
+        shutil.rmtree(e["path"], ignore_errors=True)
+        total -= e["size"]
+        removed.append(str(e["path"]))
+    return removed
+
+
+def clear_cache() -> None:
+    """Svuota completamente la cache di estrazione."""
+    shutil.rmtree(ensure_cache_dir(), ignore_errors=True)
@@ -0,0 +1,415 @@
+"""
+Tracciamento delle modifiche al modello IFC fatte dagli helper dell'app (4D / 5D)
+
+Uso: tools/p7_4d.py (decoratore tracked), pagine 6 e 7 (patch dei DataFrame in sessione)
+Funzioni:
+- register(model): stato di riferimento del modello appena caricato
+- tracked(modifies, removes): decoratore che registra gli id creati/modificati/rimossi da un helper
+- track(model, modified, removed): stesso tracciamento come context manager
+- record_changes(model, created, modified, removed): registrazione manuale
+- get_revision(model) / changes_since(model, revision): revisione corrente e modifiche accumulate
+- patch_frame(df, changes, build_rows): sostituisce solo le righe delle entità coinvolte
+- sync_frame(store, name, model, build, patch): DataFrame in sessione ricostruito o patchato
+- model_on_disk(model, source_path): file IFC equivalente al modello (serializza solo se modificato)
+
+Il registro è per oggetto modello (come l'indice relazioni di p_shared) e tiene al più
+MAX_LOG_ENTRIES voci: oltre, changes_since ritorna None e il chiamante ricostruisce tutto.
+
+Modifiche fatte fuori da tracked/track: la revisione segue anche il max id del modello, quindi
+un'entità creata direttamente (ifcopenshell.api, create_entity) rende il modello "dirty" e forza la
+ricostruzione completa (changes_since ritorna None). Non sono rilevabili a basso costo le sole
+rimozioni e le assegnazioni di attributi in place: ogni pagina/helper che modifica il modello deve
+passare da tracked/track (p7_4d e le pagine 7/8 lo fanno).
+"""
+
+# Commenti in italiano
+
+from __future__ import annotations
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+import contextlib
+import functools
+import inspect
+import os
+import tempfile
+import threading
+import weakref
+
+import pandas as pd
+
+MAX_LOG_ENTRIES = 500
+
+# id(model) -> {"ref": weakref, "revision": int, "max_id": int, "log": [(revision, created, modified, removed)]}
+# (created/modified/removed = None: modifica non tracciata, id ignoti)
+_CHANGE_LOGS: Dict[int, Dict[str, Any]] = {}
+
+
+def _log_for(model, create: bool = False) -> Optional[Dict[str, Any]]:
+    entry = _CHANGE_LOGS.get(id(model))
+    if entry is not None and entry["ref"]() is not model:
+        # id riutilizzato da un altro modello: il registro non è più valido
+        _CHANGE_LOGS.pop(id(model), None)
+        entry = None
+    if entry is None and create:
+        try:
+            ref = weakref.ref(model)
+        except TypeError:
+            return None
+        entry = {"ref": ref, "revision": 0, "max_id": _max_id(model), "log": []}
+        _CHANGE_LOGS[id(model)] = entry
+        # Registro rimosso quando il modello viene liberato
+        weakref.finalize(model, _CHANGE_LOGS.pop, id(model), None)
+    return entry
+
+
+def _invalidate_index(model) -> None:
+    # L'indice relazioni memoizzato non riflette più il modello
+    try:
+        from tools.p_shared import invalidate_relationship_index
+        invalidate_relationship_index(model)
+    except Exception:
+        pass
+
+
+def _check_untracked(model, entry: Dict[str, Any]) -> None:
+    # Max id cresciuto fuori da un blocco track: modifica non tracciata, registrata senza id
+    if id(model) in _active_tracks():
+        return
+    current = _max_id(model)
+    if current == entry["max_id"]:
+        return
+    entry["max_id"] = current
+    entry["revision"] += 1
+    entry["log"].append((entry["revision"], None, None, None))
+    del entry["log"][:-MAX_LOG_ENTRIES]
+    _invalidate_index(model)
+
+
+def register(model) -> None:
+    """Fissa lo stato di riferimento (revisione 0) del modello appena aperto."""
+    if model is not None and hasattr(model, "by_id"):
+        _log_for(model, create=True)
+
+
+def get_revision(model) -> int:
+    """Numero di modifiche registrate sul modello (0 = come caricato), comprese quelle non tracciate
+    che hanno creato entità (vedi docstring del modulo)."""
+    if model is None or not hasattr(model, "by_id"):
+        return 0
+    entry = _log_for(model, create=True)
+    if entry is None:
+        return 0
+    _check_untracked(model, entry)
+    return entry["revision"]
+
+
+def is_dirty(model) -> bool:
+    """True se l'app ha modificato il modello dopo il caricamento."""
+    return get_revision(model) > 0
+
+
+def record_changes(model, created: Iterable[int] = (), modified: Iterable[int] = (), removed: Iterable[int] = ()) -> int:
+    """Registra una modifica e ritorna la nuova revisione (invariata se non c'è nulla da registrare)."""
+    created, removed = set(created), set(removed)
+    modified = set(modified) - created - removed
+    entry = _log_for(model, create=True)
+    if entry is None:
+        return 0
+    # Le entità create qui sono registrate: il max id corrente diventa il riferimento
+    entry["max_id"] = _max_id(model)
+    if not (created or modified or removed):
+        return entry["revision"]
+    entry["revision"] += 1
+    entry["log"].append((entry["revision"], created, modified, removed))
+    del entry["log"][:-MAX_LOG_ENTRIES]
+    _invalidate_index(model)
+    return entry["revision"]
+
+
+def changes_since(model, revision: int) -> Optional[Dict[str, Set[int]]]:
+    """
+    Modifiche accumulate dopo `revision`: {"created", "modified", "removed"} (insiemi di id).
+    None se il registro non copre più quella revisione o se nell'intervallo c'è una modifica
+    non tracciata (ricostruzione completa necessaria).
+    """
+    get_revision(model)
+    entry = _log_for(model)
+    out = {"created": set(), "modified": set(), "removed": set()}
+    if entry is None or revision >= entry["revision"]:
+        return out if revision == get_revision(model) else None
+    log = [item for item in entry["log"] if item[0] > revision]
+    if not log or log[0][0] != revision + 1:
+        return None
+    for _, created, modified, removed in log:
+        if created is None:
+            return None
+        out["created"] |= created
+        out["modified"] |= modified
+        out["removed"] |= removed
+    # Creato e poi rimosso nello stesso intervallo: basta toglierne le righe
+    out["created"] -= out["removed"]
+    out["modified"] -= out["created"] | out["removed"]
+    return out
+
+
+# ------------------------------
+# Decoratore per gli helper che modificano il modello
+# ------------------------------
+
+def _max_id(model) -> int:
+    try:
+        return int(model.get_max_id())
+    except Exception:
+        return 0
+
+
+def _exists(model, eid: int) -> bool:
+    try:
+        return model.by_id(eid) is not None
+    except Exception:
+        return False
+
+
+def _as_ids(value) -> Set[int]:
+    if value is None:
+        return set()
+    if isinstance(value, (list, tuple, set)):
+        out = set()
+        for v in value:
+            out |= _as_ids(v)
+        return out
+    try:
+        return {int(value.id())} if hasattr(value, "id") else {int(value)}
+    except Exception:
+        return set()
+
+
+def _referenced_ids(model, entity) -> Set[int]:
+    # Entità referenziate direttamente (es. RelatedObjects di una relazione appena creata)
+    try:
+        return {e.id() for e in model.traverse(entity, max_levels=1) if e.id()}
+    except Exception:
+        return set()
+
+
+def _inverse_ids(model, entity) -> Set[int]:
+    try:
+        return {inv.id() for inv in model.get_inverse(entity) or [] if inv.id()}
+    except Exception:
+        return set()
+
+
+def _neighbour_ids(model, eid: int) -> Dict[int, Set[int]]:
+    """Relazioni inverse di eid (e entità referenziate), con gli oggetti a cui ciascuna punta."""
+    try:
+        entity = model.by_id(eid)
+    except Exception:
+        return {}
+    out = {i: set() for i in _referenced_ids(model, entity)}
+    try:
+        for inv in model.get_inverse(entity) or []:
+            out[inv.id()] = _referenced_ids(model, inv)
+    except Exception:
+        pass
+    out.pop(eid, None)
+    return out
+
+
+# Blocchi track attivi per thread: id(model) -> id dichiarati (modified, removed, neighbours)
+_ACTIVE = threading.local()
+
+
+def _active_tracks() -> Dict[int, Dict[str, Any]]:
+    tracks = getattr(_ACTIVE, "tracks", None)
+    if tracks is None:
+        tracks = _ACTIVE.tracks = {}
+    return tracks
+
+
+@contextlib.contextmanager
+def track(model, modified: Iterable[Any] = (), removed: Iterable[Any] = ()):
+    """
+    Registra le modifiche fatte al modello dentro il blocco `with`.
+    - entità create: id oltre il max id precedente, più gli oggetti che referenziano
+    - modified: id/entità modificati; removed: id/entità rimossi (anche i vicini vengono segnati)
+    Blocchi annidati sullo stesso modello sono registrati una sola volta, dal più esterno.
+    """
+    if model is None or not hasattr(model, "by_id"):
+        yield
+        return
+    modified, removed = _as_ids(list(modified)), _as_ids(list(removed))
+    neighbours = {}
+    for eid in removed:
+        neighbours.update(_neighbour_ids(model, eid))
+    active = _active_tracks()
+    outer = active.get(id(model))
+    if outer is not None:
+        # Chiamata annidata (es. wrapper di pagina -> helper decorato): gli id dichiarati passano
+        # al blocco esterno, che registra una sola modifica per tutto
+        outer["modified"] |= modified
+        outer["removed"] |= removed
+        outer["neighbours"].update(neighbours)
+        yield
+        return
+    # Modifiche non tracciate precedenti al blocco: registrate a parte, non attribuite a questo
+    get_revision(model)
+    active[id(model)] = {"modified": modified, "removed": removed, "neighbours": neighbours}
+    max_before = _max_id(model)
+    try:
+        yield
+    finally:
+        active.pop(id(model), None)
+        # Vicini dell'entità rimossa: le relazioni rimosse a cascata coinvolgono gli oggetti collegati
+        # (es. task -> RelAssignsToProcess -> elementi), quelle rimaste cambiano solo loro stesse
+        for nid, refs in neighbours.items():
+            modified.add(nid)
+            if not _exists(model, nid):
+                modified |= refs
+        created = {i for i in range(max_before + 1, _max_id(model) + 1) if _exists(model, i)}
+        # Entità modificate in place: dichiarate o che ora puntano a un'entità nuova (es. Pset esteso)
+        edited = set(modified)
+        for eid in created:
+            entity = model.by_id(eid)
+            modified |= _referenced_ids(model, entity)
+            edited |= _inverse_ids(model, entity)
+        # Chi le referenzia ne riporta la rappresentazione testuale (colonna Value): va rigenerato
+        for eid in edited - created:
+            if _exists(model, eid):
+                modified |= _inverse_ids(model, model.by_id(eid))
+        modified |= edited
+        gone = {i for i in removed | modified if not _exists(model, i)}
+        record_changes(model, created, modified - gone, gone)
+
+
+def tracked(modifies: Iterable[str] = (), removes: Iterable[str] = (), model: Optional[Callable[[], Any]] = None):
+    """
+    Decoratore per helper che modificano il modello (vedi track).
+    Il modello è il primo argomento, oppure model() se fornito (es. lambda: session.ifc_file).
+    modifies/removes: nomi degli argomenti con gli id/entità modificati o rimossi.
+    """
+    modifies, removes = tuple(modifies), tuple(removes)
+
+    def decorator(func: Callable):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                bound = signature.bind(*args, **kwargs)
+                target = model() if model is not None else next(iter(bound.arguments.values()))
+            except Exception:
+                return func(*args, **kwargs)
+            modified = [bound.arguments.get(name) for name in modifies]
+            removed = [bound.arguments.get(name) for name in removes]
+            with track(target, modified, removed):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------------------
+# Patch dei DataFrame derivati dal modello
+# ------------------------------
+
+def patch_frame(df: pd.DataFrame, changes: Dict[str, Set[int]], build_rows: Callable[[list], pd.DataFrame],
+                key: str = "ExpressId", exists: Optional[Callable[[int], bool]] = None) -> pd.DataFrame:
+    """
+    Rimuove le righe delle entità coinvolte e aggiunge quelle ricostruite da build_rows(ids),
+    chiamato solo per le entità ancora presenti. Le righe ricostruite prendono il posto delle
+    precedenti (le nuove entità in coda, o in ordine di key se il df è ordinato); categorie preservate.
+    exists(id): se fornito e ci sono rimozioni, elimina anche le righe di entità rimosse a cascata
+    (es. proprietà di un Pset cancellato insieme al prodotto) non registrate esplicitamente.
+    """
+    affected = changes["created"] | changes["modified"] | changes["removed"]
+    if df is None or key not in df.columns or not affected:
+        return df
+    if changes["removed"] and exists is not None:
+        stale = {int(k) for k in df[key].dropna().unique() if int(k) not in affected and not exists(int(k))}
+        affected = affected | stale
+    alive = sorted((changes["created"] | changes["modified"]) - changes["removed"])
+
+    df = df.reset_index(drop=True)
+    mask = df[key].isin(affected)
+    keep = df[~mask].copy()
+    keep["__pos"] = keep.index.astype("float64")
+    new = build_rows(alive) if alive else None
+    if new is None or new.empty:
+        return keep.drop(columns="__pos").reset_index(drop=True)
+
+    new = new.reindex(columns=df.columns)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            cats = df[col].cat.categories
+            extra = pd.Index(new[col].dropna().astype(str).unique()).difference(cats)
+            dtype = pd.CategoricalDtype(cats.append(extra) if len(extra) else cats)
+            keep[col] = keep[col].astype(dtype)
+            new[col] = new[col].astype(object).where(new[col].notna(), None).map(lambda v: v if v is None else str(v)).astype(dtype)
+        elif new[col].dtype != df[col].dtype:
+            try:
+                new[col] = new[col].astype(df[col].dtype)
+            except Exception:
+                pass
+
+    # Posizione delle righe ricostruite: dove stava la prima riga dell'entità
+    first_pos = pd.Series(df.index, index=df[key]).groupby(level=0).first()
+    pos = new[key].map(first_pos).astype("float64") - 0.5
+    missing = pos.isna()
+    if missing.any():
+        if df[key].is_monotonic_increasing:
+            pos[missing] = df[key].searchsorted(new.loc[missing, key]) - 0.5
+        else:
+            pos[missing] = float(len(df))
+    new["__pos"] = pos.values
+
+    out = pd.concat([keep, new], ignore_index=True)
+    out = out.sort_values("__pos", kind="stable").drop(columns="__pos")
+    return out.reset_index(drop=True)
+
+
+def sync_frame(store, name: str, model, build: Callable[[], pd.DataFrame],
+               patch: Callable[[pd.DataFrame, Dict[str, Set[int]]], pd.DataFrame]) -> pd.DataFrame:
+    """
+    DataFrame derivato dal modello, conservato in store[name] (es. session_state).
+    Se il modello è lo stesso applica solo le modifiche registrate, altrimenti ricostruisce.
+    """
+    revision = get_revision(model)
+    entry = store.get(name)
+    if entry and entry["ref"]() is model:
+        if entry["revision"] == revision:
+            return entry["frame"]
+        changes = changes_since(model, entry["revision"])
+        if changes is not None:
+            frame = patch(entry["frame"], changes)
+            store[name] = {"ref": entry["ref"], "revision": revision, "frame": frame}
+            return frame
+    frame = build()
+    store[name] = {"ref": weakref.ref(model), "revision": revision, "frame": frame}
+    return frame
+
+
+# ------------------------------
+# Copia su disco del modello (per validatori esterni)
+# ------------------------------
+
+@contextlib.contextmanager
+def model_on_disk(model, source_path: Optional[str] = None):
+    """
+    Percorso di un file IFC con lo stesso contenuto del modello in memoria.
+    Se il modello non è stato modificato in app e source_path esiste (es. session.temp_ifc_path)
+    si usa quel file; altrimenti il modello è serializzato in un file temporaneo, rimosso all'uscita.
+    """
+    if isinstance(model, (str, os.PathLike)):
+        yield str(model)
+        return
+    if source_path and not is_dirty(model) and os.path.isfile(source_path):
+        yield str(source_path)
+        return
+    fd, path = tempfile.mkstemp(suffix=".ifc")
+    os.close(fd)
+    try:
+        model.write(path)
+        yield path
+    finally:
+        try:
+            os.unlink(path)
+        except Exception:
+            pass
@@ -1,4 +1,4 @@
-from tools import ifc_3D
+from tools import p_shared
 import plotly.express as px
 import pandas as pd
 
@@ -27,9 +27,11 @@ style = {
 # 📈 Grafico: Conteggio elementi di IfcBuildingElement
 # ========================================================
 def get_elements_graph(file, color="#00FFAA", title="Building Objects Count"):
-    types = ifc_3D.get_types(file, "IfcBuildingElement")
-    types_count = ifc_3D.get_type_occurence(file, types)
-    x_values, y_values = ifc_3D.get_x_and_y(types_count)
+    # IFC4X3 rinomina IfcBuildingElement in IfcBuiltElement
+    schema = str(getattr(file, "schema", "")).upper()
+    types = p_shared.get_types(file, "IfcBuiltElement" if "IFC4X3" in schema else "IfcBuildingElement")
+    types_count = p_shared.get_type_occurence(file, types)
+    x_values, y_values = p_shared.get_x_and_y(types_count)
 
     if not x_values or not y_values:
         fig = px.bar(title=title)
@@ -65,9 +67,9 @@ def get_elements_graph(file, color="#00FFAA", title="Building Objects Count"):
 def get_high_frequency_entities_graph(
     file, threshold=400, color="#FF3333", title="IFC Entity Types Frequency"
 ):
-    types = ifc_3D.get_types(file)
-    types_count = ifc_3D.get_type_occurence(file, types)
-    x_values, y_values = ifc_3D.get_x_and_y(types_count, higher_then=threshold)
+    types = p_shared.get_types(file)
+    types_count = p_shared.get_type_occurence(file, types)
+    x_values, y_values = p_shared.get_x_and_y(types_count, higher_then=threshold)
 
     if not x_values or not y_values:
         fig = px.bar(title=title)
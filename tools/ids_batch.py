@@ -0,0 +1,186 @@
+"""
+Validazione IDS in batch: una cartella di modelli IFC contro uno o più IDS (fuori da Streamlit)
+
+Uso: python -m tools.ids_batch path/to/models rules.ids [altro.ids ...] [--out DIR] [--workers N]
+Funzioni:
+- load_ids_rules(path): regole da IDS XML (.ids/.xml) o IDS JSON esportato dalla pagina 2
+- find_ifc_files(folder, pattern, recursive): modelli da validare, in ordine di nome
+- validate_ifc_file(ifc_path, ids_sets): valida un modello con tutti gli IDS (eseguita in un worker)
+- validate_batch(folder, ids_paths, out_dir, workers): process pool (un modello per worker),
+  risultati consolidati in Parquet + riepilogo CSV con i tempi per file
+
+Il risultato ha le colonne di p2_ids.validate_ifc_with_ids più IfcFile (percorso relativo alla
+cartella, così modelli omonimi in sottocartelle diverse restano distinti) e IdsFile.
+"""
+
+# Commenti in italiano, output in inglese
+
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import os
+import time
+
+import pandas as pd
+
+from tools import p2_ids as p2
+from tools.p6_prop_qtt import write_columnar
+from tools.pathhelper import ensure_data_dir
+
+BATCH_COLUMNS = ['IfcFile', 'IdsFile'] + p2.IDS_RESULT_COLUMNS
+BATCH_DICTIONARY_COLUMNS = ('IfcFile', 'IdsFile', 'IFCClass', 'PropertySet', 'PropertyName')
+SUMMARY_COLUMNS = ['IfcFile', 'IdsFile', 'Elements', 'Checks', 'Passed', 'Failed', 'ComplianceRate',
+                   'OpenSeconds', 'ValidateSeconds', 'Error']
+
+
+def load_ids_rules(path: str | Path) -> List[Dict[str, Any]]:
+    """Regole IDS semplificate da un file IDS XML (lettura in streaming) o da un IDS JSON (lista di regole)."""
+    path = Path(path)
+    if path.suffix.lower() == '.json':
+        data = json.loads(path.read_text(encoding='utf-8'))
+        return [r for r in data if isinstance(r, dict) and 'properties' in r] if isinstance(data, list) else []
+    return p2.parse_ids_xml(str(path))
+
+
+def _value_text(v: Any) -> Optional[str]:
+    return None if v is None or (isinstance(v, float) and v != v) else str(v)
+
+
+def find_ifc_files(folder: str | Path, pattern: str = '*.ifc', recursive: bool = False) -> List[Path]:
+    """File IFC della cartella (ordinati per nome, per un output riproducibile)."""
+    folder = Path(folder)
+    files = folder.rglob(pattern) if recursive else folder.glob(pattern)
+    return sorted(p for p in files if p.is_file())
+
+
+def _file_label(path: Path, folder: str | Path) -> str:
+    # Percorso relativo alla cartella (separatore '/'), il nome del file se non è sotto la cartella
+    try:
+        return Path(path).relative_to(Path(folder)).as_posix()
+    except ValueError:
+        return Path(path).name
+
+
+def validate_ifc_file(ifc_path: str, ids_sets: Dict[str, List[Dict[str, Any]]],
+                      label: Optional[str] = None) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    """
+    Apre un modello e lo valida con ogni IDS (piano compilato riusato, Pset letti una volta).
+    label: valore di IfcFile (default: nome del file).
+    Ritorna (risultati con IfcFile/IdsFile, righe di riepilogo per IDS). Entry point dei worker.
+    """
+    import ifcopenshell
+    name = label or Path(ifc_path).name
+    t0 = time.perf_counter()
+    try:
+        model = ifcopenshell.open(ifc_path)
+    except Exception as e:
+        rows = [_summary_row(name, ids_name, None, time.perf_counter() - t0, 0.0, f"Cannot open IFC: {e}")
+                for ids_name in ids_sets]
+        return pd.DataFrame(columns=BATCH_COLUMNS), rows
+    open_seconds = time.perf_counter() - t0
+
+    frames, rows = [], []
+    for ids_name, rules in ids_sets.items():
+        t1 = time.perf_counter()
+        try:
+            df = p2.validate_ifc_with_ids(model, rules)
+            error = None
+        except Exception as e:
+            df, error = pd.DataFrame(columns=p2.IDS_RESULT_COLUMNS), str(e)
+        # Valori come testo: le entità IFC (fallback sugli attributi) non tornano dal worker
+        df = df.assign(Value=df['Value'].map(_value_text), IfcFile=name, IdsFile=ids_name)[BATCH_COLUMNS]
+        rows.append(_summary_row(name, ids_name, df, open_seconds, time.perf_counter() - t1, error))
+        frames.append(df)
+    p2.clear_ids_plan_cache()
+    return pd.concat(frames, ignore_index=True), rows
+
+
+def _summary_row(ifc_name: str, ids_name: str, df: Optional[pd.DataFrame], open_seconds: float,
+                 validate_seconds: float, error: Optional[str]) -> Dict[str, Any]:
+    # Stesso riepilogo della pagina IDS (livello 'all')
+    overall = p2.compliance_level(p2.compliance_summary(df), 'all')
+    checks = int(overall['Total'].iloc[0]) if not overall.empty else 0
+    passed = int(overall['Passed'].iloc[0]) if not overall.empty else 0
+    return {
+        'IfcFile': ifc_name,
+        'IdsFile': ids_name,
+        'Elements': 0 if df is None else int(df['ElementID'].nunique()),
+        'Checks': checks,
+        'Passed': passed,
+        'Failed': checks - passed,
+        'ComplianceRate': float(overall['ComplianceRate'].iloc[0]) if checks else None,
+        'OpenSeconds': round(open_seconds, 3),
+        'ValidateSeconds': round(validate_seconds, 3),
+        'Error': error,
+    }
+
+
+def validate_batch(folder: str | Path, ids_paths: Sequence[str | Path], out_dir: Optional[str | Path] = None,
+                   workers: Optional[int] = None, pattern: str = '*.ifc', recursive: bool = False) -> Dict[str, Any]:
+    """
+    Valida tutti i modelli della cartella contro gli IDS indicati.
+    workers: processi (default: min(file, CPU)); 1 = tutto nel processo corrente.
+    Scrive in out_dir ids_batch_results.parquet e ids_batch_summary.csv; ritorna
+    {'results', 'summary', 'parquet', 'csv', 'seconds'}.
+    """
+    t0 = time.perf_counter()
+    ids_sets = {Path(p).name: load_ids_rules(p) for p in ids_paths}
+    files = find_ifc_files(folder, pattern, recursive)
+    labels = {str(p): _file_label(p, folder) for p in files}
+    if workers is None:
+        workers = min(len(files), os.cpu_count() or 1)
+    workers = max(1, int(workers))
+
+    outputs: Dict[str, Tuple[pd.DataFrame, List[Dict[str, Any]]]] = {}
+    if workers == 1 or len(files) <= 1:
+        for path in files:
+            outputs[str(path)] = validate_ifc_file(str(path), ids_sets, labels[str(path)])
+    else:
+        import concurrent.futures as cf
+        import multiprocessing as mp
+        # spawn: come in p6_prop_qtt, fork non è sicuro da un processo multi-thread
+        ctx = mp.get_context("spawn")
+        with cf.ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+            futures = {pool.submit(validate_ifc_file, str(path), ids_sets, labels[str(path)]): str(path) for path in files}
+            for fut in cf.as_completed(futures):
+                path = futures[fut]
+                try:
+                    outputs[path] = fut.result()
+                except Exception as e:
+                    rows = [_summary_row(labels[path], n, None, 0.0, 0.0, f"Worker failed: {e}") for n in ids_sets]
+                    outputs[path] = (pd.DataFrame(columns=BATCH_COLUMNS), rows)
+
+    # Ordine dei file in input, indipendente dall'ordine di completamento
+    ordered = [outputs[str(p)] for p in files]
+    frames = [df for df, _ in ordered if not df.empty]
+    results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=BATCH_COLUMNS)
+    summary = pd.DataFrame([row for _, rows in ordered for row in rows], columns=SUMMARY_COLUMNS)
+
+    if out_dir is None:
+        out_dir = ensure_data_dir() / f"ids_batch_{datetime.now():%Y%m%d_%H%M%S}"
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    parquet_path = write_columnar(results, out_dir / "ids_batch_results.parquet", 'parquet',
+                                  dictionary_columns=BATCH_DICTIONARY_COLUMNS)
+    csv_path = out_dir / "ids_batch_summary.csv"
+    summary.to_csv(csv_path, index=False)
+    return {'results': results, 'summary': summary, 'parquet': parquet_path, 'csv': csv_path,
+            'seconds': round(time.perf_counter() - t0, 3)}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Validate a folder of IFC models against one or more IDS files.")
+    parser.add_argument("folder", help="folder containing the IFC models")
+    parser.add_argument("ids", nargs="+", help="IDS files (.ids/.xml, or IDS JSON exported from page 2)")
+    parser.add_argument("--out", help="output folder (default: static/temp_file/ids_batch_<timestamp>)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one model each (default: CPU count)")
+    parser.add_argument("--pattern", default="*.ifc", help="file pattern (default: *.ifc)")
+    parser.add_argument("--recursive", action="store_true", help="also search subfolders")
+    args = parser.parse_args()
+
+    out = validate_batch(args.folder, args.ids, args.out, args.workers, args.pattern, args.recursive)
+    print(out['summary'].to_string(index=False))
+    print(f"\nResults: {out['parquet']}\nSummary: {out['csv']}\nTotal: {out['seconds']:.1f}s")
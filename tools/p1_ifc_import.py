@@ -4,7 +4,10 @@ Helper per Pagina 1 — IFC Import
 Uso: funzioni chiamate da pages/1_IFC Import.py
 Funzioni previste:
 - save_uploaded_file_to_temp(file, temp_dir): salva il file nel temp
-- detect_schema(ifc_path): rileva lo schema IFC (stringa tipo 'IFC4X3')
+- read_ifc_header(source): legge solo il HEADER STEP (FILE_SCHEMA, FILE_NAME, FILE_DESCRIPTION) in millisecondi
+- detect_schema(ifc_path): rileva lo schema IFC (stringa tipo 'IFC4X3') dal header
+- strip_utf8_bom(data): bytes del file senza BOM UTF-8 iniziale (copia aperta da ifcopenshell)
+- open_ifc_async(ifc_path, previous) / finish_ifc_open(state): parsing completo del modello in background (Future, un thread per apertura)
 - build_session_state(file_path): produce info utili per la sessione
 
 Nota: modulo auto-contenuto. Copiare funzioni in altri helper se servono altrove.
@@ -14,10 +17,16 @@ Nota: modulo auto-contenuto. Copiare funzioni in altri helper se servono altrove
 
 from __future__ import annotations
 from pathlib import Path
-from typing import Dict, Optional
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+import codecs
+import re
 import shutil
+import threading
 import ifcopenshell
 
+from tools import changetracker
+
 
 def save_uploaded_file_to_temp(src_path: Path, temp_dir: Path) -> Path:
     """Salva/copia il file caricato nella cartella temporanea e ritorna il path di destinazione."""
@@ -28,14 +37,197 @@ def save_uploaded_file_to_temp(src_path: Path, temp_dir: Path) -> Path:
     return dst
 
 
+# ------------------------------
+# HEADER STEP (ISO 10303-21) — lettura senza parsing del modello
+# ------------------------------
+
+HEADER_MAX_BYTES = 1024 * 1024
+_HEADER_CHUNK = 64 * 1024
+_HEADER_RECORDS = ('FILE_DESCRIPTION', 'FILE_NAME', 'FILE_SCHEMA')
+
+
+def _decode_step_string(text: str) -> str:
+    # Codifiche delle stringhe STEP: \X2\hhhh...\X0\ (UTF-16), \X4\ (UTF-32), \X\hh (ISO 8859-1), \S\c
+    def wide(match, width):
+        hexs = match.group(1)
+        return ''.join(chr(int(hexs[i:i + width], 16)) for i in range(0, len(hexs), width))
+    text = re.sub(r'\\X2\\([0-9A-Fa-f]*)\\X0\\', lambda m: wide(m, 4), text)
+    text = re.sub(r'\\X4\\([0-9A-Fa-f]*)\\X0\\', lambda m: wide(m, 8), text)
+    text = re.sub(r'\\X\\([0-9A-Fa-f]{2})', lambda m: chr(int(m.group(1), 16)), text)
+    text = re.sub(r'\\S\\(.)', lambda m: chr(ord(m.group(1)) + 128), text)
+    return text.replace('\\\\', '\\')
+
+
+def _parse_step_arguments(text: str, pos: int = 0) -> Tuple[List[Any], int]:
+    # Argomenti di un record del header a partire da '(': stringhe, liste annidate, $ / * (None), altri token come testo
+    assert text[pos] == '('
+    pos += 1
+    values: List[Any] = []
+    while pos < len(text):
+        ch = text[pos]
+        if ch in ' \t\r\n,':
+            pos += 1
+        elif ch == ')':
+            return values, pos + 1
+        elif ch == '(':
+            inner, pos = _parse_step_arguments(text, pos)
+            values.append(inner)
+        elif ch == "'":
+            end = pos + 1
+            chunks = []
+            while end < len(text):
+                if text[end] == "'":
+                    if text[end + 1:end + 2] == "'":
+                        chunks.append("'")
+                        end += 2
+                        continue
+                    break
+                chunks.append(text[end])
+                end += 1
+            values.append(_decode_step_string(''.join(chunks)))
+            pos = end + 1
+        else:
+            match = re.match(r"[^,()]+", text[pos:])
+            token = match.group(0).strip() if match else ''
+            values.append(None if token in ('$', '*') else token)
+            pos += max(1, len(match.group(0)) if match else 1)
+    return values, pos
+
+
+def _read_header_text(source: Any) -> Optional[str]:
+    # Testo tra HEADER; ed ENDSEC; letto a blocchi dall'inizio del file (al massimo HEADER_MAX_BYTES)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        data = bytes(source[:HEADER_MAX_BYTES])
+    else:
+        data = b''
+        with open(source, 'rb') as f:
+            while len(data) < HEADER_MAX_BYTES:
+                chunk = f.read(_HEADER_CHUNK)
+                if not chunk:
+                    break
+                data += chunk
+                if b'ENDSEC' in data:
+                    break
+    # BOM UTF-8 iniziale (alcuni esportatori lo scrivono) prima di ISO-10303-21
+    text = data.decode('latin-1').removeprefix('\xef\xbb\xbf')
+    if not text.lstrip().upper().startswith('ISO-10303-21'):
+        return None
+    start = text.upper().find('HEADER;')
+    end = text.upper().find('ENDSEC', start)
+    if start < 0 or end < 0:
+        return None
+    # I commenti /* ... */ sono ammessi anche nel header
+    return re.sub(r'/\*.*?\*/', '', text[start + len('HEADER;'):end], flags=re.S)
+
+
+def read_ifc_header(source: Any) -> Dict[str, Any]:
+    """Legge solo la sezione HEADER di un file IFC STEP (path o bytes), senza aprire il modello.
+
+    Ritorna schema (primo di FILE_SCHEMA), schemas, description, view_definition, implementation_level,
+    name, time_stamp, author, organization, preprocessor_version, originating_system, authorization.
+    {} se il file non è STEP (es. .ifczip, .ifcXML) o il header non è leggibile.
+    """
+    try:
+        text = _read_header_text(source)
+    except Exception:
+        return {}
+    if text is None:
+        return {}
+    records: Dict[str, List[Any]] = {}
+    for match in re.finditer(r'([A-Z_][A-Z0-9_]*)\s*\(', text, flags=re.I):
+        name = match.group(1).upper()
+        if name in _HEADER_RECORDS and name not in records:
+            try:
+                records[name], _ = _parse_step_arguments(text, match.end() - 1)
+            except (AssertionError, IndexError):
+                continue
+
+    def arg(record: str, index: int, default: Any = None) -> Any:
+        values = records.get(record) or []
+        return values[index] if index < len(values) and values[index] is not None else default
+
+    def as_list(value: Any) -> List[str]:
+        items = value if isinstance(value, list) else [value] if value is not None else []
+        return [str(v) for v in items if v not in (None, '')]
+
+    schemas = as_list(arg('FILE_SCHEMA', 0))
+    description = as_list(arg('FILE_DESCRIPTION', 0))
+    view = next((m.group(1) for d in description for m in [re.search(r'ViewDefinition\s*\[([^\]]*)\]', d)] if m), None)
+    return {
+        'schema': schemas[0].upper() if schemas else '',
+        'schemas': schemas,
+        'description': description,
+        'view_definition': view,
+        'implementation_level': arg('FILE_DESCRIPTION', 1),
+        'name': arg('FILE_NAME', 0),
+        'time_stamp': arg('FILE_NAME', 1),
+        'author': as_list(arg('FILE_NAME', 2)),
+        'organization': as_list(arg('FILE_NAME', 3)),
+        'preprocessor_version': arg('FILE_NAME', 4),
+        'originating_system': arg('FILE_NAME', 5),
+        'authorization': arg('FILE_NAME', 6),
+    }
+
+
+def strip_utf8_bom(data: bytes) -> bytes:
+    """Rimuove il BOM UTF-8 iniziale: ifcopenshell.open non legge il header di un file che lo contiene."""
+    return data[len(codecs.BOM_UTF8):] if data.startswith(codecs.BOM_UTF8) else data
+
+
 def detect_schema(ifc_path: Path) -> str:
-    """Apre il file IFC e ritorna lo schema (es. 'IFC2X3', 'IFC4', 'IFC4X3')."""
+    """Ritorna lo schema del file IFC (es. 'IFC2X3', 'IFC4', 'IFC4X3_ADD2') leggendo solo il header;
+    apre il modello solo se il header non è leggibile (es. .ifczip)."""
+    schema = read_ifc_header(ifc_path).get('schema')
+    if schema:
+        return schema
     try:
         m = ifcopenshell.open(str(ifc_path))
         return getattr(m.schema, 'schema_identifier', str(m.schema))
     except Exception:
         return ""
 
+# Il parsing completo avviene fuori dal callback della pagina
+# Un solo worker: il parsing completo avviene fuori dal callback della pagina
+def open_ifc_async(ifc_path: Path, previous: Optional[Future] = None) -> Future:
+    """Avvia ifcopenshell.open in background e ritorna il Future (il header si legge subito con read_ifc_header).
+    Un thread per apertura: le sessioni non si accodano l'una dietro l'altra. previous è il Future
+    ancora in sospeso della stessa sessione (nuovo upload): viene annullato se non è partito,
+    altrimenti il suo risultato è semplicemente scartato."""
+    if previous is not None:
+        previous.cancel()
+    future: Future = Future()
+
+    def _run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(ifcopenshell.open(str(ifc_path)))
+        except BaseException as e:
+            future.set_exception(e)
+
+    # Non daemon: un parsing interrotto a metà alla chiusura dell'interprete manda in crash il processo
+    threading.Thread(target=_run, name="ifc-open").start()
+    return future
+
+
+def finish_ifc_open(state: Any, key: str = "ifc_loading") -> Optional[str]:
+    """Attende il parsing avviato con open_ifc_async (state[key]) e imposta state['ifc_file'] / ['ifc_schema'].
+    Ritorna il messaggio di errore, None se ok o se non c'è nulla in corso."""
+    future = state.get(key)
+    if future is None:
+        return None
+    try:
+        model = future.result()
+    except Exception as e:
+        return str(e)
+    finally:
+        state.pop(key, None)
+    # Revisione 0 = il modello come caricato (base per il rilevamento delle modifiche)
+    changetracker.register(model)
+    state["ifc_file"] = model
+    state["ifc_schema"] = model.schema
+    return None
+
 
 def build_session_state(file_path: Path) -> Dict[str, str]:
     """Costruisce il pacchetto base di informazioni da salvare in sessione."""
@@ -3,32 +3,50 @@ Helper per Pagina 2 — IDS (Information Delivery Specification)
 
 Uso: pages/2_IDS - Information Delivery Specification.py
 Funzioni:
-- validate_ifc_with_ids(model, ids_rules): esegue la validazione IDS
+- validate_ifc_with_ids(model, ids_rules): esegue la validazione IDS (motore vettoriale)
+- compile_ids_rules / get_ids_plan: piano per applicabilità (classe + PredefinedType), memoizzato per (hash IDS, hash modello)
+- build_ids_tables / evaluate_ids_rules: tabelle long-form estratte una volta e valutazione con join pandas
+- revalidate_ids_rules(model, ids_rules, state): validazione incrementale, rivaluta solo le regole aggiunte/modificate
+- compliance_summary(df) / compliance_level(summary, level): superati/falliti per modello, classe, Pset, proprietà (memoizzato)
+- violation_index(df, model) / failing_rows / elements_failing_more_than: drill-down O(1) per elemento, requisito, piano
 - export_ids_report(results): produce bytes di report (CSV/JSON)
-- audit_ids_xml(xml_bytes): valida l'IDS XML (IDS-Audit-tool se disponibile, altrimenti XSD)
-- validate_ifc_with_ids_xml_official(ifc_file, ids_xml_bytes): prova a usare il validator ufficiale via CLI
+- iter_ids_rules / parse_ids_xml(source): lettura in streaming (iterparse) di un IDS XML in regole
+- audit_ids_xml(xml_bytes): valida l'IDS XML (IDS-Audit-tool se disponibile, altrimenti XSD locale offline)
+- validate_ifc_with_ids_xml_official(ifc_file, ids_xml_bytes, source_path): ifctester in-process, altrimenti CLI
 """
 
 # Commenti in italiano, output per l'utente in inglese
 
 from __future__ import annotations
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Dict, Iterator, List, Tuple, Optional
+from collections import OrderedDict
+import hashlib
+import importlib.util
 import json
 import io
+import math
 import os
+import shutil
 import tempfile
 import subprocess
+import weakref
 import xml.etree.ElementTree as ET
 
 import ifcopenshell
+import numpy as np
 import pandas as pd
 from ifcopenshell.util import element as ifc_element
+from tools import changetracker, xsdhelper
+from tools.p_shared import get_relationship_index, index_get_psets, index_get_storey
+
+# ifctester (IfcOpenShell) permette la validazione IDS in-process sul modello già aperto
+IFCTESTER_AVAILABLE = importlib.util.find_spec("ifctester") is not None
 
 
 # ------------------------------
 # Utility: genera un IDS XML minimo da regole semplificate
 # ------------------------------
-def ids_rules_to_xml(ids_rules: List[Dict[str, Any]], title: str = "Dynamic IDS", ifc_version: str = "IFC4X3") -> str:
+def ids_rules_to_xml(ids_rules: List[Dict[str, Any]], title: str = "Dynamic IDS", ifc_version: str = "IFC4X3_ADD2") -> str:
     ns = {
         'xs': 'http://www.w3.org/2001/XMLSchema',
         'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
@@ -56,6 +74,9 @@ def ids_rules_to_xml(ids_rules: List[Dict[str, Any]], title: str = "Dynamic IDS"
         entity = ET.SubElement(appl, f"{{{ns['ids']}}}entity")
         name_el = ET.SubElement(entity, f"{{{ns['ids']}}}name")
         ET.SubElement(name_el, f"{{{ns['ids']}}}simpleValue").text = rule.get('ifc_class', '')
+        if rule.get('predefined_type'):
+            ptype_el = ET.SubElement(entity, f"{{{ns['ids']}}}predefinedType")
+            ET.SubElement(ptype_el, f"{{{ns['ids']}}}simpleValue").text = str(rule['predefined_type']).upper()
 
         reqs = ET.SubElement(spec, f"{{{ns['ids']}}}requirements")
         for prop in rule.get('properties', []):
@@ -80,6 +101,93 @@ def ids_rules_to_xml(ids_rules: List[Dict[str, Any]], title: str = "Dynamic IDS"
     return ET.tostring(root, encoding='utf-8').decode('utf-8')
 
 
+# ------------------------------
+# Lettura IDS XML in streaming (iterparse): una regola per specification
+# ------------------------------
+_LOCAL_NAMES: Dict[str, str] = {}
+
+
+def _local_name(tag: str) -> str:
+    # '{namespace}name' -> 'name', memoizzato: il namespace è risolto una volta per tag distinto
+    name = _LOCAL_NAMES.get(tag)
+    if name is None:
+        name = _LOCAL_NAMES[tag] = tag.rpartition('}')[2]
+    return name
+
+
+def iter_ids_rules(source: Any) -> Iterator[Dict[str, Any]]:
+    """Legge un IDS XML (bytes, percorso o file-like) ed emette una regola per specification,
+    nello stesso formato di ids_rules_to_xml: {'ifc_class', 'properties', ['predefined_type']}.
+
+    - ifc_class: entity/name dell'applicability (altrimenti dal nome della specification)
+    - properties: i facet property dei requirements (propertySet, baseName, cardinality,
+      enumerazioni o simpleValue del value come allowed_values)
+    Ogni specification è rilasciata dopo l'emissione: la memoria non cresce con il file.
+    Solleva ET.ParseError se il contenuto non è XML.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    stack: List[str] = []
+    elements: List[Any] = []
+    rule: Optional[Dict[str, Any]] = None
+    prop: Optional[Dict[str, Any]] = None
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        name = _local_name(elem.tag)
+        if event == 'start':
+            stack.append(name)
+            elements.append(elem)
+            if name == 'specification':
+                rule = {'name': elem.get('name', ''), 'ifc_class': '', 'predefined_type': '', 'properties': []}
+            elif name == 'property' and rule is not None and 'requirements' in stack:
+                card = elem.get('cardinality') or ''
+                prop = {'property_set': '', 'property_name': '', 'mandatory': card.lower().startswith('required'),
+                        'allowed_values': None}
+            continue
+
+        stack.pop()
+        elements.pop()
+        if rule is None:
+            continue
+        parent = stack[-1] if stack else ''
+        if name == 'simpleValue':
+            text = (elem.text or '').strip()
+            if prop is not None:
+                if parent == 'propertySet':
+                    prop['property_set'] = text
+                elif parent == 'baseName':
+                    prop['property_name'] = text
+                elif parent == 'value' and text:
+                    prop['allowed_values'] = [text]
+            elif 'applicability' in stack and len(stack) >= 2 and stack[-2] == 'entity':
+                if parent == 'name' and not rule['ifc_class']:
+                    rule['ifc_class'] = text
+                elif parent == 'predefinedType':
+                    rule['predefined_type'] = text
+        elif name == 'enumeration' and prop is not None and 'value' in stack:
+            value = elem.get('value') or elem.text
+            if value:
+                prop['allowed_values'] = (prop['allowed_values'] or []) + [value]
+        elif name == 'property' and prop is not None:
+            rule['properties'].append(prop)
+            prop = None
+        elif name == 'specification':
+            out = {'ifc_class': rule['ifc_class'] or rule['name'].replace('Requirement for ', ''),
+                   'properties': rule['properties']}
+            if rule['predefined_type']:
+                out['predefined_type'] = rule['predefined_type']
+            rule = None
+            # Libera la specification già letta (e il suo posto nel genitore)
+            elem.clear()
+            if elements:
+                elements[-1].remove(elem)
+            yield out
+
+
+def parse_ids_xml(source: Any) -> List[Dict[str, Any]]:
+    """Tutte le regole di un IDS XML (vedi iter_ids_rules)."""
+    return list(iter_ids_rules(source))
+
+
 # ------------------------------
 # IDS Audit: usa IDS-Audit-tool se presente, altrimenti valida con XSD
 # ------------------------------
@@ -112,18 +220,14 @@ def audit_ids_xml(xml_bytes: bytes) -> Tuple[bool, str]:
         # errore inaspettato nel CLI
         return False, f"IDS-Audit-tool error: {e}"
 
-    # 2) Fallback: XSD validation
+    # 2) Fallback: XSD validation offline (schema IDS locale, compilato una volta per processo)
+    if not xsdhelper.XMLSCHEMA_AVAILABLE:
+        return False, "XSD validation failed: xmlschema is not installed."
     try:
-        import xmlschema
-        schema = xmlschema.XMLSchema("http://standards.buildingsmart.org/IDS/1.0/ids.xsd")
-        is_valid = schema.is_valid(io.BytesIO(xml_bytes))
-        if is_valid:
-            return True, "XML is valid against IDS XSD (fallback)."
-        # collect errors
-        errors = []
-        for e in schema.iter_errors(io.BytesIO(xml_bytes)):
-            errors.append(str(e))
-        return False, "\n".join(errors[:50])
+        ok, errors = xsdhelper.validate_ids_xsd(xml_bytes)
+        if ok:
+            return True, "XML is valid against the official buildingSMART IDS 1.0 XSD (offline copy, fallback)."
+        return False, "\n".join(errors)
     except Exception as e:
         return False, f"XSD validation failed: {e}"
 
@@ -132,25 +236,6 @@ def audit_ids_xml(xml_bytes: bytes) -> Tuple[bool, str]:
 # Validator ufficiale via CLI 'validate' (buildingSMART/validate)
 # ------------------------------
 
-def _ensure_ifc_path(ifc_file: Any) -> str:
-    if hasattr(ifc_file, 'by_type'):
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".ifc") as f:
-            path = f.name
-        try:
-            ifc_file.write(path)
-        except Exception:
-            # ultimo tentativo: serializzare come stringa
-            try:
-                with open(path, 'wb') as fw:
-                    fw.write(str(ifc_file).encode('utf-8'))
-            except Exception:
-                raise
-        return path
-    if isinstance(ifc_file, str):
-        return ifc_file
-    raise ValueError("Unsupported IFC input. Provide an ifcopenshell model or file path.")
-
-
 def _run_validate_cli(ids_path: str, ifc_path: str) -> Tuple[bool, Optional[str], Optional[str]]:
     candidates = [
         ["validate", "ids", "--format", "json", ids_path, ifc_path],
@@ -171,27 +256,46 @@ def _run_validate_cli(ids_path: str, ifc_path: str) -> Tuple[bool, Optional[str]
     return False, None, last_err
 
 
-def validate_ifc_with_ids_xml_official(ifc_file: Any, ids_xml_bytes: bytes, use_python_api: bool = True) -> Dict[str, Any]:
-    """Esegue la validazione IFC vs IDS XML. NOTA: Non esiste un validator IDS ufficiale come package Python separato.
-    buildingSMART/validate è un servizio web Django, non un validator IDS programmatico.
-    Ritorna un dict con keys: ok, stdout, error.
+def validate_ids_in_process(model: Any, ids_xml_bytes: bytes) -> Dict[str, Any]:
+    """Valida il modello già aperto con ifctester (nessuna scrittura su disco, nessun processo esterno).
+    Ritorna lo stesso dict della CLI: ok, stdout (report JSON), error, method.
+    """
+    from ifctester import ids as ifctester_ids, reporter
+    specs = ifctester_ids.from_string(ids_xml_bytes.decode('utf-8'))
+    specs.validate(model)
+    json_reporter = reporter.Json(specs)
+    report = json_reporter.report() or getattr(json_reporter, 'results', {})
+    return {"ok": True, "stdout": json.dumps(report, ensure_ascii=False, default=str), "error": None, "method": "in-process"}
+
+
+def validate_ifc_with_ids_xml_official(ifc_file: Any, ids_xml_bytes: bytes, use_python_api: bool = True,
+                                       source_path: Optional[str] = None) -> Dict[str, Any]:
+    """Esegue la validazione IFC vs IDS XML. Ritorna un dict con keys: ok, stdout, error, method.
+
+    - use_python_api e ifctester installato: validazione in-process sul modello già aperto
+    - altrimenti CLI 'validate': il file passato è source_path (es. session.temp_ifc_path) se il
+      modello non è stato modificato in app, e il modello è serializzato solo se modificato
     """
-    # NOTE: There is no official Python API for IDS validation.
-    # buildingSMART/validate is a Django web service for IFC validation (not IDS).
-    # buildingSMART/IDS-Audit-tool is a .NET CLI for auditing IDS XML structure.
-    # We use the existing custom validator as fallback.
-    
+    in_process_error = None
+    if use_python_api and IFCTESTER_AVAILABLE and hasattr(ifc_file, 'by_type'):
+        try:
+            return validate_ids_in_process(ifc_file, ids_xml_bytes)
+        except Exception as e:
+            in_process_error = f"In-process IDS validation failed: {e}"
+
+    # Senza CLI non serve preparare alcun file
+    if shutil.which("validate") is None:
+        error = "validate CLI not found. Install buildingSMART/validate or ifctester."
+        return {"ok": False, "stdout": None, "error": in_process_error or error, "method": "cli"}
+
     ids_tmp = None
-    ifc_tmp = None
     try:
         with tempfile.NamedTemporaryFile(delete=False, suffix=".ids") as f:
             f.write(ids_xml_bytes)
             f.flush()
             ids_tmp = f.name
-        ifc_tmp = _ensure_ifc_path(ifc_file)
-        
-        # Try CLI validate tool (though this may not be IDS-specific)
-        ok, out, err = _run_validate_cli(ids_tmp, ifc_tmp)
+        with changetracker.model_on_disk(ifc_file, source_path) as ifc_path:
+            ok, out, err = _run_validate_cli(ids_tmp, ifc_path)
         return {"ok": ok, "stdout": out, "error": err, "method": "cli"}
     finally:
         if ids_tmp and os.path.exists(ids_tmp):
@@ -199,87 +303,628 @@ def validate_ifc_with_ids_xml_official(ifc_file: Any, ids_xml_bytes: bytes, use_
                 os.unlink(ids_tmp)
             except Exception:
                 pass
-        # if ifc_tmp was a temp file we created, it ends with tmp suffix
-        try:
-            if ifc_tmp and os.path.exists(ifc_tmp) and ifc_tmp.endswith('.ifc') and not isinstance(ifc_file, str):
-                os.unlink(ifc_tmp)
-        except Exception:
-            pass
 
 
 # ------------------------------
 # VALIDATORE (fallback corrente) — mantiene l'output DataFrame per la UI
 # ------------------------------
 
-def validate_ifc_with_ids(ifc_file: Any, ids_rules: List[Dict[str, Any]]):
+IDS_RESULT_COLUMNS = ['ElementID', 'ElementName', 'IFCClass', 'PropertySet', 'PropertyName', 'Value', 'Compliant']
+MAX_CACHED_PLANS = 8
+
+# (hash IDS, hash modello:revisione) -> piano compilato + tabelle, LRU
+_PLAN_CACHE: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+
+
+def _applicability_key(rule: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    # Applicabilità di una regola: classe IFC + PredefinedType opzionale (maiuscolo, '' = qualsiasi)
+    class_name = rule.get('ifc_class')
+    if not class_name:
+        return None
+    return class_name, str(rule.get('predefined_type') or '').upper()
+
+
+def _requirement_key(prop_rule: Dict[str, Any]) -> Tuple[Any, ...]:
+    # Requisito normalizzato: due proprietà con la stessa chiave danno lo stesso risultato
+    allowed = prop_rule.get('allowed_values') or prop_rule.get('values')
+    return (prop_rule.get('property_set', '') or '', prop_rule.get('property_name', '') or '',
+            bool(prop_rule.get('mandatory', False)), tuple(str(a) for a in allowed) if allowed else None)
+
+
+def ids_rules_hash(ids_rules: List[Dict[str, Any]]) -> str:
+    """SHA-256 delle regole IDS (JSON canonico), usato come chiave del piano compilato."""
+    payload = json.dumps(ids_rules or [], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def compile_ids_rules(ids_rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compila le regole in un piano di esecuzione indipendente dal modello.
+
+    - applicabilities: (classe, PredefinedType) -> requisiti distinti da valutare su quegli elementi
+    - requirements: chiave requisito -> regola di proprietà (una valutazione per coppia applicabilità/requisito)
+    - steps: per regola (nell'ordine originale) la sua applicabilità e i requisiti per proprietà
+    - psets: nomi dei Pset richiesti (minuscoli), None se serve leggere tutti i Pset
+    """
+    applicabilities: Dict[Tuple[str, str], List[Tuple[Any, ...]]] = {}
+    requirements: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    steps = []
+    psets: Optional[set] = set()
+    for r_idx, rule in enumerate(ids_rules or []):
+        app = _applicability_key(rule)
+        if app is None:
+            continue
+        reqs = applicabilities.setdefault(app, [])
+        keys = []
+        for prop_rule in rule.get('properties', []):
+            key = _requirement_key(prop_rule)
+            requirements.setdefault(key, prop_rule)
+            if key not in reqs:
+                reqs.append(key)
+            keys.append(key)
+            # Senza Pset la proprietà si cerca in tutti i Pset dell'elemento
+            if psets is not None:
+                if key[0]:
+                    psets.add(key[0].lower())
+                elif key[1]:
+                    psets = None
+        steps.append((r_idx, app, keys))
+    return {
+        'applicabilities': applicabilities,
+        'requirements': requirements,
+        'steps': steps,
+        'psets': psets,
+        'rules': len(ids_rules or []),
+        'evaluations': sum(len(v) for v in applicabilities.values()),
+    }
+
+
+def _applicable_elements(model: Any, app: Tuple[str, str]) -> List[Any]:
+    # by_type include i sottotipi; il PredefinedType segue quello del tipo se l'occorrenza non lo dichiara
+    class_name, predefined = app
+    try:
+        elements = model.by_type(class_name) or []
+    except Exception:
+        return []
+    if not predefined:
+        return list(elements)
+    out = []
+    for obj in elements:
+        try:
+            value = ifc_element.get_predefined_type(obj)
+        except Exception:
+            value = getattr(obj, 'PredefinedType', None)
+        if str(value or '').upper() == predefined:
+            out.append(obj)
+    return out
+
+
+def build_ids_tables(model: Any, applicabilities: List[Any], index: Optional[Dict[str, Any]] = None,
+                     psets: Optional[set] = None) -> Dict[str, Any]:
+    """Estrae una sola volta le tabelle long-form usate dal motore vettoriale.
+
+    applicabilities: classi IFC o coppie (classe, PredefinedType), ciascuna risolta una sola volta.
+    psets: se indicato, solo i Pset con questi nomi (minuscoli) finiscono nelle tabelle.
+    - members: applicabilità -> [ExpressId] nell'ordine di model.by_type (sottotipi inclusi)
+    - elements: ExpressId, ElementID, ElementName
+    - sets: ExpressId, SetName, SetOrder, SetId, IdPos (ordine dei Pset come in get_psets, posizione di 'id')
+    - props: ExpressId, SetName, SetOrder, PropertyName, Value
+    - entities: ExpressId -> entità (per il fallback sugli attributi diretti)
+    """
+    if index is None:
+        index = get_relationship_index(model)
+    members: Dict[Tuple[str, str], List[int]] = {}
+    entities: Dict[int, Any] = {}
+    el_rows = []
+    for app in dict.fromkeys(applicabilities):
+        key = app if isinstance(app, tuple) else (app, '')
+        ids = []
+        for obj in _applicable_elements(model, key):
+            eid = obj.id()
+            ids.append(eid)
+            if eid in entities:
+                continue
+            entities[eid] = obj
+            element_id = getattr(obj, 'GlobalId', None) or getattr(obj, 'GlobalID', None) or eid
+            el_rows.append((eid, element_id, getattr(obj, 'Name', None) or '(Unnamed)'))
+        members[key] = ids
+
+    # Ogni elemento è letto una sola volta, qualunque sia il numero di regole che lo riguardano
+    set_rows, prop_rows = [], []
+    for eid in entities:
+        try:
+            element_psets = index_get_psets(index, eid)
+        except Exception:
+            element_psets = {}
+        for order, (set_name, props) in enumerate(element_psets.items()):
+            if psets is not None and str(set_name).lower() not in psets:
+                continue
+            keys = list(props)
+            set_rows.append((eid, set_name, order, props.get('id'), keys.index('id') if 'id' in props else len(keys)))
+            for pname, pval in props.items():
+                if pname != 'id':
+                    prop_rows.append((eid, set_name, order, pname, pval))
+
+    return {
+        'members': members,
+        'entities': entities,
+        'elements': pd.DataFrame(el_rows, columns=['ExpressId', 'ElementID', 'ElementName']),
+        'sets': pd.DataFrame(set_rows, columns=['ExpressId', 'SetName', 'SetOrder', 'SetId', 'IdPos']),
+        'props': pd.DataFrame(prop_rows, columns=['ExpressId', 'SetName', 'SetOrder', 'PropertyName', 'Value']),
+    }
+
+
+def _ids_value_text(v: Any) -> str:
+    # Le enumerazioni IDS sono stringhe; i booleani IFC diventano 'true'/'false'
+    if isinstance(v, bool):
+        return 'true' if v else 'false'
+    return str(v)
+
+
+def _ids_number(v: Any) -> Optional[float]:
+    # Numero (booleani esclusi) o testo numerico come float, altrimenti None
+    if isinstance(v, bool) or v is None:
+        return None
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return float(v)
+    try:
+        return float(str(v).strip())
+    except ValueError:
+        return None
+
+
+_IDS_NUMBER_TYPES = (int, float, np.integer, np.floating)
+
+
+def _ids_allowed_mask(values: pd.Series, allowed: List[Any]) -> pd.Series:
+    """Confronto vettoriale con allowed_values: testo esatto (isin), oppure numerico per i valori IFC
+    numerici (IfcReal 3.0 soddisfa '3'), con la tolleranza relativa 1e-6 dei reali IDS."""
+    texts = {str(a) for a in allowed}
+    numbers = np.array([n for n in (_ids_number(a) for a in allowed) if n is not None], dtype=float)
+    present = values.notna()
+    # Tipo Python per valore; le classi sono poche e vengono esaminate una volta ciascuna
+    kinds = values.map(type)
+    unique = set(kinds.unique())
+    bools = kinds.isin([t for t in unique if issubclass(t, (bool, np.bool_))])
+    numeric = kinds.isin([t for t in unique if issubclass(t, _IDS_NUMBER_TYPES) and not issubclass(t, (bool, np.bool_))])
+
+    # Le enumerazioni IDS sono stringhe; i booleani IFC diventano 'true'/'false'
+    text = values.astype(str)
+    if bools.any():
+        text = text.where(~bools, values.where(bools).map({True: 'true', False: 'false'}))
+    mask = present & text.isin(texts)
+    # Solo valori IFC numerici: un IfcLabel '3.0' resta diverso da '3'
+    if len(numbers) and numeric.any():
+        x = values[numeric].astype(float).to_numpy()[:, None]
+        close = np.abs(x - numbers) <= np.maximum(1e-6 * np.maximum(np.abs(x), np.abs(numbers)), 1e-12)
+        mask[numeric] = mask[numeric] | close.any(axis=1)
+    return mask
+
+
+def _set_dicts(props: pd.DataFrame, sets: pd.DataFrame, keys: pd.DataFrame) -> List[Optional[Dict[str, Any]]]:
+    """Ricostruisce il dict di un Pset (come get_psets, con 'id') per ogni coppia (ExpressId, SetName) di keys."""
+    wanted = keys.dropna(subset=['SetName'])
+    sub = props.merge(wanted[['ExpressId', 'SetName']].drop_duplicates(), on=['ExpressId', 'SetName'])
+    grouped: Dict[Tuple[int, Any], Dict[str, Any]] = {}
+    for eid, sname, pname, pval in zip(sub['ExpressId'], sub['SetName'], sub['PropertyName'], sub['Value']):
+        grouped.setdefault((eid, sname), {})[pname] = pval
+    set_ids = dict(zip(zip(sets['ExpressId'], sets['SetName']), zip(sets['SetId'], sets['IdPos'])))
+    out = []
+    for eid, sname in zip(keys['ExpressId'], keys['SetName']):
+        if sname is None or (eid, sname) not in set_ids:
+            out.append(None)
+            continue
+        set_id, id_pos = set_ids[(eid, sname)]
+        items = list(grouped.get((eid, sname), {}).items())
+        items.insert(int(id_pos), ('id', set_id))
+        out.append(dict(items))
+    return out
+
+
+def _evaluate_property_rule(ids: pd.Series, prop_rule: Dict[str, Any], sets: pd.DataFrame, props: pd.DataFrame,
+                            entities: Dict[int, Any]) -> pd.DataFrame:
+    """Valuta una proprietà richiesta su tutti gli elementi della regola (join vettoriali su sets/props)."""
+    pset_name = prop_rule.get('property_set', '') or ''
+    prop_name = prop_rule.get('property_name', '') or ''
+    mandatory = prop_rule.get('mandatory', False)
+    frame = pd.DataFrame({'ExpressId': ids.values})
+
+    # 1) Pset risolto per elemento: nome esatto, altrimenti il primo che coincide ignorando maiuscole
+    if pset_name:
+        exact = set(sets.loc[sets['SetName'] == pset_name, 'ExpressId'])
+        ci = sets[(sets['SetName'].str.lower() == pset_name.lower()) & ~sets['ExpressId'].isin(exact)]
+        ci = ci.sort_values('SetOrder', kind='stable').drop_duplicates('ExpressId')
+        resolved = frame['ExpressId'].map(dict(zip(ci['ExpressId'], ci['SetName'])))
+        resolved = resolved.astype(object).where(~frame['ExpressId'].isin(exact), pset_name)
+        set_names = resolved.where(resolved.notna(), None)
+    elif prop_name == 'ALL':
+        first = sets.sort_values('SetOrder', kind='stable').drop_duplicates('ExpressId')
+        set_names = frame['ExpressId'].map(dict(zip(first['ExpressId'], first['SetName'])))
+    else:
+        hits = props[props['PropertyName'] == prop_name].sort_values('SetOrder', kind='stable').drop_duplicates('ExpressId')
+        set_names = frame['ExpressId'].map(dict(zip(hits['ExpressId'], hits['SetName'])))
+    frame['SetName'] = set_names
+
+    # 2) Valore: intero Pset per 'ALL', altrimenti lookup su (ExpressId, Pset risolto, PropertyName)
+    if prop_name == 'ALL':
+        values = pd.Series(_set_dicts(props, sets, frame[['ExpressId', 'SetName']]), index=frame.index, dtype=object)
+    else:
+        # Righe della proprietà nel Pset risolto dell'elemento (un elemento compare una volta per regola)
+        hits = props.loc[props['PropertyName'] == prop_name, ['ExpressId', 'SetName', 'Value']]
+        wanted = hits['ExpressId'].map(dict(zip(frame['ExpressId'], set_names)))
+        hits = hits[hits['SetName'].to_numpy(dtype=object) == wanted.to_numpy(dtype=object)]
+        values = frame['ExpressId'].map(dict(zip(hits['ExpressId'], hits['Value']))).astype(object)
+        values = values.where(values.notna(), None)
+
+    # 3) Fallback sugli attributi diretti dell'entità (es. Name): solo sulle righe senza valore
+    if prop_name:
+        missing = np.flatnonzero(values.isna().to_numpy())
+        if len(missing):
+            has_attr: Dict[str, bool] = {}
+            fallback = {}
+            for i, eid in zip(missing, frame['ExpressId'].to_numpy()[missing]):
+                obj = entities.get(eid)
+                if obj is None:
+                    continue
+                cls = obj.is_a()
+                if cls not in has_attr:
+                    has_attr[cls] = hasattr(obj, prop_name)
+                if has_attr[cls]:
+                    try:
+                        fallback[i] = getattr(obj, prop_name)
+                    except Exception:
+                        pass
+            if fallback:
+                values.iloc[list(fallback)] = pd.Series(list(fallback.values()), dtype=object).to_numpy()
+
+    present = values.notna()
+    compliant = present if mandatory else pd.Series(True, index=frame.index)
+    allowed = prop_rule.get('allowed_values') or prop_rule.get('values')
+    if allowed and prop_name != 'ALL':
+        compliant = compliant & (~present | _ids_allowed_mask(values, allowed))
+
+    # Colonne costruite in un solo passaggio (l'inserimento colonna per colonna domina sui modelli piccoli)
+    return pd.DataFrame({
+        'ExpressId': frame['ExpressId'],
+        'SetName': set_names,
+        'PropertySet': set_names.where(set_names.notna(), pset_name),
+        'PropertyName': prop_name,
+        'Value': values.where(present, None),
+        'Compliant': compliant.astype(bool),
+    })
+
+
+def evaluate_ids_rules(tables: Dict[str, Any], ids_rules: List[Dict[str, Any]],
+                       plan: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Valuta tutte le regole sulle tabelle di build_ids_tables; stesso output (e ordine) del validatore per elemento.
+
+    Ogni coppia (applicabilità, requisito) del piano è valutata una sola volta e riusata dalle regole
+    che la ripetono.
+    """
+    return _evaluate_ids_frame(tables, ids_rules, plan)[IDS_RESULT_COLUMNS]
+
+
+def _evaluate_ids_frame(tables: Dict[str, Any], ids_rules: List[Dict[str, Any]],
+                        plan: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    # Come evaluate_ids_rules, ma con la colonna _rule (indice della regola) per separare i risultati
+    plan = plan or compile_ids_rules(ids_rules)
+    elements = tables['elements'].set_index('ExpressId')
+    sets, props = tables['sets'], tables['props']
+    evaluated: Dict[Tuple[Any, ...], pd.DataFrame] = {}
+    for app, req_keys in plan['applicabilities'].items():
+        ids = tables['members'].get(app)
+        if not ids:
+            continue
+        ids = pd.Series(ids)
+        # Tabelle ristrette agli elementi dell'applicabilità, condivise da tutti i suoi requisiti
+        app_sets = sets[sets['ExpressId'].isin(ids)]
+        app_props = props[props['ExpressId'].isin(ids)]
+        for key in req_keys:
+            evaluated[(app, key)] = _evaluate_property_rule(ids, plan['requirements'][key], app_sets, app_props,
+                                                            tables['entities'])
+
+    # Colonne di servizio per blocco (regola, proprietà), aggiunte una sola volta dopo la concatenazione
+    frames, classes, rules, positions, order = [], [], [], [], []
+    for r_idx, app, keys in plan['steps']:
+        for p_idx, key in enumerate(keys):
+            frame = evaluated.get((app, key))
+            if frame is not None:
+                frames.append(frame)
+                classes.append((app[0], len(frame)))
+                rules.append((r_idx, len(frame)))
+                order.append((p_idx, len(frame)))
+                positions.append(np.arange(len(frame)))
+    if not frames:
+        return pd.DataFrame(columns=IDS_RESULT_COLUMNS + ['_rule'])
+
+    out = pd.concat(frames, ignore_index=True)
+    out['IFCClass'] = np.repeat([c for c, _ in classes], [n for _, n in classes])
+    out['_rule'] = np.repeat([r for r, _ in rules], [n for _, n in rules])
+    out['_prop'] = np.repeat([p for p, _ in order], [n for _, n in order])
+    out['_pos'] = np.concatenate(positions)
+    # Ordine del validatore storico: regola -> elemento -> proprietà
+    out = out.sort_values(['_rule', '_pos', '_prop'], kind='stable', ignore_index=True)
+    out['ElementID'] = out['ExpressId'].map(elements['ElementID'])
+    out['ElementName'] = out['ExpressId'].map(elements['ElementName'])
+    return out[IDS_RESULT_COLUMNS + ['_rule']]
+
+
+def _model_cache_key(model: Any, model_hash: Optional[str]) -> str:
+    # Hash del contenuto caricato + revisione delle modifiche fatte in app
+    revision = changetracker.get_revision(model)
+    return f"{model_hash or f'id{id(model)}'}:r{revision}"
+
+
+def get_ids_plan(model: Any, ids_rules: List[Dict[str, Any]], model_hash: Optional[str] = None) -> Dict[str, Any]:
+    """Piano compilato e risolto sul modello, memoizzato per (hash IDS, hash modello).
+
+    Ritorna {'plan', 'tables', 'ids_hash', 'model_key'}: applicabilità risolte e Pset richiesti letti
+    una sola volta; le chiamate successive con le stesse regole e lo stesso modello li riusano.
+    """
+    key = (ids_rules_hash(ids_rules), _model_cache_key(model, model_hash))
+    entry = _PLAN_CACHE.get(key)
+    if entry is not None and entry['ref']() is model:
+        _PLAN_CACHE.move_to_end(key)
+        return entry
+    plan = compile_ids_rules(ids_rules)
+    tables = build_ids_tables(model, list(plan['applicabilities']), psets=plan['psets'])
+    entry = {'ref': weakref.ref(model), 'plan': plan, 'tables': tables, 'ids_hash': key[0], 'model_key': key[1]}
+    _PLAN_CACHE[key] = entry
+    while len(_PLAN_CACHE) > MAX_CACHED_PLANS:
+        _PLAN_CACHE.popitem(last=False)
+    return entry
+
+
+def clear_ids_plan_cache() -> None:
+    """Svuota i piani IDS memoizzati."""
+    _PLAN_CACHE.clear()
+
+
+def validate_ifc_with_ids(ifc_file: Any, ids_rules: List[Dict[str, Any]], model_hash: Optional[str] = None):
     """Valida un modello IFC rispetto a regole IDS semplificate e ritorna un DataFrame.
     Nota: questa è una logica di fallback per popolare la UI. Il percorso ufficiale via CLI è
     disponibile attraverso validate_ifc_with_ids_xml_official() usando un IDS XML.
+
+    Le regole sono compilate in un piano (get_ids_plan) raggruppato per applicabilità
+    (classe + predefined_type opzionale): ogni applicabilità è risolta una volta, i soli Pset
+    richiesti sono letti una volta per elemento e i requisiti ripetuti sono valutati una volta.
+    Se la regola ha allowed_values, il valore presente deve appartenere all'elenco.
+    model_hash: hash del file caricato (session.ifc_hash) per riusare il piano tra le chiamate.
     """
-    results = []
     try:
         model = ifc_file if hasattr(ifc_file, 'by_type') else ifcopenshell.open(ifc_file)
     except Exception:
         model = ifc_file
+    if not any(_applicability_key(r) for r in ids_rules or []):
+        return pd.DataFrame(columns=IDS_RESULT_COLUMNS)
+    entry = get_ids_plan(model, ids_rules, model_hash)
+    return evaluate_ids_rules(entry['tables'], ids_rules, entry['plan'])
 
-    for rule in ids_rules or []:
-        class_name = rule.get('ifc_class')
-        if not class_name:
-            continue
+
+def ids_rule_fingerprints(ids_rules: List[Dict[str, Any]]) -> List[str]:
+    """Impronta (SHA-256 del JSON canonico) di ogni regola, nell'ordine della lista."""
+    return [ids_rules_hash([rule]) for rule in ids_rules or []]
+
+
+def diff_ids_rules(previous: List[str], current: List[str]) -> Dict[str, Any]:
+    """Confronta due liste di impronte (ids_rule_fingerprints).
+
+    Ritorna {'reused': {indice nuovo: indice precedente}, 'evaluate': indici nuovi da rivalutare
+    (regole aggiunte o modificate), 'removed': indici precedenti non più presenti}.
+    Le regole identiche ripetute sono abbinate nell'ordine in cui compaiono.
+    """
+    pool: Dict[str, List[int]] = {}
+    for i, fp in enumerate(previous or []):
+        pool.setdefault(fp, []).append(i)
+    reused: Dict[int, int] = {}
+    evaluate: List[int] = []
+    for j, fp in enumerate(current or []):
+        if pool.get(fp):
+            reused[j] = pool[fp].pop(0)
+        else:
+            evaluate.append(j)
+    removed = sorted(i for left in pool.values() for i in left)
+    return {'reused': reused, 'evaluate': evaluate, 'removed': removed}
+
+
+def revalidate_ids_rules(ifc_file: Any, ids_rules: List[Dict[str, Any]], state: Optional[Dict[str, Any]] = None,
+                         model_hash: Optional[str] = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Validazione incrementale: rivaluta solo le regole aggiunte o modificate rispetto alla chiamata precedente.
+
+    state: valore ritornato dalla chiamata precedente (es. session.ids_validation_state), None = tutto da valutare.
+    Ritorna (DataFrame uguale a validate_ifc_with_ids sulle regole correnti, nuovo state). Lo state vale
+    solo per lo stesso modello e la stessa revisione (changetracker): altrimenti si rivaluta tutto.
+    state['stats'] riporta le regole rivalutate, riusate e rimosse. Se nulla è cambiato ritorna lo stesso
+    DataFrame della chiamata precedente (state['df']), così riepilogo e indice delle violazioni restano in cache.
+    """
+    try:
+        model = ifc_file if hasattr(ifc_file, 'by_type') else ifcopenshell.open(ifc_file)
+    except Exception:
+        model = ifc_file
+    model_key = _model_cache_key(model, model_hash)
+    fingerprints = ids_rule_fingerprints(ids_rules)
+    previous, previous_frames = [], []
+    if state and state.get('model_key') == model_key and state['ref']() is model:
+        previous, previous_frames = state['fingerprints'], state['frames']
+    diff = diff_ids_rules(previous, fingerprints)
+
+    frames: List[pd.DataFrame] = [None] * len(fingerprints)
+    for j, i in diff['reused'].items():
+        frames[j] = previous_frames[i]
+    todo = diff['evaluate']
+    if todo:
+        subset = [ids_rules[j] for j in todo]
+        groups: Dict[int, pd.DataFrame] = {}
+        if any(_applicability_key(r) for r in subset):
+            entry = get_ids_plan(model, subset, model_hash)
+            out = _evaluate_ids_frame(entry['tables'], subset, entry['plan'])
+            groups = {k: g[IDS_RESULT_COLUMNS].reset_index(drop=True) for k, g in out.groupby('_rule', sort=False)}
+        for k, j in enumerate(todo):
+            frames[j] = groups.get(k, pd.DataFrame(columns=IDS_RESULT_COLUMNS))
+
+    if previous and previous == fingerprints and state.get('df') is not None:
+        # Stesse regole nello stesso ordine: stesso oggetto, niente concat
+        df = state['df']
+    else:
+        non_empty = [f for f in frames if not f.empty]
+        df = pd.concat(non_empty, ignore_index=True) if non_empty else pd.DataFrame(columns=IDS_RESULT_COLUMNS)
+    new_state = {
+        'ref': weakref.ref(model),
+        'model_key': model_key,
+        'fingerprints': fingerprints,
+        'frames': frames,
+        'df': df,
+        'stats': {'evaluated': len(todo), 'reused': len(diff['reused']), 'removed': len(diff['removed'])},
+    }
+    return df, new_state
+
+
+# ------------------------------
+# RIEPILOGO DI CONFORMITÀ — condiviso da pagina 2 (IDS), pagina 3 (BCF) e report
+# ------------------------------
+
+COMPLIANCE_LEVELS = {
+    'all': [],
+    'class': ['IFCClass'],
+    'pset': ['IFCClass', 'PropertySet'],
+    'property': ['IFCClass', 'PropertySet', 'PropertyName'],
+}
+COMPLIANCE_SUMMARY_COLUMNS = ['Level', 'IFCClass', 'PropertySet', 'PropertyName',
+                              'Total', 'Passed', 'Failed', 'ComplianceRate']
+MAX_CACHED_RESULTS = 8
+NO_STOREY = '(No storey)'
+
+# (tipo, id(DataFrame dei risultati), ...) -> (weakref al DataFrame, valore), LRU:
+# riepilogo e indice delle violazioni sono calcolati una volta per run di validazione
+_RESULT_CACHE: "OrderedDict[Tuple[Any, ...], Tuple[Any, Any]]" = OrderedDict()
+
+
+def _memo_per_result(key: Tuple[Any, ...], df: pd.DataFrame, builder) -> Any:
+    cached = _RESULT_CACHE.get(key)
+    if cached is not None and cached[0]() is df:
+        _RESULT_CACHE.move_to_end(key)
+        return cached[1]
+    value = builder()
+    _RESULT_CACHE[key] = (weakref.ref(df), value)
+    while len(_RESULT_CACHE) > MAX_CACHED_RESULTS:
+        _RESULT_CACHE.popitem(last=False)
+    return value
+
+
+def _build_compliance_summary(df: pd.DataFrame) -> pd.DataFrame:
+    keys = COMPLIANCE_LEVELS['property']
+    # Colonne assenti (es. output del validatore ufficiale) come stringa vuota; Compliant None/NaN = non conforme
+    base = pd.DataFrame({k: df[k].fillna('').astype(str) if k in df.columns else '' for k in keys}, index=df.index)
+    base['Passed'] = df['Compliant'].eq(True).to_numpy(dtype=np.int64)
+    # Un solo groupby al livello più fine; i livelli superiori sono somme delle sue righe
+    finest = base.groupby(keys, sort=True)['Passed'].agg(Total='size', Passed='sum').reset_index()
+    parts = []
+    for level, cols in COMPLIANCE_LEVELS.items():
+        if level == 'property':
+            part = finest
+        elif cols:
+            part = finest.groupby(cols, sort=True)[['Total', 'Passed']].sum().reset_index()
+        else:
+            part = finest[['Total', 'Passed']].sum().to_frame().T
+        parts.append(part.assign(Level=level))
+    out = pd.concat(parts, ignore_index=True).reindex(columns=COMPLIANCE_SUMMARY_COLUMNS)
+    out[['Total', 'Passed']] = out[['Total', 'Passed']].astype(np.int64)
+    out['Failed'] = out['Total'] - out['Passed']
+    out['ComplianceRate'] = (out['Passed'] / out['Total'] * 100).round(2)
+    return out
+
+
+def compliance_summary(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Conteggi superati/falliti e percentuale di conformità per modello, classe, Pset e proprietà.
+
+    Un'unica aggregazione vettoriale sul DataFrame dei risultati (validate_ifc_with_ids o validatore
+    ufficiale); la colonna Level ('all', 'class', 'pset', 'property') distingue i livelli.
+    Memoizzato per DataFrame: lo stesso risultato di validazione non viene riaggregato.
+    """
+    if df is None or df.empty or 'Compliant' not in df.columns:
+        return pd.DataFrame(columns=COMPLIANCE_SUMMARY_COLUMNS)
+    return _memo_per_result(('summary', id(df)), df, lambda: _build_compliance_summary(df))
+
+
+def compliance_level(summary: pd.DataFrame, level: str = 'class') -> pd.DataFrame:
+    """Righe di un livello del riepilogo (compliance_summary) con le sole colonne di quel livello."""
+    cols = COMPLIANCE_LEVELS[level] + ['Total', 'Passed', 'Failed', 'ComplianceRate']
+    return summary.loc[summary['Level'] == level, cols].reset_index(drop=True)
+
+
+def _element_storeys(model: Any, element_ids: List[Any]) -> Dict[Any, str]:
+    index = get_relationship_index(model)
+    storeys = {}
+    for gid in element_ids:
         try:
-            elements = model.by_type(class_name) or []
+            obj = model.by_guid(gid) if isinstance(gid, str) else model.by_id(int(gid))
         except Exception:
-            elements = []
-        if not elements:
-            continue
-        for obj in elements:
-            try:
-                psets = ifc_element.get_psets(obj) or {}
-            except Exception:
-                psets = {}
-            for prop_rule in rule.get('properties', []):
-                pset_name = prop_rule.get('property_set', '')
-                prop_name = prop_rule.get('property_name', '')
-                mandatory = prop_rule.get('mandatory', False)
-                val = None
-                if pset_name:
-                    pset_props = psets.get(pset_name)
-                    if pset_props is not None:
-                        val = pset_props if prop_name == 'ALL' else pset_props.get(prop_name)
-                    else:
-                        for pn, props in psets.items():
-                            if pn.lower() == pset_name.lower():
-                                val = props if prop_name == 'ALL' else props.get(prop_name)
-                                pset_name = pn
-                                break
-                else:
-                    for pn, props in psets.items():
-                        if prop_name == 'ALL':
-                            val = props; pset_name = pn; break
-                        if prop_name in props:
-                            val = props.get(prop_name); pset_name = pn; break
-                if val is None and prop_name and hasattr(obj, prop_name):
-                    try:
-                        val = getattr(obj, prop_name)
-                    except Exception:
-                        val = None
-                is_valid = (val is not None) if mandatory else True
-                element_id = getattr(obj, 'GlobalId', None) or getattr(obj, 'GlobalID', None)
-                if element_id is None:
-                    try:
-                        element_id = obj.id()
-                    except Exception:
-                        element_id = None
-                results.append({
-                    'ElementID': element_id,
-                    'ElementName': getattr(obj, 'Name', None) or '(Unnamed)',
-                    'IFCClass': class_name,
-                    'PropertySet': pset_name,
-                    'PropertyName': prop_name,
-                    'Value': val,
-                    'Compliant': is_valid
-                })
-    return pd.DataFrame(results)
+            obj = None
+        storeys[gid] = (index_get_storey(index, obj) or NO_STOREY) if obj is not None else NO_STOREY
+    return storeys
+
+
+def _build_violation_index(df: pd.DataFrame, model: Any) -> Dict[str, Any]:
+    failed = ~df['Compliant'].eq(True).to_numpy()
+    positions = np.flatnonzero(failed)
+    fails = pd.DataFrame({
+        'ElementID': df['ElementID'].to_numpy()[positions],
+        'PropertySet': df['PropertySet'].fillna('').astype(str).to_numpy()[positions] if 'PropertySet' in df.columns else '',
+        'PropertyName': df['PropertyName'].fillna('').astype(str).to_numpy()[positions] if 'PropertyName' in df.columns else '',
+    })
+    element_ids = list(pd.unique(fails['ElementID']))
+    storeys = _element_storeys(model, element_ids) if model is not None else {}
+    fails['Storey'] = fails['ElementID'].map(storeys).fillna(NO_STOREY) if storeys else NO_STOREY
+
+    # groupby(...).indices: chiave -> posizioni nella tabella delle violazioni, riportate alle righe di df
+    by_element = {k: positions[v] for k, v in fails.groupby('ElementID', sort=False).indices.items()}
+    by_storey = {k: positions[v] for k, v in fails.groupby('Storey', sort=False).indices.items()}
+    by_requirement = {k: positions[v] for k, v in fails.groupby(['PropertySet', 'PropertyName'], sort=False).indices.items()}
+    # Requisiti distinti falliti per elemento, in ordine decrescente
+    fail_counts = fails.drop_duplicates(['ElementID', 'PropertySet', 'PropertyName'])['ElementID'].value_counts()
+    return {
+        'rows': positions,
+        'by_element': by_element,
+        'by_requirement': by_requirement,
+        'by_storey': by_storey,
+        'storeys': storeys,
+        'fail_counts': fail_counts,
+    }
+
+
+def violation_index(df: Optional[pd.DataFrame], model: Any = None) -> Dict[str, Any]:
+    """Indice delle violazioni di un risultato IDS, costruito una volta per run (memoizzato).
+
+    - rows: posizioni (iloc) delle righe non conformi
+    - by_element: ElementID -> posizioni delle sue righe non conformi
+    - by_requirement: (PropertySet, PropertyName) -> posizioni delle righe non conformi
+    - by_storey: nome del piano -> posizioni (serve il modello; senza, tutto in NO_STOREY)
+    - fail_counts: ElementID -> numero di requisiti distinti non soddisfatti (decrescente)
+    Le posizioni si usano con df.iloc; vedi anche failing_rows e elements_failing_more_than.
+    """
+    if df is None or df.empty or 'Compliant' not in df.columns or 'ElementID' not in df.columns:
+        empty = np.array([], dtype=np.int64)
+        return {'rows': empty, 'by_element': {}, 'by_requirement': {}, 'by_storey': {}, 'storeys': {},
+                'fail_counts': pd.Series(dtype=np.int64, name='count')}
+    key = ('violations', id(df), id(model) if model is not None else None)
+    return _memo_per_result(key, df, lambda: _build_violation_index(df, model))
+
+
+def failing_rows(df: pd.DataFrame, index: Dict[str, Any], by: str = 'element', key: Any = None) -> pd.DataFrame:
+    """Righe non conformi per un elemento, un requisito (PropertySet, PropertyName) o un piano.
+
+    by: 'element' | 'requirement' | 'storey'; key None = tutte le righe non conformi.
+    """
+    if key is None:
+        return df.iloc[index['rows']]
+    positions = index[f'by_{by}'].get(key)
+    return df.iloc[positions] if positions is not None else df.iloc[0:0]
+
+
+def elements_failing_more_than(index: Dict[str, Any], n: int) -> pd.Series:
+    """ElementID -> requisiti non soddisfatti, per gli elementi con più di n requisiti falliti."""
+    counts = index['fail_counts']
+    # fail_counts è ordinato in modo decrescente: ricerca binaria del primo conteggio <= n
+    return counts.iloc[:int(np.searchsorted(-counts.to_numpy(), -n, side='left'))]
 
 
 def export_ids_report(results: List[Dict[str, Any]], as_json: bool = True) -> bytes:
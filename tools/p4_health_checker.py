@@ -3,14 +3,27 @@ Helper per Pagina 4 — IFC Model Health Checker
 
 Uso: pages/4_ IFC Model Health Checker.py
 Funzioni:
-- run_health_checks(model): esegue controlli di qualità usando official validators
+- run_health_checks(model, source_path, content_hash): esegue controlli di qualità usando official validators
+  (in-process); risultati in cache per (hash del file, versione validatori, rule types)
+- invalidate_health_checks(content_hash): rimuove i risultati in cache del modello
+- compute_richness_metrics(model) / get_richness_metrics(model, content_hash): copertura Pset del dizionario,
+  proprietà compilate, Qto ed elementi orfani per classe e per piano (in cache per hash del file)
+- check_label(check): etichetta leggibile di un controllo ("gherkin:CRITICAL" -> "Gherkin CRITICAL")
 - build_health_report(results): ritorna un DataFrame/HTML/bytes (qui: JSON bytes)
 """
 
 from __future__ import annotations
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime
+import hashlib
 import json
 
+import pandas as pd
+
+from tools import cachehelper, changetracker
+from tools.ifc_432_dictionary import IFC_STRUCTURAL_DICTIONARY_4x3
+from tools.p_shared import get_relationship_index, index_get_container, index_get_psets, index_get_storey
+
 # Import official validation functions
 try:
     from tools import validate_ifc as v_ifc
@@ -20,19 +33,187 @@ except ImportError:
     v_ifc = None
 
 
-def run_health_checks(model: Any) -> Dict[str, Any]:
-    """Esegue controlli usando official buildingSMART validators."""
+VALIDATION_CACHE_PREFIX = "validation_"
+DEFAULT_RULE_TYPES = ["CRITICAL"]
+
+
+def validation_cache_name(rule_types: Optional[List[str]] = None) -> str:
+    """Nome della voce di cache per versione dei validatori + insieme dei rule type."""
+    types = ",".join(sorted(rule_types or DEFAULT_RULE_TYPES))
+    version = v_ifc.validator_version() if v_ifc is not None else "none"
+    digest = hashlib.sha256(f"{version}|{types}".encode("utf-8")).hexdigest()[:16]
+    return f"{VALIDATION_CACHE_PREFIX}{digest}"
+
+
+def run_health_checks(model: Any, source_path: Optional[str] = None,
+                      on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                      content_hash: Optional[str] = None, rule_types: Optional[List[str]] = None,
+                      use_cache: bool = True) -> Dict[str, Any]:
+    """Esegue controlli usando official buildingSMART validators (in parallelo).
+    source_path: file caricato (session.temp_ifc_path), riusato finché il modello non è modificato.
+    on_result(check, result): chiamata al termine di ciascun controllo (risultati parziali per la UI).
+    content_hash: hash del file caricato (session.ifc_hash); se il modello non è stato modificato
+    i risultati sono letti/salvati nella cache su disco ("cached": True se letti dalla cache);
+    si salvano solo i run con tutti i controlli completati (overall.completed).
+    """
     if not VALIDATION_AVAILABLE or v_ifc is None:
         return {
             "error": "Official validation tools not available",
             "results": []
         }
-    
+
+    cache_key = content_hash if content_hash and not changetracker.is_dirty(model) else None
+    name = validation_cache_name(rule_types)
+    if cache_key and use_cache:
+        cached = cachehelper.load_json(cache_key, name)
+        if cached:
+            cached["cached"] = True
+            return cached
+
     # Run official validations
-    results = v_ifc.validate_ifc_from_model(model)
+    results = v_ifc.validate_ifc_from_model(model, source_path=source_path, rule_types=rule_types, on_result=on_result)
+    results["validated_at"] = datetime.now().isoformat(timespec="seconds")
+    results["validator_version"] = v_ifc.validator_version()
+    # Solo run completi: un timeout o un validatore in errore non resta in cache
+    if cache_key and results.get("overall", {}).get("completed", True):
+        cachehelper.save_json(cache_key, name, results)
     return results
 
 
+def invalidate_health_checks(content_hash: Optional[str]) -> int:
+    """Rimuove i risultati di validazione in cache per il modello; ritorna il numero di voci rimosse."""
+    return cachehelper.invalidate(content_hash, VALIDATION_CACHE_PREFIX)
+
+
+def check_label(check: str) -> str:
+    """Etichetta per la UI dei controlli restituiti da validate_ifc.iter_validations."""
+    name, _, rule_type = check.partition(":")
+    return f"{name.capitalize()} {rule_type}".strip()
+
+
+# ------------------------------
+# METRICHE DI RICCHEZZA DEI DATI (per classe e per piano)
+# ------------------------------
+
+# Nome versionato: cambiare il suffisso quando cambia il calcolo delle metriche
+RICHNESS_CACHE_NAME = "richness_metrics_v2"
+NO_STOREY = "(No storey)"
+RICHNESS_COLUMNS = ['GroupBy', 'Group', 'Elements', 'WithStandardPsets', 'PsetCoverage', 'StandardPsetRatio',
+                    'Properties', 'FilledProperties', 'FilledRatio', 'WithQuantities', 'QtoCoverage',
+                    'Orphans', 'OrphanRatio']
+
+
+def _is_filled(value: Any) -> bool:
+    # Valore "compilato": non None, non stringa vuota, non collezione vuota
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return bool(value.strip())
+    if isinstance(value, (list, tuple, dict, set)):
+        return bool(value)
+    return True
+
+
+def _element_property_stats(index: Dict[str, Any], eid: int):
+    # (nomi Pset, ha Qto, proprietà, compilate) dell'elemento: Pset ereditati e fusi da index_get_psets
+    psets = index_get_psets(index, eid, psets_only=True)
+    values = [v for props in psets.values() for k, v in props.items() if k != 'id']
+    has_qto = bool(index_get_psets(index, eid, qtos_only=True))
+    return set(psets), has_qto, len(values), sum(1 for v in values if _is_filled(v))
+
+
+def _is_orphan(obj: Any, container: Any) -> bool:
+    # Prodotto fuori dalla struttura spaziale: né contenuto, né parte di un aggregato/annidamento, né vuoto/riempimento
+    if container is not None or not obj.is_a('IfcProduct'):
+        return False
+    for inverse in ('Decomposes', 'Nests', 'VoidsElements', 'FillsVoids'):
+        if getattr(obj, inverse, None):
+            return False
+    return True
+
+
+def compute_richness_metrics(model: Any, dictionary: Optional[Dict[str, Dict[str, List[str]]]] = None,
+                             index: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """Metriche di ricchezza dei dati per classe del dizionario e per piano (un solo passaggio sull'indice relazioni).
+
+    Per gruppo (GroupBy = 'Model' | 'Class' | 'Storey'):
+    - PsetCoverage: quota di elementi con almeno un Pset del dizionario per la loro classe
+    - StandardPsetRatio: media, per elemento, dei Pset del dizionario presenti sul totale atteso
+      (i Qto_ del dizionario sono esclusi: li misura QtoCoverage)
+    - FilledRatio: proprietà compilate / proprietà presenti (Pset, Qto esclusi)
+    - QtoCoverage: quota di elementi con almeno un Qto
+    - Orphans / OrphanRatio: prodotti non collocati nella struttura spaziale
+    dictionary: classe -> {Pset: [proprietà]} (default IFC_STRUCTURAL_DICTIONARY_4x3).
+    Gli oggetti tipo (IfcTypeObject, es. IfcFootingType) non sono elementi e sono ignorati.
+    """
+    dictionary = dictionary if dictionary is not None else IFC_STRUCTURAL_DICTIONARY_4x3
+    index = index if index is not None else get_relationship_index(model)
+    storey_of: Dict[Any, Optional[str]] = {}
+
+    cols: Dict[str, list] = {k: [] for k in ('Class', 'Storey', 'WithStandardPsets', 'StandardPsetRatio',
+                                              'Properties', 'FilledProperties', 'WithQuantities', 'Orphans')}
+    seen = set()
+    for cls, expected in dictionary.items():
+        try:
+            elements = model.by_type(cls)
+        except Exception:
+            continue
+        expected_psets = {name for name in expected if not name.startswith('Qto_')}
+        for obj in elements:
+            eid = obj.id()
+            if eid in seen or obj.is_a('IfcTypeObject'):
+                continue
+            seen.add(eid)
+            pset_names, has_qto, n_props, n_filled = _element_property_stats(index, eid)
+            standard = len(pset_names & expected_psets)
+            container = index_get_container(index, eid)
+            # Piano memoizzato per contenitore (pochi contenitori, molti elementi)
+            ckey = container.id() if container is not None else None
+            if ckey not in storey_of:
+                storey_of[ckey] = index_get_storey(index, eid) if container is not None else None
+            cols['Class'].append(cls)
+            cols['Storey'].append(storey_of[ckey] or NO_STOREY)
+            cols['WithStandardPsets'].append(standard > 0)
+            cols['StandardPsetRatio'].append(standard / len(expected_psets) if expected_psets else 0.0)
+            cols['Properties'].append(n_props)
+            cols['FilledProperties'].append(n_filled)
+            cols['WithQuantities'].append(has_qto)
+            cols['Orphans'].append(_is_orphan(obj, container))
+
+    elements = pd.DataFrame(cols)
+    if elements.empty:
+        return pd.DataFrame(columns=RICHNESS_COLUMNS)
+    sums = ['WithStandardPsets', 'Properties', 'FilledProperties', 'WithQuantities', 'Orphans']
+    parts = []
+    for group_by, key in (('Model', None), ('Class', 'Class'), ('Storey', 'Storey')):
+        if key is None:
+            part = elements[sums + ['StandardPsetRatio']].agg({**{c: 'sum' for c in sums}, 'StandardPsetRatio': 'mean'}).to_frame().T
+            part['Elements'] = len(elements)
+            part['Group'] = 'All'
+        else:
+            grouped = elements.groupby(key, sort=True)
+            part = grouped[sums].sum()
+            part['StandardPsetRatio'] = grouped['StandardPsetRatio'].mean()
+            part['Elements'] = grouped.size()
+            part = part.rename_axis('Group').reset_index()
+        parts.append(part.assign(GroupBy=group_by))
+    out = pd.concat(parts, ignore_index=True)
+    out[sums + ['Elements']] = out[sums + ['Elements']].astype('int64')
+    out['PsetCoverage'] = out['WithStandardPsets'] / out['Elements']
+    out['FilledRatio'] = (out['FilledProperties'] / out['Properties'].where(out['Properties'] > 0)).fillna(0.0)
+    out['QtoCoverage'] = out['WithQuantities'] / out['Elements']
+    out['OrphanRatio'] = out['Orphans'] / out['Elements']
+    ratios = ['PsetCoverage', 'StandardPsetRatio', 'FilledRatio', 'QtoCoverage', 'OrphanRatio']
+    out[ratios] = out[ratios].astype(float).round(4)
+    return out[RICHNESS_COLUMNS]
+
+
+def get_richness_metrics(model: Any, content_hash: Optional[str] = None) -> pd.DataFrame:
+    """compute_richness_metrics in cache su disco per hash del file (solo se il modello non è stato modificato)."""
+    cache_key = content_hash if content_hash and not changetracker.is_dirty(model) else None
+    return cachehelper.get_or_build_frame(cache_key, RICHNESS_CACHE_NAME, lambda: compute_richness_metrics(model))
+
+
 def build_health_report(results: Dict[str, Any]) -> bytes:
     """Esporta i risultati dei controlli in JSON bytes."""
     return json.dumps(results or {}, ensure_ascii=False, indent=2).encode("utf-8")
@@ -6,25 +6,37 @@ This module contains only the functions used by the Properties & Quantities page
 - get_ifc_quantities
 - export_ifc_as_csv_bytes
 - get_ifc_pandas
+- get_ifc_full_dataframe / iter_ifc_full_dataframe / write_ifc_full_dataframe
+- patch_full_dataframe / patch_quantities (incremental update after edits)
+- compact_full_dataframe / full_dataframe_memory_report (compact dtypes)
+- write_columnar (Parquet / Feather export)
 """
 
 from datetime import datetime
 import importlib
+import warnings
 import pandas as pd
+from pandas.api.types import union_categoricals
 import ifcopenshell
 import ifcopenshell.util.element as util
 
+from tools import changetracker
+from tools import p_shared
+
 # Third-party helpers from shared utilities
 try:
-    from .p_shared import get_objects_data_by_class, create_pandas_dataframe
+    from .p_shared import get_objects_data_by_class, create_pandas_dataframe, get_relationship_index, index_get_psets, index_get_container, index_get_storey, index_get_type
 except ImportError:
     try:
-        from tools.p_shared import get_objects_data_by_class, create_pandas_dataframe
+        from tools.p_shared import get_objects_data_by_class, create_pandas_dataframe, get_relationship_index, index_get_psets, index_get_container, index_get_storey, index_get_type
     except Exception as e:
         def _missing(*args, **kwargs):
             raise ImportError("p_shared module not found. Ensure tools/p_shared.py exists in your project.") from e
         get_objects_data_by_class = _missing
         create_pandas_dataframe = _missing
+        get_relationship_index = _missing
+        index_get_psets = _missing
+        index_get_container = _missing
 
 # Optional ifcopenshell CSV helpers (imported once)
 if importlib.util.find_spec('ifcopenshell.csv') is not None:
@@ -50,9 +62,8 @@ else:
 
 def get_types(model, parent_class=None):
     """Return a set of IFC classes/types present in the model. Optionally filter by parent_class."""
-    if parent_class:
-        return set(i.is_a() for i in model if i.is_a(parent_class))
-    return set(i.is_a() for i in model)
+    # Censimento condiviso (conteggi foglia + albero dei sottotipi dello schema)
+    return p_shared.get_types(model, parent_class)
 
 
 # ------------------------------
@@ -97,11 +108,12 @@ def get_types(model, parent_class=None):
 
 #     return pd.DataFrame(all_data)
 
-def get_ifc_quantities(model):
+def get_ifc_quantities(model, entities=None):
     """
     Extract IFC quantity takeoffs (Qto) using util.get_psets by detecting Qto sets.
     Returns a DataFrame with columns:
     [ExpressId, GlobalId, Class, PredefinedType, Name, Level, Type, QuantitySet, QuantityName, QuantityValue]
+    entities limits the extraction to the given instances (used to patch the frame after edits).
     """
     columns = [
         'ExpressId', 'GlobalId', 'Class', 'PredefinedType', 'Name',
@@ -112,10 +124,12 @@ def get_ifc_quantities(model):
         return pd.DataFrame(columns=columns)
 
     all_data = []
+    index = get_relationship_index(model)
 
-    for e in model.by_type("IfcElement"):
+    elements = model.by_type("IfcElement") if entities is None else [e for e in entities if e.is_a("IfcElement")]
+    for e in elements:
         try:
-            psets_all = util.get_psets(e)
+            psets_all = index_get_psets(index, e)
         except Exception:
             psets_all = {}
         if not psets_all:
@@ -132,14 +146,11 @@ def get_ifc_quantities(model):
         otype = getattr(e, "ObjectType", None)
         cls = e.is_a()
 
-        # Attempt to determine level (IfcBuildingStorey)
-        level = None
+        # Level = spatial container (IfcBuildingStorey) from the relationship index
         try:
-            if hasattr(e, "ContainedInStructure") and e.ContainedInStructure:
-                lvl = e.ContainedInStructure[0]
-                level = getattr(lvl, "Name", None)
+            level = getattr(index_get_container(index, e), "Name", None)
         except Exception:
-            pass
+            level = None
 
         for set_name, props in (psets_all or {}).items():
             # Detect Qto sets by name
@@ -198,10 +209,87 @@ def export_ifc_as_csv_bytes(model=None, df=None):
 # DataFrame extraction for properties/quantities
 # ------------------------------
 
-def get_ifc_pandas(model, schema=None):
+# Numero di processi di default per get_ifc_pandas (1 = estrazione seriale).
+# Il pool è opt-in: l'avvio dei processi spawn, la riapertura del file in ogni worker e il pickling
+# dei risultati costano secondi; alzare il valore solo su host multi-core e modelli grandi, dopo
+# averlo verificato con `python -m tools.benchmarks extraction <modello.ifc> --workers 2 4`.
+EXTRACTION_WORKERS = 1
+
+# Classi ausiliarie escluse dall'estrazione (rumore)
+EXCLUDE_PREFIXES = (
+    'IfcRel', 'IfcProperty', 'IfcProfile', 'IfcRepresentation', 'IfcGeometric',
+    'IfcPresentation', 'IfcMaterial', 'IfcConstraint', 'IfcDocument', 'IfcUnit',
+    'IfcOwnerHistory', 'IfcQuantity', 'IfcClassification', 'IfcExternal', 'IfcLibrary'
+)
+
+
+def _extract_class_frames(model, classes, index=None):
+    """Ritorna [(classe, DataFrame)] per le classi indicate, saltando quelle vuote o in errore."""
+    if index is None:
+        index = get_relationship_index(model)
+    frames = []
+    for cls in classes:
+        try:
+            data, pset_attrs = get_objects_data_by_class(model, cls, index=index)
+            df = create_pandas_dataframe(data, pset_attrs)
+            if df is not None and not df.empty:
+                df['Class'] = cls
+                frames.append((cls, df))
+        except Exception:
+            continue
+    return frames
+
+
+def _extract_class_frames_from_path(ifc_path, classes):
+    # Entry point del processo worker: apre il file in sola lettura e costruisce il proprio indice
+    return _extract_class_frames(ifcopenshell.open(str(ifc_path)), classes)
+
+
+def partition_classes(model, classes, workers):
+    """Divide le classi in al più `workers` gruppi bilanciati per numero di istanze (greedy LPT)."""
+    weights = []
+    for cls in classes:
+        try:
+            weights.append((len(model.by_type(cls)), cls))
+        except Exception:
+            weights.append((0, cls))
+    bins = [[0, []] for _ in range(max(1, min(workers, len(classes))))]
+    for weight, cls in sorted(weights, key=lambda w: (-w[0], w[1])):
+        target = min(bins, key=lambda b: b[0])
+        target[0] += weight
+        target[1].append(cls)
+    return [b[1] for b in bins if b[1]]
+
+
+def _extract_class_frames_parallel(model, classes, ifc_path, workers):
+    import concurrent.futures as cf
+    import multiprocessing as mp
+
+    # spawn: il processo Streamlit è multi-thread, fork non è sicuro
+    ctx = mp.get_context("spawn")
+    frames = []
+    with cf.ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = [pool.submit(_extract_class_frames_from_path, ifc_path, part)
+                   for part in partition_classes(model, classes, workers)]
+        for fut in futures:
+            frames.extend(fut.result())
+    return frames
+
+
+def get_ifc_pandas(model, schema=None, workers=None, ifc_path=None):
     """
     Build a DataFrame of properties/quantities for IFC4X3 models only.
     Classes are discovered dynamically from the model content (no hardcoded lists).
+
+    The process pool is opt-in: by default (EXTRACTION_WORKERS = 1) the extraction is serial.
+    With workers > 1 and ifc_path (the on-disk copy of the model, e.g. session["temp_ifc_path"])
+    the classes are split across a process pool; each worker opens the file read-only and the
+    per-class frames are merged back in the serial order, so the result is identical.
+    Pool startup, re-parsing and pickling are paid on every call; use tools.benchmarks
+    (bench_extraction_pool) to check that the pool beats the serial path on the target host.
+    The pool is used only while the model has no unsaved in-app edits (changetracker), since the
+    workers read the file and not the in-memory model. Falls back to the serial path, with a
+    RuntimeWarning, if the pool fails.
     """
     if model is None:
         return pd.DataFrame()
@@ -216,24 +304,23 @@ def get_ifc_pandas(model, schema=None):
     classes = sorted(list(get_types(model)))
 
     # Filter out non-product/auxiliary classes to avoid noise
-    EXCLUDE_PREFIXES = (
-        'IfcRel', 'IfcProperty', 'IfcProfile', 'IfcRepresentation', 'IfcGeometric',
-        'IfcPresentation', 'IfcMaterial', 'IfcConstraint', 'IfcDocument', 'IfcUnit',
-        'IfcOwnerHistory', 'IfcQuantity', 'IfcClassification', 'IfcExternal', 'IfcLibrary'
-    )
     target_classes = [c for c in classes if not any(c.startswith(p) for p in EXCLUDE_PREFIXES)]
 
-    dfs = []
-    for cls in target_classes:
+    workers = EXTRACTION_WORKERS if workers is None else int(workers)
+    frames = None
+    # I worker riaprono ifc_path: solo se il file su disco coincide con il modello (nessuna modifica in app)
+    if workers > 1 and ifc_path and len(target_classes) > 1 and not changetracker.is_dirty(model):
         try:
-            data, pset_attrs = get_objects_data_by_class(model, cls)
-            df = create_pandas_dataframe(data, pset_attrs)
-            if df is not None and not df.empty:
-                df['Class'] = cls
-                dfs.append(df)
-        except Exception:
-            continue
-
+            frames = _extract_class_frames_parallel(model, target_classes, ifc_path, workers)
+        except Exception as e:
+            warnings.warn(f"Parallel extraction failed, falling back to the serial path: {e!r}", RuntimeWarning)
+            frames = None
+    if frames is None:
+        frames = _extract_class_frames(model, target_classes, index=get_relationship_index(model))
+
+    # Ordine di merge = ordine delle classi (come nel percorso seriale)
+    order = {cls: i for i, cls in enumerate(target_classes)}
+    dfs = [df for _, df in sorted(frames, key=lambda f: order[f[0]])]
     if not dfs:
         return pd.DataFrame()
 
@@ -244,26 +331,55 @@ def get_ifc_pandas(model, schema=None):
 # Unified long-form DataFrame (entities + Psets + Qtos + Attributes)
 # ------------------------------
 
-def get_ifc_full_dataframe(model):
-    """
-    Create a single long-form DataFrame aggregating all available data:
-    - All entities/classes
-    - All properties (Psets)
-    - All quantities (Qtos)
-    - Selected direct native attributes
-    Each row represents a property or quantity associated to an entity.
-    """
-    columns = [
-        'ExpressId', 'GlobalId', 'Class', 'PredefinedType', 'Name',
-        'Level', 'Type', 'Source', 'SetName', 'AttributeName', 'Value'
-    ]
+FULL_COLUMNS = [
+    'ExpressId', 'GlobalId', 'Class', 'PredefinedType', 'Name',
+    'Level', 'Type', 'Source', 'SetName', 'AttributeName', 'Value'
+]
 
-    if model is None:
-        return pd.DataFrame(columns=columns)
+# Core attributes already captured in dedicated columns
+_CORE_ATTRIBUTES = ('GlobalId', 'Name', 'Description', 'ObjectType', 'PredefinedType')
+
+# (schema, class) -> ((position, attribute name), ...) built once from the schema declaration
+_ATTRIBUTE_PLANS = {}
+
+
+def _schema_id(model):
+    return getattr(model, 'schema_identifier', None) or getattr(model, 'schema', '')
 
-    records = []
 
-    for e in model:
+def get_attribute_plan(schema_id, class_name):
+    """Return the explicit attributes of class_name as (position, name) pairs, cached per class."""
+    key = (schema_id, class_name)
+    plan = _ATTRIBUTE_PLANS.get(key)
+    if plan is None:
+        try:
+            declaration = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema_id).declaration_by_name(class_name)
+            names = [a.name() for a in declaration.all_attributes()]
+        except Exception:
+            names = []
+        plan = tuple((i, n) for i, n in enumerate(names) if n not in _CORE_ATTRIBUTES)
+        _ATTRIBUTE_PLANS[key] = plan
+    return plan
+
+
+def iter_native_attributes(e, plan):
+    """Yield (name, value) for the scalar, non-empty explicit attributes of e, read positionally."""
+    for i, attr_name in plan:
+        try:
+            attr_val = e[i]
+        except Exception:
+            continue
+        if attr_val is None or attr_val == '' or isinstance(attr_val, (list, dict, set, tuple)):
+            continue
+        yield attr_name, attr_val
+
+
+def _iter_full_rows(model, entities=None):
+    """Yield one tuple per (entity, Pset/Qto property or native attribute), ordered as FULL_COLUMNS."""
+    schema_id = _schema_id(model)
+    # Pset/Qto, piano e tipo dall'indice relazioni: un solo passaggio sulle relazioni per modello
+    index = get_relationship_index(model)
+    for e in (model if entities is None else entities):
         try:
             eid = e.id()
         except Exception:
@@ -273,22 +389,26 @@ def get_ifc_full_dataframe(model):
         gid = getattr(e, 'GlobalId', None)
         name = getattr(e, 'Name', None)
         ptype = getattr(e, 'PredefinedType', None)
-        otype = getattr(e, 'ObjectType', None)
 
-        # Attempt to determine Level (e.g., IfcBuildingStorey)
-        level = None
-        try:
-            if hasattr(e, 'ContainedInStructure') and e.ContainedInStructure:
-                lvl = e.ContainedInStructure[0]
-                level = getattr(lvl, 'Name', None)
-        except Exception:
-            pass
+        level, otype, sets = None, None, {}
+        if eid and e.is_a('IfcObjectDefinition'):
+            try:
+                level = index_get_storey(index, e)
+                itype = index_get_type(index, e)
+                otype = getattr(itype, 'Name', None) if itype is not None else None
+                sets = index_get_psets(index, e)
+            except Exception:
+                pass
+        elif e.is_a('IfcMaterialDefinition') or e.is_a('IfcProfileDef'):
+            # Proprietà di materiali/profili (HasProperties): fuori dall'indice, lette direttamente
+            try:
+                sets = util.get_psets(e)
+            except Exception:
+                sets = {}
+        if otype is None:
+            otype = getattr(e, 'ObjectType', None)
 
-        # Pull all sets once
-        try:
-            sets = util.get_psets(e)
-        except Exception:
-            sets = {}
+        head = (eid, gid, cls, ptype, name, level, otype)
 
         for set_name, props in (sets or {}).items():
             if not isinstance(props, dict):
@@ -298,47 +418,305 @@ def get_ifc_full_dataframe(model):
             for pname, pval in (props or {}).items():
                 if isinstance(pname, str) and pname.lower() == 'id':
                     continue
-                records.append({
-                    'ExpressId': eid,
-                    'GlobalId': gid,
-                    'Class': cls,
-                    'PredefinedType': ptype,
-                    'Name': name,
-                    'Level': level,
-                    'Type': otype,
-                    'Source': source,
-                    'SetName': set_name,
-                    'AttributeName': pname,
-                    'Value': pval
-                })
+                yield head + (source, set_name, pname, pval)
+
+        # Direct native attributes (schema declaration, cached per class)
+        for attr_name, attr_val in iter_native_attributes(e, get_attribute_plan(schema_id, cls)):
+            yield head + ('Attribute', None, attr_name, attr_val)
+
+
+def iter_ifc_full_dataframe(model, batch_size=50_000, entities=None):
+    """
+    Streaming variant of get_ifc_full_dataframe: yields DataFrames of at most batch_size rows
+    (same columns/rows, in order), so peak memory is bounded by the batch, not by the model.
+    """
+    if model is None:
+        return
+    batch = []
+    for row in _iter_full_rows(model, entities):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield pd.DataFrame.from_records(batch, columns=FULL_COLUMNS)
+            batch = []
+    if batch:
+        yield pd.DataFrame.from_records(batch, columns=FULL_COLUMNS)
+
+
+def write_ifc_full_dataframe(model, path, fmt=None, batch_size=50_000):
+    """
+    Stream the long-form DataFrame straight to disk (Parquet or CSV) batch by batch.
+    The format is taken from fmt or from the file suffix. Returns the number of rows written.
+    Parquet uses a fixed schema (ExpressId int64, all other columns as text).
+    """
+    fmt = (fmt or str(path).rsplit('.', 1)[-1]).lower()
+    rows = 0
+    if fmt == 'csv':
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            header = True
+            for df in iter_ifc_full_dataframe(model, batch_size):
+                df.to_csv(f, index=False, header=header)
+                header = False
+                rows += len(df)
+            if header:
+                pd.DataFrame(columns=FULL_COLUMNS).to_csv(f, index=False)
+        return rows
+    if fmt != 'parquet':
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([('ExpressId', pa.int64())] + [(c, pa.string()) for c in FULL_COLUMNS[1:]])
+
+    def _text(v):
+        return None if v is None or (isinstance(v, float) and v != v) else str(v)
+
+    with pq.ParquetWriter(str(path), schema) as writer:
+        for df in iter_ifc_full_dataframe(model, batch_size):
+            arrays = [pa.array(df['ExpressId'].tolist(), type=pa.int64())]
+            arrays += [pa.array([_text(v) for v in df[c].tolist()], type=pa.string()) for c in FULL_COLUMNS[1:]]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows += len(df)
+    return rows
+
+
+def get_ifc_full_dataframe(model, compact=True):
+    """
+    Create a single long-form DataFrame aggregating all available data:
+    - All entities/classes
+    - All properties (Psets)
+    - All quantities (Qtos)
+    - Selected direct native attributes
+    Each row represents a property or quantity associated to an entity.
+
+    With compact=True (default) the frame uses the compact dtypes of compact_full_dataframe
+    (categoricals, int32 ExpressId, Value split into ValueNumeric/ValueText).
+    """
+    if model is None:
+        empty = pd.DataFrame(columns=FULL_COLUMNS)
+        return compact_full_dataframe(empty) if compact else empty
+
+    if not compact:
+        batches = list(iter_ifc_full_dataframe(model))
+        return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=FULL_COLUMNS)
+
+    # Compattazione dentro il ciclo: si conservano solo i batch già compattati (picco di memoria limitato)
+    return _concat_compact([compact_full_dataframe(b) for b in iter_ifc_full_dataframe(model)])
+
+
+def _concat_compact(parts):
+    """Concatenate compacted batches, merging the categories of the categorical columns."""
+    if not parts:
+        return compact_full_dataframe(pd.DataFrame(columns=FULL_COLUMNS))
+    if len(parts) == 1:
+        return parts[0]
+    out = {}
+    for col in parts[0].columns:
+        if isinstance(parts[0][col].dtype, pd.CategoricalDtype):
+            out[col] = pd.Series(union_categoricals([p[col] for p in parts]), name=col)
+        else:
+            out[col] = pd.concat([p[col] for p in parts], ignore_index=True)
+    return pd.DataFrame(out)
+
+
+# ------------------------------
+# Compact dtypes for the long-form DataFrame
+# ------------------------------
+
+# Colonne ripetute su ogni riga dell'entità: bassa cardinalità rispetto al numero di righe
+CATEGORICAL_COLUMNS = ('GlobalId', 'Class', 'PredefinedType', 'Name', 'Level', 'Type', 'Source', 'SetName', 'AttributeName')
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _as_category(s):
+    # Categorie sempre testuali: batch diversi restano unibili (union_categoricals)
+    cat = s.astype('category')
+    cats = cat.cat.categories
+    if len(cats) == 0 or not pd.api.types.is_string_dtype(cats) or cats.dtype == object:
+        cat = cat.cat.rename_categories(pd.Index([str(c) for c in cats], dtype='str'))
+    return cat
 
-        # Direct native attributes (filtered)
-        for attr_name in dir(e):
-            if attr_name.startswith('_'):
-                continue
-            try:
-                attr_val = getattr(e, attr_name)
-                if callable(attr_val) or isinstance(attr_val, (list, dict, set, tuple)):
-                    continue
-                if attr_val in (None, ''):
-                    continue
-                # Skip already captured core attributes to reduce noise
-                if attr_name in ('GlobalId', 'Name', 'Description', 'ObjectType', 'PredefinedType'):
-                    continue
-                records.append({
-                    'ExpressId': eid,
-                    'GlobalId': gid,
-                    'Class': cls,
-                    'PredefinedType': ptype,
-                    'Name': name,
-                    'Level': level,
-                    'Type': otype,
-                    'Source': 'Attribute',
-                    'SetName': None,
-                    'AttributeName': attr_name,
-                    'Value': attr_val
-                })
-            except Exception:
-                continue
 
-    return pd.DataFrame(records, columns=columns)
+def compact_full_dataframe(df):
+    """
+    Return the long-form frame with compact dtypes:
+    categoricals for CATEGORICAL_COLUMNS, int32 ExpressId and Value split into
+    ValueNumeric (float64, numbers only) and ValueText (categorical, everything else as text).
+    Frames already compacted are returned unchanged.
+    """
+    if 'Value' not in df.columns:
+        return df
+    out = {}
+    eid = pd.to_numeric(df['ExpressId'], errors='coerce')
+    out['ExpressId'] = eid.astype('Int32' if eid.isna().any() else 'int32')
+    for col in df.columns:
+        if col in ('ExpressId', 'Value'):
+            continue
+        out[col] = _as_category(df[col]) if col in CATEGORICAL_COLUMNS else df[col]
+    values = df['Value'].tolist()
+    out['ValueNumeric'] = pd.Series([float(v) if _is_number(v) else float('nan') for v in values], index=df.index, dtype='float64')
+    out['ValueText'] = pd.Series(
+        [None if v is None or _is_number(v) else str(v) for v in values], index=df.index, dtype=object
+    ).pipe(_as_category)
+    return pd.DataFrame(out, index=df.index)
+
+
+def with_value_column(df):
+    """Add back a single 'Value' column (text where present, else the number) for display/charts."""
+    if 'Value' in df.columns or 'ValueText' not in df.columns:
+        return df
+    df = df.copy()
+    text = df['ValueText'].astype(object)
+    df['Value'] = text.where(text.notna(), df['ValueNumeric'])
+    return df
+
+
+def full_dataframe_memory_report(df):
+    """
+    Memory per column (MB) of the compact frame vs the equivalent object-dtype layout
+    (ExpressId int64, strings as Python objects, single mixed Value column). Last row = total.
+    """
+    mb = 1024 ** 2
+    rows = []
+    for col in df.columns:
+        s = df[col]
+        after = s.memory_usage(deep=True, index=False)
+        if col == 'ValueNumeric':
+            continue
+        if col == 'ValueText':
+            col, before = 'Value', with_value_column(df[['ValueText', 'ValueNumeric']])['Value'].memory_usage(deep=True, index=False)
+            after += df['ValueNumeric'].memory_usage(deep=True, index=False)
+        elif col == 'ExpressId':
+            before = s.astype('int64').memory_usage(deep=True, index=False) if not s.isna().any() else s.astype(object).memory_usage(deep=True, index=False)
+        else:
+            before = s.astype(object).memory_usage(deep=True, index=False)
+        dtype = 'float64 + category' if col == 'Value' else str(s.dtype)
+        rows.append({'Column': col, 'Dtype': dtype, 'BeforeMB': before / mb, 'AfterMB': after / mb})
+    report = pd.DataFrame(rows, columns=['Column', 'Dtype', 'BeforeMB', 'AfterMB'])
+    total = {'Column': 'Total', 'Dtype': '', 'BeforeMB': report['BeforeMB'].sum(), 'AfterMB': report['AfterMB'].sum()}
+    report = pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+    report[['BeforeMB', 'AfterMB']] = report[['BeforeMB', 'AfterMB']].round(3)
+    return report
+
+
+# ------------------------------
+# Incremental update after in-app edits (tools/changetracker)
+# ------------------------------
+
+def _entities_by_id(model, ids):
+    out = []
+    for eid in ids:
+        try:
+            out.append(model.by_id(int(eid)))
+        except Exception:
+            continue
+    return out
+
+
+def _exists(model, eid):
+    try:
+        return model.by_id(eid) is not None
+    except Exception:
+        return False
+
+
+def patch_full_dataframe(model, df, changes):
+    """Replace only the rows of the created/modified/removed entities in the long-form frame."""
+    def _rows(ids):
+        batches = iter_ifc_full_dataframe(model, entities=_entities_by_id(model, ids))
+        if 'ValueText' in df.columns:
+            return _concat_compact([compact_full_dataframe(b) for b in batches])
+        batches = list(batches)
+        return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=FULL_COLUMNS)
+    return changetracker.patch_frame(df, changes, _rows, exists=lambda i: _exists(model, i))
+
+
+def patch_quantities(model, df, changes):
+    """Same as patch_full_dataframe for the QuantitiesFrame (get_ifc_quantities)."""
+    return changetracker.patch_frame(df, changes, lambda ids: get_ifc_quantities(model, entities=_entities_by_id(model, ids)),
+                                     exists=lambda i: _exists(model, i))
+
+
+# ------------------------------
+# Columnar export (Parquet / Feather) of FullDataFrame / QuantitiesFrame
+# ------------------------------
+
+COLUMNAR_FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'feather': ('.feather', 'application/vnd.apache.arrow.file'),
+}
+
+# Colonne a bassa cardinalità: scritte come dizionario (categorical alla rilettura)
+DICTIONARY_COLUMNS = ('Class', 'Level', 'Type', 'SetName')
+
+
+def _to_text(v):
+    return None if v is None or (isinstance(v, float) and v != v) else str(v)
+
+
+def _arrow_plan(df, dictionary_columns):
+    """Per ogni colonna: (tipo Arrow, convertitore Series -> pa.Array), deciso una volta sull'intero df."""
+    import pyarrow as pa
+    plan = []
+    for col in df.columns:
+        s = df[col]
+        if col in dictionary_columns or isinstance(s.dtype, pd.CategoricalDtype):
+            # Categorie globali: ogni batch condivide lo stesso dizionario
+            cats = s.dtype.categories if isinstance(s.dtype, pd.CategoricalDtype) else pd.Index(s.dropna().unique()).map(_to_text).unique()
+            dtype = pd.CategoricalDtype(cats)
+            arr_type = pa.dictionary(pa.int32(), pa.string())
+            plan.append((col, arr_type, lambda x, dtype=dtype, t=arr_type: pa.array(x.map(_to_text, na_action='ignore').astype(dtype), type=t)))
+            continue
+        kind = pd.api.types.infer_dtype(s, skipna=True)
+        if kind in ('integer', 'floating', 'mixed-integer-float', 'boolean') and s.dtype != object:
+            np_dtype = getattr(s.dtype, 'numpy_dtype', s.dtype)
+            arr_type = pa.from_numpy_dtype(np_dtype) if getattr(np_dtype, 'kind', 'O') in 'iufb' else pa.float64()
+        elif kind in ('floating', 'mixed-integer-float', 'integer'):
+            arr_type = pa.float64()
+        elif kind == 'boolean':
+            arr_type = pa.bool_()
+        else:
+            arr_type = pa.string()
+        if arr_type == pa.string() and kind not in ('string', 'empty'):
+            # Colonne miste (es. Value): serializzate come testo
+            plan.append((col, arr_type, lambda x, t=arr_type: pa.array([_to_text(v) for v in x.tolist()], type=t)))
+        else:
+            plan.append((col, arr_type, lambda x, t=arr_type: pa.array(x, type=t, from_pandas=True)))
+    return plan
+
+
+def write_columnar(df, path, fmt=None, batch_size=100_000, dictionary_columns=DICTIONARY_COLUMNS):
+    """
+    Write df to Parquet or Feather (Arrow IPC) in row batches, without building a full Arrow copy.
+    Class/Level/Type/SetName are stored dictionary-encoded. Returns the written path.
+    """
+    import pyarrow as pa
+    fmt = (fmt or str(path).rsplit('.', 1)[-1]).lower()
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    plan = _arrow_plan(df, dictionary_columns)
+    schema = pa.schema([(str(col), t) for col, t, _ in plan])
+    dict_cols = [str(col) for col, t, _ in plan if pa.types.is_dictionary(t)]
+
+    def _batches():
+        for start in range(0, len(df), batch_size):
+            part = df.iloc[start:start + batch_size]
+            arrays = [conv(part[col]) for col, _, conv in plan]
+            # Colonne str di pandas (Arrow) possono convertirsi in ChunkedArray
+            arrays = [a.combine_chunks() if isinstance(a, pa.ChunkedArray) else a for a in arrays]
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        with pq.ParquetWriter(str(path), schema, use_dictionary=dict_cols or False, compression='snappy') as writer:
+            for batch in _batches():
+                writer.write_batch(batch)
+    else:
+        codec = 'lz4' if pa.Codec.is_available('lz4') else None
+        with pa.OSFile(str(path), 'wb') as sink, pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression=codec)) as writer:
+            for batch in _batches():
+                writer.write_batch(batch)
+    return path
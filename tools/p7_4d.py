@@ -12,8 +12,9 @@ import ifcopenshell as ifc
 import ifcopenshell
 import ifcopenshell.api.sequence
 from ifcopenshell.guid import new as new_guid
-from ifcopenshell.util import element as ifc_element
 import streamlit as st
+from tools.p_shared import get_relationship_index, index_get_container, index_get_type
+from tools import changetracker
 
 # Alias sessione per UI
 session = st.session_state
@@ -86,6 +87,7 @@ def nest_under(model, parent_task, child_task):
 # Creazione e gestione task
 # ------------------------------
 
+@changetracker.tracked(modifies=('predecessor', 'work_schedule'))
 def add_task(model, name, predecessor, work_schedule):
     task = ifcopenshell.api.sequence.add_task(
         model, work_schedule=work_schedule, name=name, predefined_type="CONSTRUCTION"
@@ -99,6 +101,7 @@ def add_task(model, name, predecessor, work_schedule):
     return task
 
 
+@changetracker.tracked(modifies=('element_ids',))
 def create_tasks(model, element_ids: list[int], name_prefix: str = "Task", identification_prefix: str | None = None,
                  start_date=None, start_time=None, finish_date=None, finish_time=None, duration_iso: str | None = None,
                  mode: str = "per_element") -> int:
@@ -177,6 +180,7 @@ def create_tasks(model, element_ids: list[int], name_prefix: str = "Task", ident
     return created
 
 
+@changetracker.tracked(modifies=('schedule_id', 'element_ids'))
 def create_tasks_for_elements_in_schedule(model, schedule_id: int, element_ids: list[int], task_name_prefix: str = 'Task') -> int:
     """Crea una task per ogni elemento e la inserisce nella WorkSchedule, collegando elemento (RelAssignsToProcess) e schedule (RelAssignsToControl)."""
     sched = model.by_id(int(schedule_id)) if schedule_id else None
@@ -215,6 +219,7 @@ def create_tasks_for_elements_in_schedule(model, schedule_id: int, element_ids:
     return created
 
 
+@changetracker.tracked(removes=('task_id',))
 def delete_task(model, task_id: int) -> bool:
     t = model.by_id(int(task_id)) if task_id else None
     if not t:
@@ -330,6 +335,7 @@ def build_all_tasks_df(ifc_file, schedule_id: int | None = None) -> pd.DataFrame
 # Schedules e Work Plan
 # ------------------------------
 
+@changetracker.tracked()
 def create_work_schedule(model, name=None, identification=None, predefined_type='PLANNED', start_time=None, finish_time=None, purpose=None):
     ws = None
     try:
@@ -394,6 +400,7 @@ def get_unassigned_tasks(ifc_file):
     return out
 
 
+@changetracker.tracked(modifies=('schedule_id', 'task_ids'))
 def assign_tasks_to_schedule(model, schedule_id: int, task_ids: list[int]) -> int:
     ws = model.by_id(int(schedule_id)) if schedule_id else None
     if not ws:
@@ -414,6 +421,7 @@ def assign_tasks_to_schedule(model, schedule_id: int, task_ids: list[int]) -> in
     return assigned
 
 
+@changetracker.tracked()
 def create_work_plan(model, name=None):
     wp = None
     try:
@@ -432,6 +440,7 @@ def create_work_plan(model, name=None):
     return wp
 
 
+@changetracker.tracked(modifies=('workplan_id', 'schedule_id'))
 def aggregate_schedule_to_workplan(model, workplan_id, schedule_id) -> bool:
     wp = model.by_id(int(workplan_id)) if workplan_id else None
     sched = model.by_id(int(schedule_id)) if schedule_id else None
@@ -449,6 +458,7 @@ def aggregate_schedule_to_workplan(model, workplan_id, schedule_id) -> bool:
         return False
 
 
+@changetracker.tracked(removes=('plan_id',))
 def delete_work_plan(model, plan_id: int) -> bool:
     wp = model.by_id(int(plan_id)) if plan_id else None
     if not wp:
@@ -494,11 +504,16 @@ def get_scheduled_element_ids(ifc_file):
     return scheduled
 
 
-def build_unscheduled_df(ifc_file):
+def build_unscheduled_df(ifc_file, element_ids=None):
+    """Elementi non assegnati a task di una schedule; element_ids limita il calcolo (patch incrementale)."""
     rows = []
     scheduled_ids = get_scheduled_element_ids(ifc_file)
+    index = get_relationship_index(ifc_file)
     try:
-        elements = ifc_file.by_type('IfcElement') or []
+        if element_ids is None:
+            elements = ifc_file.by_type('IfcElement') or []
+        else:
+            elements = [e for e in (ifc_file.by_id(int(i)) for i in element_ids) if e is not None and e.is_a('IfcElement')]
     except Exception:
         elements = []
     for el in elements:
@@ -508,13 +523,13 @@ def build_unscheduled_df(ifc_file):
                 continue
             container = None
             try:
-                c = ifc_element.get_container(el)
+                c = index_get_container(index, el)
                 container = c.Name if c is not None else None
             except Exception:
                 container = None
             tname = None
             try:
-                t = ifc_element.get_type(el)
+                t = index_get_type(index, el)
                 tname = t.Name if t is not None else None
             except Exception:
                 tname = None
@@ -528,7 +543,25 @@ def build_unscheduled_df(ifc_file):
             })
         except Exception:
             continue
-    return pd.DataFrame(rows)
+    return pd.DataFrame(rows, columns=['ExpressId', 'GlobalId', 'Class', 'Name', 'Level', 'Type'])
+
+
+def get_unscheduled_df(ifc_file):
+    """build_unscheduled_df conservato in sessione e aggiornato solo per le entità modificate (changetracker)."""
+    def _patch(df, changes):
+        # Una task aggiunta/tolta da una schedule cambia lo stato degli elementi che la task gestisce
+        changes = dict(changes, modified=set(changes["modified"]))
+        for tid in changes["created"] | changes["modified"]:
+            try:
+                task = ifc_file.by_id(tid)
+            except Exception:
+                continue
+            if task is None or not task.is_a('IfcTask'):
+                continue
+            for rel in getattr(task, 'OperatesOn', []) or []:
+                changes["modified"].update(o.id() for o in getattr(rel, 'RelatedObjects', []) or [])
+        return changetracker.patch_frame(df, changes, lambda ids: build_unscheduled_df(ifc_file, ids))
+    return changetracker.sync_frame(session, "UnscheduledFrame", ifc_file, lambda: build_unscheduled_df(ifc_file), _patch)
 
 
 def build_nesting_df(ifc_file) -> pd.DataFrame:
@@ -574,6 +607,7 @@ def list_work_calendars(model):
         return []
 
 
+@changetracker.tracked()
 def create_work_calendar(model, name: str | None = None, predefined_type: str = "NOTDEFINED", description: str | None = None, object_type: str | None = None):
     try:
         # Enforce where-clause: if USERDEFINED then ObjectType must be set
@@ -591,6 +625,7 @@ def create_work_calendar(model, name: str | None = None, predefined_type: str =
         return None
 
 
+@changetracker.tracked(modifies=('child_calendar_id', 'base_calendar_id'))
 def link_base_calendar(model, child_calendar_id: int, base_calendar_id: int) -> bool:
     try:
         child = model.by_id(int(child_calendar_id))
@@ -609,6 +644,7 @@ def link_base_calendar(model, child_calendar_id: int, base_calendar_id: int) ->
         return False
 
 
+@changetracker.tracked(removes=('calendar_id',))
 def delete_work_calendar(model, calendar_id: int) -> bool:
     cal = model.by_id(int(calendar_id)) if calendar_id else None
     if not cal:
@@ -620,6 +656,7 @@ def delete_work_calendar(model, calendar_id: int) -> bool:
         return False
 
 
+@changetracker.tracked(modifies=('calendar_id',))
 def add_calendar_time(model, calendar_id: int, name: str | None, start_iso: str | None, finish_iso: str | None, is_exception: bool = False) -> bool:
     try:
         cal = model.by_id(int(calendar_id))
@@ -684,6 +721,7 @@ def add_calendar_time(model, calendar_id: int, name: str | None, start_iso: str
         return False
 
 
+@changetracker.tracked(modifies=('calendar_id', 'object_ids'))
 def assign_calendar_to_objects(model, calendar_id: int, object_ids: list[int]) -> int:
     cal = model.by_id(int(calendar_id)) if calendar_id else None
     if not cal:
@@ -739,6 +777,7 @@ def get_work_plan_attrs(wp) -> dict:
         return {}
 
 
+@changetracker.tracked(modifies=('plan_id',))
 def update_work_plan(model, plan_id: int, name: str | None = None, identification: str | None = None,
                      purpose: str | None = None, predefined_type: str | None = None,
                      creation_datetime: str | None = None, start_time: str | None = None, finish_time: str | None = None,
@@ -772,6 +811,7 @@ def update_work_plan(model, plan_id: int, name: str | None = None, identificatio
         return False
 
 
+@changetracker.tracked(modifies=('work_plan_or_id',))
 def link_work_plan_to_project(model, work_plan_or_id) -> bool:
     try:
         wp = work_plan_or_id
@@ -799,6 +839,7 @@ def format_date_from_iso(iso_date=None):
         return ''
 
 # Aggiungi creazione CostSchedule minimale (compatibilità)
+@changetracker.tracked()
 def create_cost_schedule(model, name=None):
     try:
         ifcopenshell.api.run('cost.add_cost_schedule', model, name=name)
@@ -5,14 +5,23 @@ Uso:
 - Project Info page: get_project, get_stories, get_ifc_structure
 - Model Properties pages: get_types, get_type_occurence, get_ifc_structure
 - Utilities generali: get_x_and_y per grafici/ordinamenti
+- Ispettore oggetti (debug): inspector_view / inspector_page (sezioni a pagine, conteggi subito, viste in cache)
+- Indice relazioni: get_relationship_index / index_get_psets / index_get_container / index_get_storey / index_get_type
+- Censimento entità: get_entity_census / census_count / census_classes / census_leaf_counts (conteggi foglia
+  + albero dei sottotipi dello schema: schema_subtype_tree / schema_descendants)
 
 Nota: Commenti in italiano. Output/ritorni pensati per UI in inglese.
 """
 
 from __future__ import annotations
-from typing import Iterable, Dict, List, Any
+from typing import Iterable, Dict, List, Any, Optional, Tuple
+import functools
 import os
+import weakref
+import ifcopenshell
+from ifcopenshell import ifcopenshell_wrapper
 from ifcopenshell.util import element as ifc_element
+from tools import changetracker
 import pandas as pd
 
 # ==========================================================
@@ -33,14 +42,13 @@ def get_stories(model) -> List[Dict[str, Any]]:
 
 def get_types(model, parent_class=None):
     """Return a set of IFC classes/types present in the model. Optionally filter by parent_class."""
-    if parent_class:
-        return set(i.is_a() for i in model if i.is_a(parent_class))
-    return set(i.is_a() for i in model)
+    return set(census_classes(get_entity_census(model), parent_class))
 
 
 def get_type_occurence(model, types: Iterable[str]):
-    """Count occurrences for each type in the provided iterable."""
-    return {t: len(model.by_type(t)) for t in types}
+    """Count occurrences for each type in the provided iterable (subtypes included, like by_type)."""
+    census = get_entity_census(model)
+    return {t: census_count(census, t) for t in types}
 
 
 def get_ifc_structure(ifc_file) -> Dict[str, Dict[str, List[str]]]:
@@ -50,7 +58,7 @@ def get_ifc_structure(ifc_file) -> Dict[str, Dict[str, List[str]]]:
     if schema_name not in official_schemas:
         return {}
     result: Dict[str, Dict[str, List[str]]] = {}
-    classes_in_file = sorted(set(obj.is_a() for obj in ifc_file))
+    classes_in_file = sorted(get_entity_census(ifc_file)['counts'])
     for cls in classes_in_file:
         result[cls] = {}
         elements = ifc_file.by_type(cls)
@@ -67,6 +75,297 @@ def get_ifc_structure(ifc_file) -> Dict[str, Dict[str, List[str]]]:
                                 result[cls][pset_name].append(prop_name)
     return result
 
+# ==========================================================
+# SHARED — Relationship index (Pset/Qto, container, type)
+# Dove usate: Properties & Quantities (pag. 6), IDS (pag. 2), 4D (unscheduled)
+# ==========================================================
+# Un solo passaggio su IfcRelDefinesByProperties / IfcRelContainedInSpatialStructure /
+# IfcRelDefinesByType sostituisce le chiamate per-elemento a get_psets/get_container/get_type.
+# Per il contenitore indiretto (parti di aggregati, elementi annidati, aperture) si indicizza anche
+# il genitore nella gerarchia, con le stesse priorità di ifc_element.get_parent.
+
+_REL_INDEX_CACHE: Dict[int, tuple] = {}
+
+
+def _remember(cache: Dict[int, tuple], model, entry: tuple) -> None:
+    """Salva entry (che inizia con weakref.ref(model)) in cache[id(model)]; la voce è rimossa
+    quando il modello viene liberato (re-upload, modelli dei worker di ids_batch)."""
+    key = id(model)
+    current = cache.get(key)
+    if current is None or current[0]() is not model:
+        weakref.finalize(model, cache.pop, key, None)
+    cache[key] = entry
+
+
+# (relazione, attributo del genitore, attributo dei figli), in ordine di priorità
+_PARENT_RELATIONS = (
+    ('IfcRelAggregates', 'RelatingObject', 'RelatedObjects'),
+    ('IfcRelNests', 'RelatingObject', 'RelatedObjects'),
+    ('IfcRelFillsElement', 'RelatingOpeningElement', 'RelatedBuildingElement'),
+    ('IfcRelVoidsElement', 'RelatingBuildingElement', 'RelatedOpeningElement'),
+    ('IfcRelAdheresToElement', 'RelatingElement', 'RelatedSurfaceFeatures'),
+)
+
+
+def _iter_definitions(definition):
+    # IFC4: RelatingPropertyDefinition può essere un IfcPropertySetDefinitionSet (tupla)
+    if isinstance(definition, (list, tuple)):
+        return [d for d in definition if d is not None]
+    return [definition] if definition is not None else []
+
+
+def build_relationship_index(model) -> Dict[str, Dict[int, Any]]:
+    """Costruisce l'indice {element id → psets/qtos/container/type} con un solo passaggio sulle relazioni."""
+    index: Dict[str, Dict[int, Any]] = {
+        'definitions': {},   # def id -> (Name, is_qto, {prop: value, 'id': def id})
+        'occurrence': {},    # element id -> [def id, ...]
+        'type_sets': {},     # type id -> [def id, ...]
+        'container': {},     # element id -> IfcSpatialElement (contenimento diretto)
+        'parent': {},        # element id -> aggregato / nest / apertura / elemento ospite
+        'type': {},          # element id -> IfcTypeObject
+    }
+    if model is None or not hasattr(model, 'by_type'):
+        return index
+    definitions = index['definitions']
+
+    def register(definition) -> Optional[int]:
+        try:
+            did = definition.id()
+        except Exception:
+            return None
+        if did not in definitions:
+            try:
+                props = ifc_element.get_property_definition(definition) or {}
+            except Exception:
+                props = {}
+            definitions[did] = (getattr(definition, 'Name', None), definition.is_a('IfcElementQuantity'), props)
+        return did
+
+    for rel in model.by_type('IfcRelDefinesByProperties') or []:
+        dids = [d for d in (register(x) for x in _iter_definitions(rel.RelatingPropertyDefinition)) if d is not None]
+        if not dids:
+            continue
+        for obj in rel.RelatedObjects or []:
+            index['occurrence'].setdefault(obj.id(), []).extend(dids)
+
+    for rel in model.by_type('IfcRelDefinesByType') or []:
+        rtype = rel.RelatingType
+        if rtype is None:
+            continue
+        for obj in rel.RelatedObjects or []:
+            index['type'].setdefault(obj.id(), rtype)
+
+    for rtype in model.by_type('IfcTypeObject') or []:
+        dids = [d for d in (register(x) for x in (getattr(rtype, 'HasPropertySets', None) or [])) if d is not None]
+        if dids:
+            index['type_sets'][rtype.id()] = dids
+
+    for rel in model.by_type('IfcRelContainedInSpatialStructure') or []:
+        structure = rel.RelatingStructure
+        for obj in rel.RelatedElements or []:
+            index['container'].setdefault(obj.id(), structure)
+
+    # Genitore come ifc_element.get_parent: aggregazione, nesting, riempimento, foratura, aderenza
+    parent = index['parent']
+    for rel_class, parent_attr, child_attr in _PARENT_RELATIONS:
+        try:
+            rels = model.by_type(rel_class) or []
+        except Exception:
+            continue  # relazione assente nello schema (es. IfcRelAdheresToElement prima di IFC4X3)
+        for rel in rels:
+            whole = getattr(rel, parent_attr, None)
+            parts = getattr(rel, child_attr, None)
+            if whole is None or parts is None:
+                continue
+            for obj in parts if isinstance(parts, (list, tuple)) else [parts]:
+                if obj is not None:
+                    parent.setdefault(obj.id(), whole)
+
+    return index
+
+
+def get_relationship_index(model, refresh: bool = False) -> Dict[str, Dict[int, Any]]:
+    """Restituisce l'indice relazioni del modello, memoizzato per istanza di modello."""
+    key = id(model)
+    cached = _REL_INDEX_CACHE.get(key)
+    if cached is not None and not refresh and cached[0]() is model:
+        return cached[1]
+    index = build_relationship_index(model)
+    try:
+        _remember(_REL_INDEX_CACHE, model, (weakref.ref(model), index))
+    except TypeError:
+        pass
+    return index
+
+
+def invalidate_relationship_index(model=None) -> None:
+    """Invalida l'indice memoizzato (di un modello o di tutti)."""
+    if model is None:
+        _REL_INDEX_CACHE.clear()
+    else:
+        _REL_INDEX_CACHE.pop(id(model), None)
+
+
+def index_get_psets(index, element, psets_only: bool = False, qtos_only: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Equivalente di ifc_element.get_psets letto dall'indice (Pset del tipo ereditati, poi occorrenza)."""
+    eid = element if isinstance(element, int) else element.id()
+    definitions = index['definitions']
+    psets: Dict[str, Dict[str, Any]] = {}
+    itype = index['type'].get(eid)
+    dids = list(index['type_sets'].get(itype.id(), [])) if itype is not None else []
+    if eid in index['type_sets']:
+        dids = list(index['type_sets'][eid])
+    n_type = len(dids)
+    dids.extend(index['occurrence'].get(eid, []))
+    for pos, did in enumerate(dids):
+        name, is_qto, props = definitions[did]
+        if (psets_only and is_qto) or (qtos_only and not is_qto):
+            continue
+        if pos < n_type:
+            psets[name] = dict(props)
+        else:
+            psets.setdefault(name, {}).update(props)
+    return psets
+
+
+def index_get_container(index, element):
+    """Equivalente di ifc_element.get_container letto dall'indice: contenitore diretto, altrimenti
+    quello del primo genitore contenuto (es. IfcStairFlight -> IfcStair -> piano)."""
+    eid = element if isinstance(element, int) else element.id()
+    containers, parents = index['container'], index.get('parent', {})
+    seen = set()
+    while eid is not None and eid not in seen:
+        container = containers.get(eid)
+        if container is not None:
+            return container
+        seen.add(eid)
+        parent = parents.get(eid)
+        eid = parent.id() if parent is not None else None
+    return None
+
+
+def index_get_storey(index, element) -> Optional[str]:
+    """Nome del piano (IfcBuildingStorey) che contiene l'elemento, risalendo le aggregazioni
+    (es. IfcSpace -> IfcBuildingStorey); None se l'elemento non è in un piano."""
+    container = index_get_container(index, element)
+    depth = 0
+    while container is not None and not container.is_a('IfcBuildingStorey') and depth < 16:
+        container = ifc_element.get_aggregate(container)
+        depth += 1
+    if container is None or not container.is_a('IfcBuildingStorey'):
+        return None
+    return container.Name or f"#{container.id()}"
+
+
+def index_get_type(index, element):
+    """Equivalente di ifc_element.get_type letto dall'indice."""
+    if not isinstance(element, int) and element.is_a('IfcTypeObject'):
+        return element
+    return index['type'].get(element if isinstance(element, int) else element.id())
+
+# ==========================================================
+# SHARED — Censimento entità (conteggi per classe)
+# Dove usate: Health Checker (pag. 4), graph_maker, get_types / get_type_occurence
+# ==========================================================
+# Un solo passaggio per modello (e revisione del changetracker) sostituisce le iterazioni
+# complete con is_a() e le chiamate by_type per classe. Le domande "quanti X compresi i sottotipi"
+# sommano i conteggi foglia sul sottoalbero di X, precalcolato una volta per schema.
+
+_CENSUS_CACHE: Dict[int, tuple] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def schema_subtype_tree(schema_name: str) -> Dict[str, Tuple[str, ...]]:
+    """Albero dei sottotipi diretti dello schema (entità -> sottotipi), dalle dichiarazioni di ifcopenshell."""
+    try:
+        schema = ifcopenshell_wrapper.schema_by_name(schema_name)
+    except Exception:
+        return {}
+    return {e.name(): tuple(sub.name() for sub in e.subtypes()) for e in schema.entities()}
+
+
+@functools.lru_cache(maxsize=None)
+def _schema_names(schema_name: str) -> Dict[str, str]:
+    # Nome in minuscolo -> nome dello schema (by_type non distingue maiuscole/minuscole)
+    return {name.lower(): name for name in schema_subtype_tree(schema_name)}
+
+
+@functools.lru_cache(maxsize=4096)
+def schema_descendants(schema_name: str, class_name: str) -> Tuple[str, ...]:
+    """La classe e tutti i suoi sottotipi (diretti e indiretti) nello schema; solo la classe se lo schema non la conosce."""
+    tree = schema_subtype_tree(schema_name)
+    root = _schema_names(schema_name).get(class_name.lower())
+    if root is None:
+        return (class_name,)
+    out, stack = [], [root]
+    while stack:
+        name = stack.pop()
+        out.append(name)
+        stack.extend(tree.get(name, ()))
+    return tuple(out)
+
+
+def build_entity_census(model) -> Dict[str, Any]:
+    """Conteggi esatti per classe (foglie, sottotipi esclusi) del modello in un solo passaggio.
+
+    Ritorna {'counts': classe -> istanze, 'schema': schema del modello, 'total': entità del file}.
+    I conteggi con i sottotipi si ottengono sommando le foglie del sottoalbero (census_count).
+    """
+    counts: Dict[str, int] = {}
+    if model is not None and hasattr(model, 'by_type'):
+        try:
+            # Le istanze sono già indicizzate per tipo nel file: niente iterazione in Python
+            for cls in model.types():
+                counts[cls] = len(model.by_type(cls, include_subtypes=False))
+        except Exception:
+            counts = {}
+            for entity in model:
+                cls = entity.is_a()
+                counts[cls] = counts.get(cls, 0) + 1
+    schema = getattr(model, 'schema_identifier', None) or str(getattr(model, 'schema', '') or '')
+    return {'counts': counts, 'schema': schema, 'total': sum(counts.values())}
+
+
+def get_entity_census(model, refresh: bool = False) -> Dict[str, Any]:
+    """Censimento del modello (build_entity_census), memoizzato per istanza e revisione del modello."""
+    key = id(model)
+    revision = changetracker.get_revision(model)
+    cached = _CENSUS_CACHE.get(key)
+    if cached is not None and not refresh and cached[0]() is model and cached[1] == revision:
+        return cached[2]
+    census = build_entity_census(model)
+    try:
+        _remember(_CENSUS_CACHE, model, (weakref.ref(model), revision, census))
+    except TypeError:
+        pass
+    return census
+
+
+def census_count(census: Dict[str, Any], class_name: str, include_subtypes: bool = True) -> int:
+    """Istanze di una classe, come len(by_type(cls)): somma dei conteggi foglia del suo sottoalbero
+    nello schema (O(classi), nessuna query sul modello). Classi assenti o di altri schemi valgono 0."""
+    counts = census['counts']
+    if not include_subtypes:
+        name = _schema_names(census['schema']).get(class_name.lower(), class_name)
+        return counts.get(name, 0)
+    return sum(counts.get(name, 0) for name in schema_descendants(census['schema'], class_name))
+
+
+def census_classes(census: Dict[str, Any], parent_class: Optional[str] = None) -> List[str]:
+    """Classi presenti nel modello, eventualmente solo parent_class e i suoi sottotipi."""
+    if not parent_class:
+        return list(census['counts'])
+    subtree = set(schema_descendants(census['schema'], parent_class))
+    return [cls for cls in census['counts'] if cls in subtree]
+
+
+def census_leaf_counts(census: Dict[str, Any], class_name: str) -> Dict[str, int]:
+    """Conteggi esatti delle classi del sottoalbero presenti nel modello (classe -> istanze), decrescenti."""
+    counts = census['counts']
+    leaves = {name: counts[name] for name in schema_descendants(census['schema'], class_name) if counts.get(name)}
+    return dict(sorted(leaves.items(), key=lambda kv: kv[1], reverse=True))
+
+
 # ==========================================================
 # SHARED — Data extraction & DataFrame helpers
 # Dove usate: IDS (pag. 2), BCF (pag. 3), Properties & Quantities (pag. 6), 4D (Timeline)
@@ -89,18 +388,21 @@ def save_ifc_to_public(ifc_file):
     return "/temp_model.ifc"
 
 
-def get_objects_data_by_class(model, class_type):
-    """Estrae dati oggetto per tutte le istanze di class_type, includendo Pset/Qto e meta base."""
+def get_objects_data_by_class(model, class_type, index=None):
+    """Estrae dati oggetto per tutte le istanze di class_type, includendo Pset/Qto e meta base.
+    Pset/Qto, container e tipo sono letti dall'indice relazioni (get_relationship_index)."""
     objects = model.by_type(class_type) if hasattr(model, 'by_type') else []
+    if index is None:
+        index = get_relationship_index(model)
     objects_data = []
     pset_attributes = set()
     for obj in objects:
         try:
-            qtos = ifc_element.get_psets(obj, qtos_only=True) or {}
+            qtos = index_get_psets(index, obj, qtos_only=True)
         except Exception:
             qtos = {}
         try:
-            psets = ifc_element.get_psets(obj, psets_only=True) or {}
+            psets = index_get_psets(index, obj, psets_only=True)
         except Exception:
             psets = {}
         for pset_name, pset_data in qtos.items():
@@ -112,12 +414,12 @@ def get_objects_data_by_class(model, class_type):
                 if pname != 'id':
                     pset_attributes.add(f"{pset_name}.{pname}")
         try:
-            container = ifc_element.get_container(obj)
+            container = index_get_container(index, obj)
             level_name = container.Name if container is not None else None
         except Exception:
             level_name = None
         try:
-            itype = ifc_element.get_type(obj)
+            itype = index_get_type(index, obj)
             type_name = itype.Name if itype is not None else None
         except Exception:
             type_name = None
@@ -157,29 +459,62 @@ def get_attribute_value(object_data, attribute):
     return None
 
 
+def _find_set(object_data, pset_name):
+    # Stessa precedenza di get_attribute_value: Pset esatto, Qto esatto, poi case-insensitive
+    psets = object_data.get('PropertySets', {}) or {}
+    qtos = object_data.get('QuantitySets', {}) or {}
+    if pset_name in psets:
+        return psets[pset_name]
+    if pset_name in qtos:
+        return qtos[pset_name]
+    lower = pset_name.lower()
+    for sets in (psets, qtos):
+        for pn, props in sets.items():
+            if pn.lower() == lower:
+                return props
+    return None
+
+
 def create_pandas_dataframe(objects_data, pset_attributes):
-    """Costruisce un DataFrame a partire da objects_data e lista attributi Pset/Qto."""
+    """Costruisce un DataFrame a partire da objects_data e lista attributi Pset/Qto.
+    Costruzione colonnare (una lista per colonna): lineare nel numero di oggetti."""
     base_attrs = ['ExpressId', 'GlobalId', 'Class', 'PredefinedType', 'Name', 'Level', 'Type']
     attrs = base_attrs + sorted(pset_attributes or [])
-    records = []
-    for od in objects_data:
-        row = {k: get_attribute_value(od, k) for k in attrs}
-        for b in base_attrs:
-            if b not in row:
-                row[b] = od.get(b)
-        records.append(row)
-    df = pd.DataFrame(records, columns=attrs)
-    if objects_data:
-        for od in objects_data:
-            for qname, qdict in (od.get('QuantitySets') or {}).items():
-                for k, v in qdict.items():
-                    if k == 'id':
-                        continue
-                    col = f"{qname}.{k}"
-                    if col not in df.columns:
-                        df[col] = None
-                    df.loc[df['ExpressId'] == od.get('ExpressId'), col] = v
-    return df
+    objects_data = list(objects_data or [])
+    n = len(objects_data)
+    columns: Dict[str, List[Any]] = {k: [None] * n for k in attrs}
+
+    # Raggruppa le colonne 'Set.Prop' per nome del set: una lookup del set per oggetto
+    plain_attrs = [a for a in attrs if '.' not in a]
+    groups: Dict[str, List[tuple]] = {}
+    for a in attrs:
+        if '.' in a:
+            set_name, prop_name = a.split('.', 1)
+            groups.setdefault(set_name, []).append((a, prop_name))
+
+    for i, od in enumerate(objects_data):
+        for a in plain_attrs:
+            columns[a][i] = od.get(a)
+        for set_name, cols in groups.items():
+            props = _find_set(od, set_name)
+            if props is None:
+                continue
+            for col, prop_name in cols:
+                columns[col][i] = props.get(prop_name)
+
+        # Le quantità hanno la precedenza (come il vecchio aggiornamento df.loc per ExpressId)
+        if od.get('ExpressId') is None:
+            continue
+        for qname, qdict in (od.get('QuantitySets') or {}).items():
+            for k, v in qdict.items():
+                if k == 'id':
+                    continue
+                col = f"{qname}.{k}"
+                if col not in columns:
+                    columns[col] = [None] * n
+                columns[col][i] = v
+
+    return pd.DataFrame(columns, columns=list(columns.keys()))
 
 
 def get_x_and_y(values: Dict[Any, float], higher_then: float | None = None):
@@ -190,3 +525,150 @@ def get_x_and_y(values: Dict[Any, float], higher_then: float | None = None):
     x_values = [item[0] for item in sorted_items]
     y_values = [item[1] for item in sorted_items]
     return x_values, y_values
+
+# ==========================================================
+# SHARED — Object inspector (pannelli di debug)
+# Dove usate: Health Checker (pag. 4), 5D Cost Estimation (pag. 8)
+# ==========================================================
+# Le sezioni di un'entità (attributi, attributi inversi, riferimenti inversi) sono lette solo
+# quando richieste e restituite a pagine; i conteggi sono disponibili subito. Le viste visitate
+# restano in un dizionario fornito dalla pagina (breadcrumb in sessione) e non vengono ricalcolate.
+
+INSPECTOR_PAGE_SIZE = 50
+INSPECTOR_INLINE_ITEMS = 10      # aggregati più corti espansi in riga (name[i]), come il pannello storico
+INSPECTOR_MAX_TEXT = 200         # testo di una riga troncato (str() di una relazione può superare i 10k caratteri)
+INSPECTOR_MAX_VIEWS = 32
+INSPECTOR_SECTIONS = ('attributes', 'inverse_attributes', 'inverse_references')
+
+
+def _inspector_text(value: Any) -> str:
+    text = str(value)
+    return text if len(text) <= INSPECTOR_MAX_TEXT else text[:INSPECTOR_MAX_TEXT] + f"… ({len(text)} chars)"
+
+
+def _inspector_row(name: Optional[str], value: Any) -> Dict[str, Any]:
+    # Riga del pannello: int_value = id dell'entità collegata; count = elementi di un aggregato caricabile a parte
+    is_entity = isinstance(value, ifcopenshell.entity_instance)
+    is_aggregate = isinstance(value, tuple) and len(value) >= INSPECTOR_INLINE_ITEMS
+    return {
+        "name": f"{name}({len(value)})" if is_aggregate and name else name,
+        "key": name,
+        "string_value": f"{len(value)} items" if is_aggregate else _inspector_text(value),
+        "int_value": int(value.id()) if is_entity and value.id() else None,
+        "count": len(value) if is_aggregate else None,
+    }
+
+
+def _inspector_items(view: Dict[str, Any], model, section: str) -> List[Any]:
+    # Elementi di una sezione, letti al primo accesso e conservati nella vista
+    items = view["sections"].get(section)
+    if items is not None:
+        return items
+    entity = model.by_id(view["id"])
+    if section == "attributes":
+        items = []
+        for i in range(len(entity)):
+            name, value = entity.attribute_name(i), entity[i]
+            if isinstance(value, tuple) and len(value) < INSPECTOR_INLINE_ITEMS:
+                items.extend((f"{name}[{j}]", v) for j, v in enumerate(value))
+            else:
+                items.append((name, value))
+    elif section == "inverse_attributes":
+        items = []
+        for name in entity.get_inverse_attribute_names():
+            value = getattr(entity, name, None)
+            if not value:
+                continue
+            if isinstance(value, tuple) and len(value) < INSPECTOR_INLINE_ITEMS:
+                items.extend((f"{name}[{j}]", v) for j, v in enumerate(value))
+            else:
+                items.append((name, value))
+    elif section == "inverse_references":
+        # Solo gli id: le entità sono risolte pagina per pagina
+        items = [inv.id() for inv in model.get_inverse(entity)]
+    else:
+        raise ValueError(f"Unknown inspector section: {section}")
+    view["sections"][section] = items
+    return items
+
+
+def inspector_view(model, step_id: int, views: Optional[Dict[int, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Vista di un'entità per il pannello di debug: classe, etichetta e conteggi per sezione.
+
+    Nessuna sezione è espansa qui (vedi inspector_page). views: viste già visitate (es. breadcrumb in
+    sessione), riusate e aggiornate; al massimo INSPECTOR_MAX_VIEWS. None se l'id non esiste.
+    """
+    step_id = int(step_id)
+    if views is not None and step_id in views:
+        views[step_id] = views.pop(step_id)  # più recente in coda
+        return views[step_id]
+    try:
+        entity = model.by_id(step_id)
+    except Exception:
+        return None
+    view = {
+        "id": step_id,
+        "class": entity.is_a(),
+        "label": _inspector_text(entity),
+        "counts": {
+            "attributes": len(entity),
+            "inverse_attributes": sum(1 for name in entity.get_inverse_attribute_names() if getattr(entity, name, None)),
+            "inverse_references": model.get_total_inverses(entity),
+        },
+        "sections": {},
+    }
+    if views is not None:
+        views[step_id] = view
+        while len(views) > INSPECTOR_MAX_VIEWS:
+            views.pop(next(iter(views)))
+    return view
+
+
+def inspector_page(model, view: Dict[str, Any], section: str, page: int = 0,
+                   page_size: int = INSPECTOR_PAGE_SIZE, key: Optional[str] = None) -> Dict[str, Any]:
+    """Una pagina di righe di una sezione della vista ({'rows', 'page', 'pages', 'total'}).
+
+    key: nome di un aggregato della sezione (riga con count) per scorrerne gli elementi.
+    Le righe hanno name, string_value (troncato), int_value (id collegato) e count (aggregato).
+    """
+    items = _inspector_items(view, model, section)
+    if key is not None:
+        value = next((v for n, v in items if n == key), ()) if section != "inverse_references" else ()
+        items = [(f"{key}[{j}]", v) for j, v in enumerate(value if isinstance(value, tuple) else ())]
+    total = len(items)
+    pages = max(1, -(-total // page_size))
+    page = min(max(0, int(page)), pages - 1)
+    chunk = items[page * page_size:(page + 1) * page_size]
+    if section == "inverse_references" and key is None:
+        rows = [_inspector_row(None, model.by_id(i)) for i in chunk]
+    else:
+        rows = [_inspector_row(name, value) for name, value in chunk]
+    return {"rows": rows, "page": page, "pages": pages, "total": total}
+
+
+def inspector_visit(state: Dict[str, Any], model, step_id: Any) -> Optional[Dict[str, Any]]:
+    """Apre un'entità nel pannello di debug: aggiorna active_step_id, breadcrumb ed error dello stato
+    (es. session.BIMDebugProperties) e riusa le viste in state['views']. Ritorna la vista o None."""
+    # Viste valide solo per lo stesso modello e la stessa revisione (changetracker)
+    model_key = f"{id(model)}:r{changetracker.get_revision(model)}"
+    if state.get("model_key") != model_key:
+        state["model_key"] = model_key
+        state["views"] = {}
+        state["step_id_breadcrumb"] = []
+    views = state.setdefault("views", {})
+    crumbs = state.setdefault("step_id_breadcrumb", [])
+    try:
+        view = inspector_view(model, int(step_id), views)
+    except (TypeError, ValueError):
+        view = None
+    if view is None:
+        state["error"] = f"No entity #{step_id} in the model."
+        return None
+    state["error"] = None
+    state["active_step_id"] = view["id"]
+    # Un'entità compare una sola volta nel breadcrumb: rivisitarla la sposta in fondo
+    name = str(view["id"])
+    crumbs[:] = [c for c in crumbs if c["name"] != name]
+    crumbs.append({"name": name})
+    del crumbs[:-INSPECTOR_MAX_VIEWS]
+    return view
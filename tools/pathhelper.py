@@ -258,6 +258,12 @@ def ensure_data_dir() -> Path:
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     return DATA_DIR
 
+def ensure_cache_dir() -> Path:
+    """Cartella della cache di estrazione (static/temp_file/cache)."""
+    d = ensure_data_dir() / "cache"
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
 def public_url(p: str | Path) -> str:
     """Return browser URL for a file inside DATA_DIR."""
     p = Path(p)
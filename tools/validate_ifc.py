@@ -3,27 +3,60 @@ Helper for IFC Validation using buildingSMART official validation checks.
 
 Uso: Integrates official validation checks from buildingSMART/validate repository
 Funzioni:
-- validate_ifc_syntax(ifc_path): Syntax validation
+- validate_ifc_syntax(ifc_path, model): Syntax validation (instant when the model is already parsed)
 - validate_ifc_schema(ifc_path): Schema validation  
 - validate_ifc_rules(ifc_path, rule_types): Gherkin rules validation
-- run_all_validations(ifc_path): Runs all checks
+- validator_version(): identifies the validators (cache key for stored results)
+- iter_validations(ifc_path, rule_types, model): runs the checks concurrently, yields each result as it completes
+- run_all_validations(ifc_path, on_result): Runs all checks (concurrently, with per-check wall time)
+- validate_ifc_schema_model(model): Schema validation in-process on the open model
+- validate_ifc_from_model(model, source_path): Runs all checks without re-reading/serialising the model when possible
 """
 
 from __future__ import annotations
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Callable, Dict, Iterator, List, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 import subprocess
 import json
-import tempfile
-import os
+import importlib.util
+import time
 import ifcopenshell
+import ifcopenshell.validate
 
+from tools import changetracker
 
-def validate_ifc_syntax(ifc_path: str) -> Dict[str, Any]:
+# Checker Gherkin di buildingSMART (ifc-gherkin-rules): senza, non serve alcun file su disco
+GHERKIN_AVAILABLE = importlib.util.find_spec("ifc_validation") is not None
+
+# Aumentare quando cambia il formato/logica dei risultati (invalida i risultati in cache)
+VALIDATOR_VERSION = "2"
+
+# Controlli eseguiti in parallelo (sottoprocessi schema/Gherkin e schema in-process)
+VALIDATION_WORKERS = 3
+
+# Limite di tempo (secondi) della validazione schema in-process, come per il sottoprocesso
+SCHEMA_TIMEOUT = 60
+
+
+def validator_version() -> str:
+    """Versione dei validatori che producono i risultati (logica locale, IfcOpenShell, checker Gherkin)."""
+    return f"{VALIDATOR_VERSION}-ifcopenshell{ifcopenshell.version}-gherkin{int(GHERKIN_AVAILABLE)}"
+
+
+def validate_ifc_syntax(ifc_path: Optional[str], model: Any = None) -> Dict[str, Any]:
     """
     Run Syntax Validation using ifcopenshell.
+    If the model is already parsed (model given) the file is not opened again.
     
     Returns dict with: ok, errors, warnings
     """
+    if model is not None:
+        return {
+            "ok": True,
+            "errors": [],
+            "warnings": [],
+            "message": "Syntax validation passed (model already parsed)"
+        }
     try:
         # Try to open the file - basic syntax check
         model = ifcopenshell.open(ifc_path)
@@ -98,6 +131,7 @@ def validate_ifc_schema(ifc_path: str) -> Dict[str, Any]:
     except FileNotFoundError:
         return {
             "ok": False,
+            "completed": False,
             "errors": ["ifcopenshell.validate module not available"],
             "warnings": [],
             "message": "Schema validation not available"
@@ -105,6 +139,7 @@ def validate_ifc_schema(ifc_path: str) -> Dict[str, Any]:
     except subprocess.TimeoutExpired:
         return {
             "ok": False,
+            "completed": False,
             "errors": ["Schema validation timed out"],
             "warnings": [],
             "message": "Schema validation timed out"
@@ -112,6 +147,7 @@ def validate_ifc_schema(ifc_path: str) -> Dict[str, Any]:
     except Exception as e:
         return {
             "ok": False,
+            "completed": False,
             "errors": [str(e)],
             "warnings": [],
             "message": f"Schema validation error: {e}"
@@ -134,6 +170,8 @@ def validate_ifc_gherkin_rules(ifc_path: str, rule_types: Optional[List[str]] =
     all_results = []
     all_errors = []
     all_warnings = []
+    # False se un rule type non è stato eseguito fino in fondo (checker assente, timeout, errore)
+    completed = True
     
     for rule_type in rule_types:
         try:
@@ -166,13 +204,17 @@ def validate_ifc_gherkin_rules(ifc_path: str, rule_types: Optional[List[str]] =
                 
         except FileNotFoundError:
             all_warnings.append(f"Gherkin rules checker not available for {rule_type}")
+            completed = False
         except subprocess.TimeoutExpired:
             all_errors.append(f"Gherkin rules validation timed out for {rule_type}")
+            completed = False
         except Exception as e:
             all_errors.append(f"Gherkin rules validation error for {rule_type}: {e}")
+            completed = False
     
     return {
         "ok": len(all_errors) == 0,
+        "completed": completed,
         "errors": all_errors,
         "warnings": all_warnings,
         "rule_results": all_results,
@@ -180,73 +222,206 @@ def validate_ifc_gherkin_rules(ifc_path: str, rule_types: Optional[List[str]] =
     }
 
 
-def run_all_validations(ifc_path: str, rule_types: Optional[List[str]] = None) -> Dict[str, Any]:
+def _statement_text(statement: Dict[str, Any]) -> str:
+    # Voce del json_logger di ifcopenshell.validate come testo (l'istanza diventa #id=Classe)
+    instance = statement.get("instance")
+    where = []
+    if instance is not None:
+        try:
+            where.append(f"#{instance.id()}={instance.is_a()}")
+        except Exception:
+            where.append(str(instance))
+    if statement.get("attribute"):
+        where.append(str(statement["attribute"]))
+    prefix = f"{' '.join(where)}: " if where else ""
+    return f"{prefix}{statement.get('message', '')}"
+
+
+def _run_schema_validation(ifc_model: Any, express_rules: bool):
+    logger = ifcopenshell.validate.json_logger()
+    try:
+        ifcopenshell.validate.validate(ifc_model, logger, express_rules=express_rules)
+    except Exception:
+        if not express_rules:
+            raise
+        # Regole EXPRESS non disponibili per lo schema: solo controlli di tipo/attributi
+        logger = ifcopenshell.validate.json_logger()
+        ifcopenshell.validate.validate(ifc_model, logger, express_rules=False)
+    return logger
+
+
+def validate_ifc_schema_model(ifc_model: Any, express_rules: bool = True,
+                              timeout: Optional[float] = None) -> Dict[str, Any]:
     """
-    Run all available validation checks.
+    Run Schema Validation in-process on an already open ifcopenshell model.
     
-    Args:
-        ifc_path: Path to IFC file
-        rule_types: List of Gherkin rule types to check
+    The check is bounded by timeout seconds (default SCHEMA_TIMEOUT): past it the result is
+    reported with completed=False. A thread cannot be interrupted, so the abandoned validation
+    finishes in the background and its result is discarded.
     
-    Returns dict with: overall_ok, syntax, schema, gherkin, summary
+    Returns dict with: ok, completed, errors, warnings
     """
-    results = {
-        "syntax": validate_ifc_syntax(ifc_path),
-        "schema": validate_ifc_schema(ifc_path),
-        "gherkin": validate_ifc_gherkin_rules(ifc_path, rule_types)
+    timeout = SCHEMA_TIMEOUT if timeout is None else timeout
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        logger = pool.submit(_run_schema_validation, ifc_model, express_rules).result(timeout=timeout)
+    except FutureTimeoutError:
+        return {
+            "ok": False,
+            "completed": False,
+            "errors": ["Schema validation timed out"],
+            "warnings": [],
+            "message": "Schema validation timed out"
+        }
+    except Exception as e:
+        return {
+            "ok": False,
+            "completed": False,
+            "errors": [str(e)],
+            "warnings": [],
+            "message": f"Schema validation error: {e}"
+        }
+    finally:
+        pool.shutdown(wait=False)
+    errors = [_statement_text(st) for st in logger.statements if str(st.get("level", "")).lower() in ("error", "critical")]
+    warnings = [_statement_text(st) for st in logger.statements if str(st.get("level", "")).lower() not in ("error", "critical")]
+    return {
+        "ok": len(errors) == 0,
+        "errors": errors,
+        "warnings": warnings,
+        "message": "Schema validation completed (in-process)"
     }
+
+
+def _gherkin_unavailable(rule_type: str) -> Dict[str, Any]:
+    return {
+        "ok": True,
+        "errors": [],
+        "warnings": [f"Gherkin rules checker not available for {rule_type}"],
+        "rule_results": [],
+        "message": "Gherkin rules validation completed for 1 rule types"
+    }
+
+
+def _timed(func: Callable[..., Dict[str, Any]], *args) -> Dict[str, Any]:
+    # Esegue un controllo misurandone il tempo; un'eccezione diventa un risultato fallito
+    t0 = time.perf_counter()
+    try:
+        result = dict(func(*args))
+    except Exception as e:
+        result = {"ok": False, "completed": False, "errors": [str(e)], "warnings": [], "message": f"Validation error: {e}"}
+    result["seconds"] = round(time.perf_counter() - t0, 3)
+    return result
+
+
+def iter_validations(ifc_path: Optional[str], rule_types: Optional[List[str]] = None, model: Any = None,
+                     max_workers: Optional[int] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Run syntax, schema and each Gherkin rule type concurrently (at most max_workers at a time).
     
-    overall_ok = all([
-        results["syntax"]["ok"],
-        results["schema"]["ok"],
-        results["gherkin"]["ok"]
-    ])
-    
-    total_errors = sum([
-        len(results["syntax"]["errors"]),
-        len(results["schema"]["errors"]),
-        len(results["gherkin"]["errors"])
-    ])
-    
-    total_warnings = sum([
-        len(results["syntax"]["warnings"]),
-        len(results["schema"]["warnings"]),
-        len(results["gherkin"]["warnings"])
-    ])
-    
+    Yields (check, result) as each check completes; check is "syntax", "schema" or "gherkin:<RULE_TYPE>"
+    and result carries its wall time in "seconds". With model given, syntax and schema run on the
+    open model; Gherkin rule types need ifc_path (without it they are reported as not available).
+    """
+    rule_types = rule_types or ["CRITICAL"]
+    tasks: Dict[str, Tuple[Callable[..., Dict[str, Any]], tuple]] = {
+        "syntax": (validate_ifc_syntax, (ifc_path, model)),
+        "schema": (validate_ifc_schema_model, (model,)) if model is not None else (validate_ifc_schema, (ifc_path,)),
+    }
+    for rule_type in rule_types:
+        if ifc_path:
+            tasks[f"gherkin:{rule_type}"] = (validate_ifc_gherkin_rules, (ifc_path, [rule_type]))
+        else:
+            tasks[f"gherkin:{rule_type}"] = (_gherkin_unavailable, (rule_type,))
+
+    workers = max(1, int(max_workers or VALIDATION_WORKERS))
+    with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = {pool.submit(_timed, func, *args): name for name, (func, args) in tasks.items()}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def _merge_gherkin(parts: Dict[str, Dict[str, Any]], rule_types: List[str]) -> Dict[str, Any]:
+    # Un risultato Gherkin unico, nell'ordine dei rule type richiesti
+    ordered = [parts[f"gherkin:{rt}"] for rt in rule_types if f"gherkin:{rt}" in parts]
+    errors = [e for p in ordered for e in p.get("errors", [])]
+    return {
+        "ok": len(errors) == 0,
+        "completed": all(p.get("completed", True) for p in ordered),
+        "errors": errors,
+        "warnings": [w for p in ordered for w in p.get("warnings", [])],
+        "rule_results": [r for p in ordered for r in p.get("rule_results", [])],
+        "message": f"Gherkin rules validation completed for {len(rule_types)} rule types",
+        "seconds": max((p.get("seconds", 0.0) for p in ordered), default=0.0)
+    }
+
+
+def _summarise(results: Dict[str, Any]) -> Dict[str, Any]:
+    checks = [results["syntax"], results["schema"], results["gherkin"]]
+    total_errors = sum(len(c["errors"]) for c in checks)
+    total_warnings = sum(len(c["warnings"]) for c in checks)
     results["overall"] = {
-        "ok": overall_ok,
+        "ok": all(c["ok"] for c in checks),
+        # False se un controllo non è terminato (timeout, validatore assente o in errore)
+        "completed": all(c.get("completed", True) for c in checks),
         "total_errors": total_errors,
         "total_warnings": total_warnings,
         "message": f"Validation complete: {total_errors} errors, {total_warnings} warnings"
     }
+    return results
+
+
+def run_all_validations(ifc_path: Optional[str], rule_types: Optional[List[str]] = None, model: Any = None,
+                        max_workers: Optional[int] = None,
+                        on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Run all available validation checks.
     
+    Args:
+        ifc_path: Path to IFC file
+        rule_types: List of Gherkin rule types to check
+        model: already parsed model (syntax/schema run on it, see iter_validations)
+        max_workers: concurrency limit (default VALIDATION_WORKERS)
+        on_result: called as on_result(check, result) when each check completes (partial results)
+    
+    Returns dict with: overall_ok, syntax, schema, gherkin, summary, timings (seconds per check)
+    """
+    rule_types = rule_types or ["CRITICAL"]
+    t0 = time.perf_counter()
+    parts: Dict[str, Dict[str, Any]] = {}
+    for name, result in iter_validations(ifc_path, rule_types, model=model, max_workers=max_workers):
+        parts[name] = result
+        if on_result is not None:
+            on_result(name, result)
+
+    results = {
+        "syntax": parts["syntax"],
+        "schema": parts["schema"],
+        "gherkin": _merge_gherkin(parts, rule_types)
+    }
+    results = _summarise(results)
+    # Ordine di completamento
+    results["timings"] = {name: result["seconds"] for name, result in parts.items()}
+    results["overall"]["seconds"] = round(time.perf_counter() - t0, 3)
     return results
 
 
-def validate_ifc_from_model(ifc_model: Any) -> Dict[str, Any]:
+def validate_ifc_from_model(ifc_model: Any, source_path: Optional[str] = None, rule_types: Optional[List[str]] = None,
+                            in_process: bool = True, max_workers: Optional[int] = None,
+                            on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Any]:
     """
     Validate an IFC file from an ifcopenshell model object.
     
-    Creates a temporary file and runs validations.
+    In-process (default): the model is already parsed (syntax passed) and the schema check runs
+    on it directly. Only the Gherkin checker needs a file: source_path (e.g. session["temp_ifc_path"])
+    is reused while the model is unmodified, otherwise the model is serialised once.
+    With in_process=False all checks run on the file. Checks run concurrently (see run_all_validations).
     """
-    temp_path = None
-    try:
-        # Write model to temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".ifc") as f:
-            temp_path = f.name
-        
-        ifc_model.write(temp_path)
-        
-        # Run validations on temp file
-        results = run_all_validations(temp_path)
-        
-        return results
-    finally:
-        # Clean up temp file
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-            except Exception:
-                pass
-
+    options = dict(rule_types=rule_types, max_workers=max_workers, on_result=on_result)
+    if not in_process:
+        with changetracker.model_on_disk(ifc_model, source_path) as path:
+            return run_all_validations(path, **options)
+    if not GHERKIN_AVAILABLE:
+        return run_all_validations(None, model=ifc_model, **options)
+    with changetracker.model_on_disk(ifc_model, source_path) as path:
+        return run_all_validations(path, model=ifc_model, **options)
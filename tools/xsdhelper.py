@@ -0,0 +1,92 @@
+"""
+Validazione XSD offline degli IDS XML (schema IDS 1.0 ufficiale incluso nel repository)
+
+Uso: tools/p2_ids.py (audit_ids_xml, fallback quando IDS-Audit-tool non è installato)
+Funzioni:
+- get_ids_schema(): schema IDS compilato una volta per processo (solo in memoria)
+- validate_ids_xsd(xml_bytes): (ok, errori) contro lo schema locale, senza accesso alla rete
+- refresh_vendored_schema(url): aggiorna la copia locale dallo URL ufficiale (richiede rete)
+
+tools/schemas/ids_1.0.xsd è la copia invariata dell'XSD ufficiale buildingSMART
+(http://standards.buildingsmart.org/IDS/1.0/ids.xsd, come distribuito con ifctester 0.9.0).
+Import dell'XSD:
+- namespace xml: tools/schemas/xml.xsd, copia invariata di http://www.w3.org/2001/xml.xsd
+- XMLSchema e XMLSchema-instance: meta-schema XSD 1.0 incluso in xmlschema
+Nessuna risorsa remota è necessaria.
+"""
+
+# Commenti in italiano, output per l'utente in inglese
+
+from __future__ import annotations
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+import functools
+import importlib.util
+import io
+
+IDS_XSD_URL = "http://standards.buildingsmart.org/IDS/1.0/ids.xsd"
+SCHEMAS_DIR = Path(__file__).resolve().parent / "schemas"
+VENDORED_IDS_XSD = SCHEMAS_DIR / "ids_1.0.xsd"
+# schemaLocation remoti dell'XSD IDS -> copie locali
+VENDORED_IMPORTS = {
+    "http://www.w3.org/XML/1998/namespace": SCHEMAS_DIR / "xml.xsd",
+}
+MAX_REPORTED_ERRORS = 50
+
+XMLSCHEMA_AVAILABLE = importlib.util.find_spec("xmlschema") is not None
+
+
+def _compile(source: Any) -> Any:
+    import xmlschema
+    # allow='local': nessun download, l'XSD e i suoi import devono essere su disco
+    locations = [(ns, str(path)) for ns, path in VENDORED_IMPORTS.items()]
+    return xmlschema.XMLSchema(source, allow="local", locations=locations)
+
+
+@functools.lru_cache(maxsize=4)
+def get_ids_schema(xsd_path: Optional[str] = None) -> Any:
+    """Schema IDS compilato una volta per processo. Nessuna cache su disco: un pickle nella cartella
+    temporanea servita dall'app potrebbe essere sostituito dall'esterno."""
+    return _compile(str(Path(xsd_path) if xsd_path else VENDORED_IDS_XSD))
+
+
+def validate_ids_xsd(xml_bytes: bytes, xsd_path: Optional[str] = None) -> Tuple[bool, List[str]]:
+    """Valida un IDS XML contro lo schema locale; ritorna (ok, errori) con al più MAX_REPORTED_ERRORS voci."""
+    schema = get_ids_schema(xsd_path)
+    errors = []
+    for error in schema.iter_errors(io.BytesIO(xml_bytes)):
+        errors.append(str(error))
+        if len(errors) >= MAX_REPORTED_ERRORS:
+            break
+    return not errors, errors
+
+
+def refresh_vendored_schema(url: str = IDS_XSD_URL, timeout: float = 30.0) -> Path:
+    """Scarica l'XSD ufficiale sulla copia locale (solo dove la rete è disponibile) e svuota le cache."""
+    from urllib.request import urlopen
+    with urlopen(url, timeout=timeout) as response:
+        data = response.read()
+    # Si sostituisce la copia locale solo con uno schema che compila offline
+    _compile(io.BytesIO(data))
+    VENDORED_IDS_XSD.parent.mkdir(parents=True, exist_ok=True)
+    VENDORED_IDS_XSD.write_bytes(data)
+    get_ids_schema.cache_clear()
+    return VENDORED_IDS_XSD
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Offline IDS XSD validation.")
+    parser.add_argument("ids_file", nargs="?", help="IDS XML file to validate against the local schema")
+    parser.add_argument("--refresh", action="store_true", help=f"Download the official schema from {IDS_XSD_URL}")
+    args = parser.parse_args()
+
+    if args.refresh:
+        print(f"Schema updated: {refresh_vendored_schema()}")
+    if args.ids_file:
+        t0 = time.perf_counter()
+        ok, errors = validate_ids_xsd(Path(args.ids_file).read_bytes())
+        print(f"{'valid' if ok else 'invalid'} ({time.perf_counter() - t0:.3f}s)")
+        for err in errors:
+            print(f" - {err}")